@@ -1,13 +1,18 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import secrets
 import sqlite3
 from urllib.parse import urlsplit
-from typing import Any
+from typing import Any, Iterable
 from flask import (
     Flask,
     Response,
     flash,
+    g,
+    has_app_context,
+    jsonify,
     redirect,
     render_template,
     request,
@@ -23,7 +28,12 @@ from engine.characters import (
     purge_characters as purge_characters_in_db,
     save_character as save_character_to_db,
 )
-from engine.db import connect, ensure_schema
+from engine.db import catalog_schema, catalog_version, connect, ensure_schema
+from engine.derived import DerivedGraph, DerivedState, Node
+from engine.fuzzy import FUZZY_MIN_HITS, TrigramIndex, cached_index
+from engine.pg_model import Character, SpellSlots, clamp_int
+from engine.pg_state import STATE_KEY as PG_STATE_KEY, PGState, fields_digest
+from engine.prefix_index import SUGGEST_LIMIT, cached_prefix_index
 from engine.rules import (
     STATS,
     STAT_LABEL,
@@ -33,6 +43,7 @@ from engine.rules import (
     ALIGNMENTS,
     SKILLS,
 )
+from engine.cache import LRUCache
 from engine.calc import (
     ability_mod,
     proficiency_bonus,
@@ -41,12 +52,26 @@ from engine.calc import (
     saving_throws,
     spellcasting_ability,
 )
+from engine.rules_registry import get_rules_registry
+from engine.search_keys import KEY_COLUMN as SEARCH_KEY_COLUMN, name_key_contains, name_key_filter, search_key
+from engine.sessions import init_app as init_sessions
+from engine.spell_sources import get_source
 from engine.spellbook import (
-    add_spell_to_character,
+    add_known_spell,
+    apply_changes,
     list_character_spells,
     remove_spell_from_character,
 )
-from engine.spells_repo import get_by_id, search_spells
+from engine.spells_repo import (
+    detail_stamp,
+    eligible_spells,
+    get_by_id,
+    search_spells,
+    spell_cursor,
+    spell_facets,
+    suggest_spells,
+    warm_spell_index,
+)
 
 DEFAULT_PG = {
     "nome": "",
@@ -325,18 +350,6 @@ def new_pg() -> dict:
     return json.loads(json.dumps(DEFAULT_PG, ensure_ascii=False))
 
 
-def clamp_int(v: Any, default: int, min_v: int | None = None, max_v: int | None = None) -> int:
-    try:
-        x = int(v)
-    except Exception:
-        x = default
-    if min_v is not None:
-        x = max(min_v, x)
-    if max_v is not None:
-        x = min(max_v, x)
-    return x
-
-
 def fmt_signed(n: Any) -> str:
     try:
         v = int(n)
@@ -521,7 +534,7 @@ def get_lineage_bonus(pg: dict) -> dict:
     return base_bonus
 
 
-def normalize_pg(pg: Any) -> dict:
+def normalize_pg(pg: Any, recalc_slots: bool = True) -> dict:
     """Normalize an arbitrary PG payload to the shape expected by the UI."""
     pg = pg if isinstance(pg, dict) else new_pg()
 
@@ -594,7 +607,8 @@ def normalize_pg(pg: Any) -> dict:
         pg["armor_type"] = "none"
     if not ALLOWED_SHIELD_BY_CLASS.get(pg["classe"], True):
         pg["has_shield"] = False
-    recalc_spell_slots(pg)
+    if recalc_slots:
+        recalc_spell_slots(pg)
     return pg
 
 
@@ -634,19 +648,41 @@ def hp_max_average(level: int, con_mod: int, hit_die: int) -> int:
     return first + max(0, level - 1) * per_level
 
 
-def build_sheet_context(pg: dict, allowed_skills: list[str] | None = None, choose_n: int = 0) -> dict:
-    base_stats = pg.get("stats_base") if isinstance(pg.get("stats_base"), dict) else dict(DEFAULT_PG["stats_base"])
+# Sezioni della scheda e campi del PG che leggono (anche tramite "abilities").
+SHEET_ABILITY_FIELDS = ("stats_base", "lineage", "lineage_extra_stats", "level")
+SHEET_SECTION_FIELDS: dict[str, tuple[str, ...]] = {
+    "abilities": SHEET_ABILITY_FIELDS,
+    "defenses": SHEET_ABILITY_FIELDS
+    + ("classe", "armor_id", "has_shield", "ac_bonus", "hp_max_mode", "hp_max_manual", "hp_current", "hp_temp"),
+    "skills": SHEET_ABILITY_FIELDS + ("skills_proficient",),
+    "spellcasting": SHEET_ABILITY_FIELDS + ("classe",),
+    "attacks": SHEET_ABILITY_FIELDS + ("classe", "attacks"),
+    "options": ("classe",),
+}
+SHEET_SECTIONS = tuple(SHEET_SECTION_FIELDS)
+# (sezione, digest dei campi letti, argomenti extra) -> chiavi della scheda; valori in sola lettura.
+SHEET_SECTION_CACHE = LRUCache("sheet_sections", maxsize=512)
+
+
+def _sheet_abilities(pg: dict) -> dict:
+    raw_stats = pg.get("stats_base") if isinstance(pg.get("stats_base"), dict) else DEFAULT_PG["stats_base"]
+    base_stats = dict(raw_stats)
     lineage_bonus = get_lineage_bonus(pg)
     totals = total_stats(base_stats, lineage_bonus)
-    mods = {s: ability_mod(int(totals.get(s, 10))) for s in STATS}
-    pb = proficiency_bonus(pg.get("level") or 1)
+    return {
+        "base_stats": base_stats,
+        "lineage_bonus": lineage_bonus,
+        "totals": totals,
+        "mods": {s: ability_mod(int(totals.get(s, 10))) for s in STATS},
+        "prof_bonus": proficiency_bonus(pg.get("level") or 1),
+    }
 
-    initiative = mods["des"]
-    dex_mod = mods["des"]
-    class_name = pg.get("classe")
+
+def _armor_class(class_name: Any, armor_id: Any, has_shield: Any, ac_bonus: Any, dex_mod: int) -> dict:
+    """CA con scomposizione; armatura e scudo non consentiti alla classe non contano."""
     allowed_armor = ALLOWED_ARMOR_BY_CLASS.get(class_name, ["none", "light", "medium", "heavy"])
     shield_allowed = ALLOWED_SHIELD_BY_CLASS.get(class_name, True)
-    armor_id = pg.get("armor_id", "none")
+    armor_id = armor_id if armor_id is not None else "none"
     armor = ARMORS.get(armor_id, ARMORS["none"])
     if armor["category"] not in allowed_armor:
         armor = ARMORS["none"]
@@ -666,65 +702,127 @@ def build_sheet_context(pg: dict, allowed_skills: list[str] | None = None, choos
                 dex_bonus = 0
             else:
                 dex_bonus = min(dex_mod, cap)
-    shield_bonus = 2 if pg.get("has_shield") and shield_allowed else 0
-    bonus = int(pg.get("ac_bonus", 0))
-    ac = base + dex_bonus + shield_bonus + bonus
+    shield_bonus = 2 if has_shield and shield_allowed else 0
+    bonus = int(ac_bonus or 0)
+    return {
+        "ac": base + dex_bonus + shield_bonus + bonus,
+        "ac_breakdown": {
+            "base": base,
+            "dex_bonus": dex_bonus,
+            "shield": shield_bonus,
+            "bonus": bonus,
+            "armor_name": armor["name"],
+            "armor_category": armor["category"],
+        },
+        "allowed_armor": allowed_armor,
+        "shield_allowed": shield_allowed,
+    }
 
-    armor_options = []
-    for category in ARMOR_CATEGORY_ORDER:
-        if category not in allowed_armor:
-            continue
-        options = []
-        for item in ARMORS.values():
-            if item["category"] != category:
-                continue
-            options.append(
-                {
-                    "id": item["id"],
-                    "name": item["name"],
-                    "category": item["category"],
-                    "label": _armor_option_label(item),
-                }
-            )
-        armor_options.append(
-            {
-                "category": category,
-                "label": ARMOR_CATEGORY_LABEL.get(category, category.capitalize()),
-                "options": options,
-            }
-        )
 
-    st_prof = set(saving_throws(pg.get("classe")))
-    saves: dict[str, int] = {}
-    saving_rows = []
-    for s in STATS:
-        b = mods[s] + (pb if s in st_prof else 0)
-        saves[s] = b
-        saving_rows.append(
-            {
-                "stat": s,
-                "label": STAT_LABEL[s],
-                "bonus": b,
-                "proficient": s in st_prof,
-            }
-        )
+def _saving_throw_bonuses(class_name: Any, mods: dict[str, int], pb: int) -> dict[str, int]:
+    st_prof = set(saving_throws(class_name))
+    return {s: mods[s] + (pb if s in st_prof else 0) for s in STATS}
 
-    con_mod = mods["cos"]
+
+def _hp_max_info(level: Any, class_name: Any, con_mod: int, hp_mode: Any, hp_max_manual: Any) -> dict:
     class_hit_die = HIT_DIE_BY_CLASS.get(class_name) if isinstance(class_name, str) else None
-    level = int(pg.get("level") or 1)
-    hp_max_auto = hp_max_average(level, con_mod, class_hit_die) if class_hit_die else None
-    hp_mode = str(pg.get("hp_max_mode") or "average")
-    hp_max_manual = pg.get("hp_max_manual")
+    hp_max_auto = hp_max_average(int(level or 1), con_mod, class_hit_die) if class_hit_die else None
+    hp_mode = str(hp_mode or "average")
     if hp_mode == "manual":
         hp_max_effective = int(hp_max_manual) if hp_max_manual is not None else None
     else:
         hp_max_effective = hp_max_auto
+    return {
+        "max_auto": hp_max_auto,
+        "max_effective": hp_max_effective,
+        "mode": hp_mode,
+        "max_manual": hp_max_manual,
+        "hit_die": class_hit_die,
+    }
+
+
+def _sheet_defenses(pg: dict) -> dict:
+    abilities = _sheet_section("abilities", pg)
+    mods = abilities["mods"]
+    pb = abilities["prof_bonus"]
+
+    armor = _armor_class(pg.get("classe"), pg.get("armor_id", "none"), pg.get("has_shield"), pg.get("ac_bonus", 0), mods["des"])
+    saves = _saving_throw_bonuses(pg.get("classe"), mods, pb)
+    st_prof = set(saving_throws(pg.get("classe")))
+    saving_rows = [
+        {"stat": s, "label": STAT_LABEL[s], "bonus": saves[s], "proficient": s in st_prof} for s in STATS
+    ]
 
-    spell_ability = spellcasting_ability(pg.get("classe"))
+    con_mod = mods["cos"]
+    hp = _hp_max_info(pg.get("level"), pg.get("classe"), con_mod, pg.get("hp_max_mode"), pg.get("hp_max_manual"))
+    class_hit_die = hp["hit_die"]
+
+    return {
+        "saves": saves,
+        "saving_rows": saving_rows,
+        "initiative": mods["des"],
+        "ac": armor["ac"],
+        "dex_mod": mods["des"],
+        "ac_breakdown": armor["ac_breakdown"],
+        "hpmax": hp["max_effective"],
+        "hp": {
+            "max_auto": hp["max_auto"],
+            "max_effective": hp["max_effective"],
+            "mode": hp["mode"],
+            "max_manual": hp["max_manual"],
+            "current": pg.get("hp_current", 0),
+            "temp": pg.get("hp_temp", 0),
+            "hit_die": class_hit_die,
+            "con_mod": con_mod,
+            "per_level_avg": ((class_hit_die // 2) + 1) if class_hit_die else None,
+        },
+        "allowed_armor": armor["allowed_armor"],
+        "shield_allowed": armor["shield_allowed"],
+        "hit_die": class_hit_die,
+    }
+
+
+def _skill_bonuses(mods: dict[str, int], pb: int, skills_proficient: Any) -> dict[str, int]:
+    prof_set = set(skills_proficient or [])
+    skills = {sk: mods[SKILLS[sk]] + (pb if sk in prof_set else 0) for sk in sorted(SKILLS.keys())}
+    skills["perception"] = skills.get("Percezione", mods["sag"] + (pb if "Percezione" in prof_set else 0))
+    return skills
+
+
+def _sheet_skills(pg: dict, allowed_skills: tuple[str, ...] = (), choose_n: int = 0) -> dict:
+    abilities = _sheet_section("abilities", pg)
+    mods = abilities["mods"]
+    pb = abilities["prof_bonus"]
+
+    prof_set = set(pg.get("skills_proficient") or [])
+    skills = _skill_bonuses(mods, pb, prof_set)
+    allowed = list(allowed_skills) or sorted(SKILLS.keys())
+    skill_rows = [
+        {
+            "name": sk,
+            "stat": SKILLS[sk],
+            "stat_label": STAT_LABEL[SKILLS[sk]],
+            "bonus": skills[sk],
+            "proficient": sk in prof_set,
+            "selectable": sk in allowed,
+        }
+        for sk in sorted(SKILLS.keys())
+    ]
+    return {
+        "skills": skills,
+        "skill_rows": skill_rows,
+        "passive_perception": 10 + skills["perception"],
+        "choose_n": int(choose_n or 0),
+        "allowed_skills": allowed,
+    }
+
+
+def _spellcasting_info(class_name: Any, mods: dict[str, int], pb: int) -> dict:
+    spell_ability = spellcasting_ability(class_name)
     spell_mod = mods.get(spell_ability) if spell_ability else None
     spell_dc = (8 + pb + spell_mod) if spell_mod is not None else None
     spell_attack = (pb + spell_mod) if spell_mod is not None else None
-    spellcasting = {
+    return {
         "casting_ability": spell_ability,
         "ability": spell_ability,
         "ability_label": STAT_LABEL.get(spell_ability) if spell_ability else None,
@@ -735,99 +833,171 @@ def build_sheet_context(pg: dict, allowed_skills: list[str] | None = None, choos
         "attack_bonus": spell_attack,
     }
 
-    prof_set = set(pg.get("skills_proficient") or [])
-    all_skills = sorted(SKILLS.keys())
-    skills: dict[str, int] = {}
-    skill_rows = []
-    allowed = allowed_skills or sorted(SKILLS.keys())
-    for sk in all_skills:
-        stat = SKILLS[sk]
-        proficient = sk in prof_set
-        bonus_val = mods[stat] + (pb if proficient else 0)
-        skills[sk] = bonus_val
-        skill_rows.append(
-            {
-                "name": sk,
-                "stat": stat,
-                "stat_label": STAT_LABEL[stat],
-                "bonus": bonus_val,
-                "proficient": proficient,
-                "selectable": sk in allowed,
-            }
-        )
 
-    perception_bonus = skills.get("Percezione", mods["sag"] + (pb if "Percezione" in prof_set else 0))
-    skills["perception"] = perception_bonus
-    passive_perception = 10 + skills["perception"]
+def _sheet_spellcasting(pg: dict) -> dict:
+    abilities = _sheet_section("abilities", pg)
+    return {"spellcasting": _spellcasting_info(pg.get("classe"), abilities["mods"], abilities["prof_bonus"])}
 
-    weapon_options = [{"id": "", "label": "—"}, {"id": "custom", "label": "Personalizzata (manuale)"}]
-    proficient_weapons = [w for w in WEAPONS.values() if is_weapon_proficient(str(class_name or ""), str(w["id"]), w)]
-    for weapon in sorted(proficient_weapons, key=lambda x: str(x["name_it"])):
-        weapon_options.append({"id": weapon["id"], "label": _weapon_option_label(weapon)})
 
+def _sheet_attacks(pg: dict) -> dict:
+    abilities = _sheet_section("abilities", pg)
+    class_name = str(pg.get("classe") or "")
     attack_entries = pg.get("attacks") if isinstance(pg.get("attacks"), list) else []
     attack_models = []
     for idx in range(6):
         raw_entry = attack_entries[idx] if idx < len(attack_entries) else {}
         entry = _normalize_attack_entry(raw_entry)
-        attack_vm = _attack_view_model(entry, str(class_name or ""), mods, pb)
+        attack_vm = _attack_view_model(entry, class_name, abilities["mods"], abilities["prof_bonus"])
         attack_vm["slot"] = idx + 1
         attack_models.append(attack_vm)
+    return {"attacks_rows": attack_models}
 
-    return {
-        "base_stats": base_stats,
-        "lineage_bonus": lineage_bonus,
-        "totals": totals,
-        "mods": mods,
-        "prof_bonus": pb,
-        "saves": saves,
-        "skills": skills,
-        "saving_rows": saving_rows,
-        "skill_rows": skill_rows,
-        "passive_perception": passive_perception,
-        "spellcasting": spellcasting,
-        "initiative": initiative,
-        "ac": ac,
-        "dex_mod": dex_mod,
-        "ac_breakdown": {
-            "base": base,
-            "dex_bonus": dex_bonus,
-            "shield": shield_bonus,
-            "bonus": bonus,
-            "armor_name": armor["name"],
-            "armor_category": armor["category"],
-        },
-        "hpmax": hp_max_effective,
-        "hp": {
-            "max_auto": hp_max_auto,
-            "max_effective": hp_max_effective,
-            "mode": hp_mode,
-            "max_manual": hp_max_manual,
-            "current": pg.get("hp_current", 0),
-            "temp": pg.get("hp_temp", 0),
-            "hit_die": class_hit_die,
-            "con_mod": con_mod,
-            "per_level_avg": ((class_hit_die // 2) + 1) if class_hit_die else None,
-        },
-        "weapon_options": weapon_options,
-        "attacks_rows": attack_models,
-        "allowed_armor": allowed_armor,
-        "armor_options": armor_options,
-        "shield_allowed": shield_allowed,
-        "choose_n": int(choose_n or 0),
-        "allowed_skills": allowed,
-        "speed_auto": 9,
-        "hit_die": class_hit_die,
-    }
+
+def _sheet_options(pg: dict) -> dict:
+    class_name = pg.get("classe")
+    allowed_armor = ALLOWED_ARMOR_BY_CLASS.get(class_name, ["none", "light", "medium", "heavy"])
+    armor_options = []
+    for category in ARMOR_CATEGORY_ORDER:
+        if category not in allowed_armor:
+            continue
+        options = []
+        for item in ARMORS.values():
+            if item["category"] != category:
+                continue
+            options.append(
+                {
+                    "id": item["id"],
+                    "name": item["name"],
+                    "category": item["category"],
+                    "label": _armor_option_label(item),
+                }
+            )
+        armor_options.append(
+            {
+                "category": category,
+                "label": ARMOR_CATEGORY_LABEL.get(category, category.capitalize()),
+                "options": options,
+            }
+        )
+
+    weapon_options = [{"id": "", "label": "—"}, {"id": "custom", "label": "Personalizzata (manuale)"}]
+    proficient_weapons = [w for w in WEAPONS.values() if is_weapon_proficient(str(class_name or ""), str(w["id"]), w)]
+    for weapon in sorted(proficient_weapons, key=lambda x: str(x["name_it"])):
+        weapon_options.append({"id": weapon["id"], "label": _weapon_option_label(weapon)})
+
+    return {"armor_options": armor_options, "weapon_options": weapon_options, "speed_auto": 9}
+
+
+_SHEET_BUILDERS = {
+    "abilities": _sheet_abilities,
+    "defenses": _sheet_defenses,
+    "skills": _sheet_skills,
+    "spellcasting": _sheet_spellcasting,
+    "attacks": _sheet_attacks,
+    "options": _sheet_options,
+}
+
+
+def _sheet_section(name: str, pg: dict, *args: Any) -> dict:
+    """Sezione `name` della scheda, ricalcolata solo se cambiano i campi del PG che legge.
+
+    Le sezioni leggono anche catalogo e regole (dadi vita, competenze, slot):
+    la cache si svuota quando cambia uno dei due.
+    """
+    stamp = (catalog_version(), get_rules_registry().version)
+    key = (name, fields_digest(pg, SHEET_SECTION_FIELDS[name]), args)
+    return SHEET_SECTION_CACHE.get_or_load(key, stamp, lambda: _SHEET_BUILDERS[name](pg, *args))
+
+
+def build_sheet_context(
+    pg: dict,
+    allowed_skills: list[str] | None = None,
+    choose_n: int = 0,
+    sections: Iterable[str] | None = None,
+) -> dict:
+    """Contesto della scheda; con `sections` solo le sezioni richieste (vedi SHEET_SECTIONS).
+
+    Le sezioni sono condivise tra le richieste: chi le usa non deve modificarle.
+    """
+    sheet: dict = {}
+    for name in SHEET_SECTIONS if sections is None else sections:
+        if name == "skills":
+            sheet.update(_sheet_section(name, pg, tuple(allowed_skills or ()), int(choose_n or 0)))
+        else:
+            sheet.update(_sheet_section(name, pg))
+    return sheet
+
+
+def _pg_state() -> PGState:
+    """PG della richiesta: normalizzato solo se il payload e' cambiato dall'ultima volta."""
+    state = g.get("pg_state")
+    if state is not None:
+        return state
+    raw = session.get("pg")
+    state = PGState.load(raw, session.get(PG_STATE_KEY))
+    if not state.normalized:
+        state.data = normalize_pg(raw, recalc_slots=False)
+        _sync_spell_slots(state.data, state)
+        meta = state.mark_normalized()
+        if isinstance(raw, dict):
+            session["pg"] = state.data
+            session[PG_STATE_KEY] = meta
+    state.character = Character.from_pg(state.data)
+    g.pg_state = state
+    return state
 
 
 def get_pg() -> dict:
-    pg = session.get("pg")
-    return normalize_pg(pg)
+    return _pg_state().data
+
+
+def _flush_character(state: PGState) -> None:
+    """Riporta nel dict del PG caratteristiche e slot modificati sul modello."""
+    if state.character is not None:
+        state.character.write_to(state.data)
+
+
+def _sync_spell_slots(pg: dict, state: PGState | None = None) -> None:
+    """recalc_spell_slots solo se classi, livelli o slot correnti sono cambiati."""
+    state = state or g.get("pg_state")
+    if state is None or state.data is not pg:
+        recalc_spell_slots(pg)
+        return
+    _flush_character(state)
+    if state.slots_stale():
+        recalc_spell_slots(pg)
+        state.slots_synced()
+        # Slot ricalcolati nel dict: quelli tipizzati vanno riletti.
+        if state.character is not None:
+            state.character.slots = SpellSlots.from_pg(pg)
 
 
 def save_pg(pg: dict) -> None:
+    state = g.get("pg_state")
+    if state is None or state.data is not pg:
+        # PG nuovo (import, reset...): normalizzato alla prossima lettura.
+        session["pg"] = pg
+        session.pop(PG_STATE_KEY, None)
+        g.pop("pg_state", None)
+        return
+    _flush_character(state)
+    if not state.changed() and "pg" in session:
+        return
+    # Normalizzato qui: la versione salvata resta valida e la GET dopo il
+    # redirect non rifa' ne' normalize_pg ne' il ricalcolo degli slot.
+    normalize_pg(pg, recalc_slots=False)
+    _sync_spell_slots(pg, state)
+    # Campi scritti nel dict dal form (nome, classe, livello): modello ricostruito.
+    state.character = Character.from_pg(pg)
     session["pg"] = pg
+    session[PG_STATE_KEY] = state.mark_normalized()
+
+
+def _incoming_pg(data: Any) -> dict:
+    """PG da import o dal DB: normalizzato e validato dal modello tipizzato."""
+    pg = normalize_pg(data)
+    pg.update(Character.from_pg(pg).to_pg())
+    return pg
 
 
 def _safe_filename_from_name(name: str | None) -> str:
@@ -866,18 +1036,7 @@ def _ensure_current_character_id() -> int:
 def _class_code_from_name_it(name_it: str | None) -> str | None:
     if not name_it:
         return None
-    try:
-        with connect() as conn:
-            ensure_schema(conn)
-            row = conn.execute(
-                "SELECT code FROM classes WHERE name_it = ?",
-                ((name_it or "").strip(),),
-            ).fetchone()
-            if row and row[0]:
-                return str(row[0])
-    except Exception:
-        return None
-    return None
+    return get_rules_registry().code_for_name(name_it)
 
 
 def _max_spell_level_for_class_level(class_code: str, level: int) -> int | None:
@@ -934,8 +1093,8 @@ def _parse_bool_flag(raw: str | None) -> bool:
     return (raw or "").strip().lower() in {"1", "true", "on", "yes"}
 
 
-def _table_columns(conn: sqlite3.Connection, table_name: str) -> set[str]:
-    rows = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+def _table_columns(conn: sqlite3.Connection, table_name: str, schema: str = "main") -> set[str]:
+    rows = conn.execute(f"PRAGMA {schema}.table_info({table_name})").fetchall()
     out: set[str] = set()
     for row in rows:
         try:
@@ -961,17 +1120,50 @@ def _row_to_dict(row: Any) -> dict:
 
 
 def _resolve_bestiary_table(conn: sqlite3.Connection) -> tuple[str | None, set[str]]:
+    """Ritorna la tabella mostri qualificata con lo schema (es: "catalog.monsters")."""
+    schema = catalog_schema(conn)
     candidates = ["monsters", "bestiary", "creatures"]
     for table_name in candidates:
         try:
-            cols = _table_columns(conn, table_name)
+            cols = _table_columns(conn, table_name, schema)
         except Exception:
             cols = set()
         if cols:
-            return table_name, cols
+            return f"{schema}.{table_name}", cols
     return None, set()
 
 
+def _monster_name_index(conn: sqlite3.Connection, table_name: str, name_col: str) -> TrigramIndex:
+    """Indice a trigrammi dei nomi del bestiario (id -> nome), ricaricato col catalogo."""
+
+    def load() -> list[tuple[int, str]]:
+        rows = conn.execute(f"SELECT id, {name_col} FROM {table_name}").fetchall()
+        return [(int(r[0]), str(r[1] or "")) for r in rows]
+
+    return cached_index(f"bestiary:{table_name}", catalog_version(), load)
+
+
+def _suggest_monsters(q: str, limit: int = SUGGEST_LIMIT) -> list[dict]:
+    """Completamenti dei nomi del bestiario (indice a prefissi, ricaricato col catalogo).
+
+    Con l'indice in cache non si apre nessuna connessione: tabella e colonne
+    si risolvono solo quando va ricostruito.
+    """
+
+    def load() -> list[tuple[int, str]]:
+        with connect() as conn:
+            ensure_schema(conn)
+            table_name, cols = _resolve_bestiary_table(conn)
+            name_col = "name_it" if "name_it" in cols else ("name" if "name" in cols else None)
+            if not table_name or not name_col:
+                return []
+            rows = conn.execute(f"SELECT id, {name_col} FROM {table_name}").fetchall()
+        return [(int(r[0]), str(r[1] or "")) for r in rows]
+
+    index = cached_prefix_index("bestiary", catalog_version(), load)
+    return [{"id": monster_id, "name": name} for monster_id, name in index.complete(q, limit)]
+
+
 def _parse_cr_sort_value(value: Any) -> float:
     raw = str(value or "").strip().replace(",", ".")
     if not raw:
@@ -1135,6 +1327,9 @@ def _load_quick_monsters(pg: dict) -> list[dict[str, Any]]:
     return out
 
 
+# Frammenti HTML di /spell/<id> gia' renderizzati (invalidati con il catalogo).
+SPELL_DETAIL_HTML_CACHE = LRUCache("spell_detail_html", maxsize=256)
+
 FULL_CASTER_CODES = {"bard", "cleric", "druid", "sorcerer", "wizard"}
 HALF_CASTER_CODES = {"paladin", "ranger"}
 PREPARED_CASTER_ABILITY = {
@@ -1312,8 +1507,8 @@ def _get_slot_current(existing: dict, key: str, slot_max: int) -> int:
     return clamp_int(raw, 0, 0, slot_max)
 
 
-def recalc_spell_slots(character: dict) -> dict:
-    class_levels = _extract_character_class_levels(character)
+def _spell_slots_max_for(class_levels: dict[str, int]) -> dict[str, int]:
+    """Slot massimi (non da patto) per livelli di classe: tabella half caster o multiclasse."""
     non_warlock_classes = [c for c, lv in class_levels.items() if lv > 0 and c != "warlock"]
 
     spell_slots_max = _empty_spell_slots_dict()
@@ -1330,6 +1525,12 @@ def recalc_spell_slots(character: dict) -> dict:
             multiclass_slots = FULL_CASTER_SLOTS_BY_LEVEL.get(caster_level, {})
             for key, value in multiclass_slots.items():
                 spell_slots_max[key] = int(value)
+    return spell_slots_max
+
+
+def recalc_spell_slots(character: dict) -> dict:
+    class_levels = _extract_character_class_levels(character)
+    spell_slots_max = _spell_slots_max_for(class_levels)
 
     existing_current = character.get("spell_slots_current")
     if isinstance(existing_current, dict):
@@ -1355,6 +1556,79 @@ def recalc_spell_slots(character: dict) -> dict:
     return character
 
 
+def _class_levels_node(classe: Any, level: Any, classes: Any, multiclass: Any, spell_classes: Any) -> dict[str, int]:
+    return _extract_character_class_levels(
+        {"classe": classe, "level": level, "classes": classes, "multiclass": multiclass, "spell_classes": spell_classes}
+    )
+
+
+def _pact_slots_node(class_levels: dict[str, int]) -> dict[str, int]:
+    warlock_level = clamp_int(class_levels.get("warlock", 0), 0, 0, 20)
+    return {"level": _warlock_slot_level(warlock_level), "max": _warlock_slot_count(warlock_level)}
+
+
+# Statistiche derivate come grafo reattivo (engine.derived): le foglie sono campi del PG.
+CHARACTER_GRAPH = DerivedGraph(
+    [
+        Node(
+            "lineage_bonus",
+            ("lineage", "lineage_extra_stats"),
+            lambda lineage, extra: get_lineage_bonus({"lineage": lineage, "lineage_extra_stats": extra}),
+            "Bonus stirpe",
+        ),
+        Node(
+            "totals",
+            ("stats_base", "lineage_bonus"),
+            lambda base, bonus: total_stats(base if isinstance(base, dict) else DEFAULT_PG["stats_base"], bonus),
+            "Caratteristiche",
+        ),
+        Node("mods", ("totals",), lambda totals: {s: ability_mod(int(totals.get(s, 10))) for s in STATS}, "Modificatori"),
+        Node("prof_bonus", ("level",), lambda level: proficiency_bonus(level or 1), "Bonus competenza"),
+        Node("saves", ("classe", "mods", "prof_bonus"), _saving_throw_bonuses, "Tiri salvezza"),
+        Node("skills", ("mods", "prof_bonus", "skills_proficient"), _skill_bonuses, "Abilita'"),
+        Node("passive_perception", ("skills",), lambda skills: 10 + skills["perception"], "Percezione passiva"),
+        Node("initiative", ("mods",), lambda mods: mods["des"], "Iniziativa"),
+        Node(
+            "ac",
+            ("classe", "armor_id", "has_shield", "ac_bonus", "mods"),
+            lambda classe, armor_id, shield, bonus, mods: _armor_class(classe, armor_id, shield, bonus, mods["des"])["ac"],
+            "CA",
+        ),
+        Node(
+            "hp_max",
+            ("level", "classe", "mods", "hp_max_mode", "hp_max_manual"),
+            lambda level, classe, mods, mode, manual: _hp_max_info(level, classe, mods["cos"], mode, manual)["max_effective"],
+            "PF massimi",
+        ),
+        Node("spellcasting", ("classe", "mods", "prof_bonus"), _spellcasting_info, "CD e attacco incantesimi"),
+        Node("class_levels", ("classe", "level", "classes", "multiclass", "spell_classes"), _class_levels_node, "Livelli di classe"),
+        Node("spell_slots_max", ("class_levels",), _spell_slots_max_for, "Slot massimi"),
+        Node("pact_slots", ("class_levels",), _pact_slots_node, "Slot del patto"),
+    ]
+)
+# Stato del grafo per sessione: tra una richiesta e l'altra si ricalcola solo cio' che e' cambiato.
+DERIVED_STATES = LRUCache("derived_states", maxsize=128)
+# Id casuale in sessione che identifica lo stato del grafo (anche col backend cookie).
+DERIVED_STATE_KEY = "derived_id"
+
+
+def derived_state() -> DerivedState:
+    """Stato del grafo della sessione corrente.
+
+    Richieste concorrenti della stessa sessione lo condividono: aggiornamento
+    e letture vanno fatti dentro `with state.lock`.
+    """
+    key = session.get(DERIVED_STATE_KEY)
+    if not isinstance(key, str) or not key:
+        key = secrets.token_urlsafe(16)
+        session[DERIVED_STATE_KEY] = key
+    state = DERIVED_STATES.get(key)
+    if state is None:
+        state = DerivedState(CHARACTER_GRAPH)
+        DERIVED_STATES.put(key, state)
+    return state
+
+
 def _safe_next_url(next_url: str | None) -> str:
     raw = (next_url or "").strip()
     if not raw:
@@ -1368,7 +1642,7 @@ def _safe_next_url(next_url: str | None) -> str:
 
 
 def _persist_pg_to_session_and_db(pg: dict) -> int:
-    recalc_spell_slots(pg)
+    _sync_spell_slots(pg)
     save_pg(pg)
     name = (pg.get("nome") or "personaggio").strip() or "personaggio"
     try:
@@ -1377,118 +1651,113 @@ def _persist_pg_to_session_and_db(pg: dict) -> int:
         return 0
 
 
-def _build_spell_slots_view_model(pg: dict) -> dict:
-    spell_slots_max = pg.get("spell_slots_max") if isinstance(pg.get("spell_slots_max"), dict) else {}
-    spell_slots_current = pg.get("spell_slots_current") if isinstance(pg.get("spell_slots_current"), dict) else {}
-    spell_slot_rows = []
-    for lv in range(1, 10):
-        key = str(lv)
-        max_v = clamp_int(spell_slots_max.get(key, 0), 0, 0, 99)
-        if max_v <= 0:
-            continue
-        cur_v = clamp_int(spell_slots_current.get(key, max_v), max_v, 0, max_v)
-        spell_slot_rows.append({"level": lv, "current": cur_v, "max": max_v})
+def _request_character(pg: dict) -> Character | None:
+    """Modello tipizzato se `pg` e' il PG della richiesta (get_pg), altrimenti None."""
+    state = g.get("pg_state") if has_app_context() else None
+    if state is None or state.data is not pg:
+        return None
+    return state.character
+
+
+def _character(pg: dict) -> Character:
+    """Modello del PG: per quello della richiesta e' gia' costruito, per altri dict al volo."""
+    return _request_character(pg) or Character.from_pg(pg)
+
+
+def _spell_slots(pg: dict | SpellSlots) -> SpellSlots:
+    """Slot tipizzati del PG.
 
-    pact_slots_max = clamp_int(pg.get("pact_slots_max"), 0, 0, 99)
-    pact_slots_current = clamp_int(pg.get("pact_slots_current"), pact_slots_max, 0, pact_slots_max)
-    pact_slot_level = clamp_int(pg.get("pact_slot_level"), 0, 0, 9)
-    has_spell_slots_widget = bool(spell_slot_rows or pact_slots_max > 0)
+    Per il PG della richiesta sono quelli del suo modello: gli handler li
+    modificano e save_pg li riscrive nel dict. Per altri dict vengono letti al
+    volo.
+    """
+    if isinstance(pg, SpellSlots):
+        return pg
+    character = _request_character(pg)
+    return character.slots if character is not None else SpellSlots.from_pg(pg)
+
+
+def _store_spell_slots(pg: dict, slots: SpellSlots) -> None:
+    """Slot modificati: nei dict estranei subito, per il PG della richiesta ci pensa save_pg."""
+    character = _request_character(pg)
+    if character is None or character.slots is not slots:
+        slots.write_to(pg)
+
+
+def _build_spell_slots_view_model(pg: dict | SpellSlots) -> dict:
+    slots = _spell_slots(pg)
+    spell_slot_rows = slots.rows()
+    has_spell_slots_widget = bool(spell_slot_rows or slots.pact_max > 0)
     current_char_id = _current_session_character_id() or 0
     current_path = request.full_path[:-1] if request.full_path.endswith("?") else request.full_path
 
     return {
         "spell_slot_rows": spell_slot_rows,
-        "pact_slots_max": pact_slots_max,
-        "pact_slots_current": pact_slots_current,
-        "pact_slot_level": pact_slot_level,
+        "pact_slots_max": slots.pact_max,
+        "pact_slots_current": slots.pact_current,
+        "pact_slot_level": slots.pact_level,
         "has_spell_slots_widget": has_spell_slots_widget,
         "current_char_id": current_char_id,
         "current_path": current_path,
     }
 
 
+def _use_spell_slot(slots: SpellSlots, required_level: int) -> tuple[bool, str]:
+    for lv in range(required_level, 10):
+        if slots.use_standard(lv):
+            return True, f"slot livello {lv} consumato"
+    if slots.pact_max > 0 and slots.pact_level >= required_level and slots.use_pact():
+        return True, f"slot patto livello {slots.pact_level} consumato"
+    return False, "nessuno slot disponibile"
+
+
 def _consume_spell_slot(pg: dict, spell_level: int) -> tuple[bool, str]:
     required_level = clamp_int(spell_level, 0, 0, 9)
     if required_level <= 0:
         return True, "trucchetto (nessuno slot consumato)"
 
-    max_map = pg.get("spell_slots_max") if isinstance(pg.get("spell_slots_max"), dict) else {}
-    cur_map = pg.get("spell_slots_current") if isinstance(pg.get("spell_slots_current"), dict) else {}
-    for lv in range(required_level, 10):
-        key = str(lv)
-        max_v = clamp_int(max_map.get(key, 0), 0, 0, 99)
-        if max_v <= 0:
-            continue
-        current = clamp_int(cur_map.get(key, max_v), max_v, 0, max_v)
-        if current > 0:
-            cur_map[key] = current - 1
-            pg["spell_slots_current"] = cur_map
-            return True, f"slot livello {lv} consumato"
-
-    pact_max = clamp_int(pg.get("pact_slots_max"), 0, 0, 99)
-    pact_current = clamp_int(pg.get("pact_slots_current"), pact_max, 0, pact_max)
-    pact_slot_level = clamp_int(pg.get("pact_slot_level"), 0, 0, 9)
-    if pact_max > 0 and pact_current > 0 and pact_slot_level >= required_level:
-        pg["pact_slots_current"] = pact_current - 1
-        return True, f"slot patto livello {pact_slot_level} consumato"
-
-    return False, "nessuno slot disponibile"
+    slots = _spell_slots(pg)
+    ok, detail = _use_spell_slot(slots, required_level)
+    if ok:
+        _store_spell_slots(pg, slots)
+    return ok, detail
 
 
-def _available_cast_options_for_spell(pg: dict, spell_level: int) -> list[dict[str, str]]:
+def _available_cast_options_for_spell(pg: dict | SpellSlots, spell_level: int) -> list[dict[str, str]]:
     level = clamp_int(spell_level, 0, 0, 9)
     if level <= 0:
         return [{"value": "cantrip", "label": "Trucchetto", "source": "cantrip"}]
 
-    options: list[dict[str, str]] = []
-    max_map = pg.get("spell_slots_max") if isinstance(pg.get("spell_slots_max"), dict) else {}
-    cur_map = pg.get("spell_slots_current") if isinstance(pg.get("spell_slots_current"), dict) else {}
-    for lv in range(level, 10):
-        key = str(lv)
-        max_v = clamp_int(max_map.get(key, 0), 0, 0, 99)
-        if max_v <= 0:
-            continue
-        current = clamp_int(cur_map.get(key, max_v), max_v, 0, max_v)
-        if current > 0:
-            options.append({"value": f"standard:{lv}", "label": f"{lv}°", "source": "standard"})
-
-    pact_max = clamp_int(pg.get("pact_slots_max"), 0, 0, 99)
-    pact_current = clamp_int(pg.get("pact_slots_current"), pact_max, 0, pact_max)
-    pact_slot_level = clamp_int(pg.get("pact_slot_level"), 0, 0, 9)
-    if pact_max > 0 and pact_current > 0 and pact_slot_level >= level:
-        options.append({"value": f"pact:{pact_slot_level}", "label": f"Patto {pact_slot_level}°", "source": "pact"})
+    slots = _spell_slots(pg)
+    options: list[dict[str, str]] = [
+        {"value": f"standard:{lv}", "label": f"{lv}°", "source": "standard"}
+        for lv in range(level, 10)
+        if slots.current[lv - 1] > 0
+    ]
+    if slots.pact_max > 0 and slots.pact_current > 0 and slots.pact_level >= level:
+        options.append({"value": f"pact:{slots.pact_level}", "label": f"Patto {slots.pact_level}°", "source": "pact"})
 
     return options
 
 
-def _available_cast_levels_for_spell(pg: dict, spell_level: int) -> list[dict[str, int | str]]:
+def _available_cast_levels_for_spell(pg: dict | SpellSlots, spell_level: int) -> list[dict[str, int | str]]:
     level = clamp_int(spell_level, 0, 0, 9)
     if level <= 0:
         return [{"level": 0, "remaining": 999, "value": "cantrip", "label": "Cantrip", "rest": "none"}]
 
-    levels: list[dict[str, int | str]] = []
-    max_map = pg.get("spell_slots_max") if isinstance(pg.get("spell_slots_max"), dict) else {}
-    cur_map = pg.get("spell_slots_current") if isinstance(pg.get("spell_slots_current"), dict) else {}
-    pact_max = clamp_int(pg.get("pact_slots_max"), 0, 0, 99)
-    pact_current = clamp_int(pg.get("pact_slots_current"), pact_max, 0, pact_max)
-    pact_slot_level = clamp_int(pg.get("pact_slot_level"), 0, 0, 9)
-
-    for lv in range(level, 10):
-        key = str(lv)
-        max_v = clamp_int(max_map.get(key, 0), 0, 0, 99)
-        if max_v > 0:
-            current = clamp_int(cur_map.get(key, max_v), max_v, 0, max_v)
-            levels.append(
-                {"level": lv, "remaining": current, "value": f"standard:{lv}", "label": str(lv), "rest": "long"}
-            )
-
-    if pact_slot_level >= level and pact_max > 0:
+    slots = _spell_slots(pg)
+    levels: list[dict[str, int | str]] = [
+        {"level": lv, "remaining": int(slots.current[lv - 1]), "value": f"standard:{lv}", "label": str(lv), "rest": "long"}
+        for lv in range(level, 10)
+        if slots.max[lv - 1] > 0
+    ]
+    if slots.pact_level >= level and slots.pact_max > 0:
         levels.append(
             {
-                "level": pact_slot_level,
-                "remaining": pact_current,
-                "value": f"pact:{pact_slot_level}",
-                "label": f"P{pact_slot_level}",
+                "level": slots.pact_level,
+                "remaining": slots.pact_current,
+                "value": f"pact:{slots.pact_level}",
+                "label": f"P{slots.pact_level}",
                 "rest": "short",
             }
         )
@@ -1505,36 +1774,28 @@ def _consume_spell_slot_by_choice(pg: dict, spell_level: int, cast_choice: str |
     if not raw:
         return _consume_spell_slot(pg, level)
 
+    slots = _spell_slots(pg)
     if raw.startswith("standard:"):
         chosen = clamp_int(raw.split(":", 1)[1], 0, 1, 9)
         if chosen < level:
             return False, "livello di lancio non valido"
-        max_map = pg.get("spell_slots_max") if isinstance(pg.get("spell_slots_max"), dict) else {}
-        cur_map = pg.get("spell_slots_current") if isinstance(pg.get("spell_slots_current"), dict) else {}
-        key = str(chosen)
-        max_v = clamp_int(max_map.get(key, 0), 0, 0, 99)
-        if max_v <= 0:
+        if slots.max[chosen - 1] <= 0:
             return False, "slot standard non disponibile"
-        current = clamp_int(cur_map.get(key, max_v), max_v, 0, max_v)
-        if current <= 0:
+        if not slots.use_standard(chosen):
             return False, "slot standard esaurito"
-        cur_map[key] = current - 1
-        pg["spell_slots_current"] = cur_map
+        _store_spell_slots(pg, slots)
         return True, f"slot livello {chosen} consumato"
 
     if raw.startswith("pact:"):
         chosen = clamp_int(raw.split(":", 1)[1], 0, 1, 9)
-        pact_max = clamp_int(pg.get("pact_slots_max"), 0, 0, 99)
-        pact_current = clamp_int(pg.get("pact_slots_current"), pact_max, 0, pact_max)
-        pact_slot_level = clamp_int(pg.get("pact_slot_level"), 0, 0, 9)
-        if chosen and pact_slot_level != chosen:
+        if chosen and slots.pact_level != chosen:
             return False, "slot patto non disponibile a quel livello"
-        if pact_slot_level < level:
+        if slots.pact_level < level:
             return False, "slot patto insufficiente"
-        if pact_current <= 0:
+        if not slots.use_pact():
             return False, "slot patto esaurito"
-        pg["pact_slots_current"] = pact_current - 1
-        return True, f"slot patto livello {pact_slot_level} consumato"
+        _store_spell_slots(pg, slots)
+        return True, f"slot patto livello {slots.pact_level} consumato"
 
     return _consume_spell_slot(pg, level)
 
@@ -1613,22 +1874,11 @@ def _class_level_spell_limits(class_code: str, class_level: int) -> dict[str, in
     code = (class_code or "").strip().lower()
     lv = clamp_int(class_level, 1, 1, 20)
     out: dict[str, int | None] = {"max_spell_level": _max_spell_level_for_class_level(code, lv), "cantrips_known": None, "spells_known": None}
-    try:
-        with connect() as conn:
-            ensure_schema(conn)
-            row = conn.execute(
-                """
-                SELECT cantrips_known, spells_known
-                FROM class_levels
-                WHERE class_code = ? AND level = ?
-                """,
-                (code, lv),
-            ).fetchone()
-            if row:
-                out["cantrips_known"] = int(row["cantrips_known"]) if row["cantrips_known"] is not None else None
-                out["spells_known"] = int(row["spells_known"]) if row["spells_known"] is not None else None
-    except Exception:
-        pass
+    rules = get_rules_registry().by_code.get(code)
+    row = rules.level(lv) if rules else None
+    if row:
+        out["cantrips_known"] = row.cantrips_known
+        out["spells_known"] = row.spells_known
     return out
 
 
@@ -1689,8 +1939,7 @@ def _can_add_spell_for_pg(pg: dict, owned: list[dict], spell: dict) -> tuple[boo
             else:
                 prepared_ability = PREPARED_CASTER_ABILITY.get(code)
                 if prepared_ability:
-                    base_stats = pg.get("stats_base") if isinstance(pg.get("stats_base"), dict) else {}
-                    totals = total_stats(base_stats, get_lineage_bonus(pg))
+                    totals = total_stats(_character(pg).stats_base(), get_lineage_bonus(pg))
                     prepared_limit = max(1, lv + ability_mod(clamp_int(totals.get(prepared_ability), 10, 1, 30)))
                     owned_spells = sum(1 for sp in owned_for_code if int(sp.get("level") or 0) > 0)
                     if owned_spells >= prepared_limit:
@@ -1705,16 +1954,21 @@ def _can_add_spell_for_pg(pg: dict, owned: list[dict], spell: dict) -> tuple[boo
 def create_app() -> Flask:
     app = Flask(__name__)
     app.secret_key = "dev-secret-key-change-me"
+    # PG in sessione lato server (tabella `sessions`): nel cookie solo il sid.
+    init_sessions(app)
 
     # Garantisce che lo schema esista all'avvio.
     with connect() as conn:
         ensure_schema(conn)
+    # Indice incantesimi in memoria (filtri senza SQL), se abilitato.
+    warm_spell_index()
 
     app.jinja_env.filters["fmt_signed"] = fmt_signed
 
     @app.route("/", methods=["GET", "POST"])
     def index():
         pg = get_pg()
+        character = _character(pg)
 
         def _render_index(
             pg_view: dict,
@@ -1814,7 +2068,7 @@ def create_app() -> Flask:
                     return redirect(url_for("index"))
 
                 for s in STATS:
-                    pg["stats_base"][s] = parsed_stats[s]
+                    character.set_stat(s, parsed_stats[s])
             elif pg["stats_method"] == "point_buy":
                 raw_point_buy = {s: request.form.get(f"pb_stat_{s}") for s in STATS}
                 # Transitional submit after method toggle: persist only the method, then render selects.
@@ -1857,10 +2111,10 @@ def create_app() -> Flask:
                     return _render_index(preview_pg, pb_assignment_override=parsed_stats, persist_skill_cleanup=False)
 
                 for s in STATS:
-                    pg["stats_base"][s] = parsed_stats[s]
+                    character.set_stat(s, parsed_stats[s])
             else:
                 for s in STATS:
-                    pg["stats_base"][s] = clamp_int(request.form.get(f"stat_{s}"), pg["stats_base"][s], 1, 30)
+                    character.set_stat(s, request.form.get(f"stat_{s}"))
 
             pg["hp_current"] = clamp_int(request.form.get("hp_current"), pg.get("hp_current", 0), 0, 999)
             pg["hp_temp"] = clamp_int(request.form.get("hp_temp"), pg.get("hp_temp", 0), 0, 999)
@@ -1915,7 +2169,6 @@ def create_app() -> Flask:
                 skills_filtered = skills_filtered[:choose_n]
             pg["skills_proficient"] = skills_filtered
 
-            recalc_spell_slots(pg)
             save_pg(pg)
             return redirect(url_for("index"))
         return _render_index(pg)
@@ -1924,7 +2177,7 @@ def create_app() -> Flask:
     def save_character():
         pg = get_pg()
         name = (pg.get("nome") or "personaggio").strip() or "personaggio"
-        recalc_spell_slots(pg)
+        _sync_spell_slots(pg)
         try:
             char_id = save_character_to_db(name, pg)
             flash(f"Salvato: {name} (#{char_id})", "success")
@@ -1946,22 +2199,11 @@ def create_app() -> Flask:
         if delta not in (-1, 1):
             return redirect(_safe_next_url(request.form.get("next")))
 
+        slots = _spell_slots(pg)
         if slot_type == "standard":
-            slot_level = clamp_int(request.form.get("slot_level"), 0, 1, 9)
-            if slot_level > 0:
-                key = str(slot_level)
-                max_map = pg.get("spell_slots_max") if isinstance(pg.get("spell_slots_max"), dict) else {}
-                cur_map = pg.get("spell_slots_current") if isinstance(pg.get("spell_slots_current"), dict) else {}
-                max_v = clamp_int(max_map.get(key, 0), 0, 0, 99)
-                if max_v > 0:
-                    current = clamp_int(cur_map.get(key, max_v), max_v, 0, max_v)
-                    cur_map[key] = clamp_int(current + delta, current, 0, max_v)
-                    pg["spell_slots_current"] = cur_map
-
+            slots.adjust(clamp_int(request.form.get("slot_level"), 0, 1, 9), delta)
         if slot_type == "pact":
-            max_v = clamp_int(pg.get("pact_slots_max"), 0, 0, 99)
-            current = clamp_int(pg.get("pact_slots_current"), max_v, 0, max_v)
-            pg["pact_slots_current"] = clamp_int(current + delta, current, 0, max_v)
+            slots.adjust_pact(delta)
 
         _persist_pg_to_session_and_db(pg)
         if request.headers.get("X-Requested-With") == "XMLHttpRequest":
@@ -1978,17 +2220,12 @@ def create_app() -> Flask:
             return redirect(_safe_next_url(request.form.get("next")))
 
         rest_type = (request.form.get("rest_type") or "").strip().lower()
-        if rest_type == "long":
-            max_map = pg.get("spell_slots_max") if isinstance(pg.get("spell_slots_max"), dict) else {}
-            pg["spell_slots_current"] = {
-                str(i): clamp_int(max_map.get(str(i), 0), 0, 0, 99) for i in range(1, 10)
-            }
-            pact_max = clamp_int(pg.get("pact_slots_max"), 0, 0, 99)
-            pg["pact_slots_current"] = pact_max
-            _persist_pg_to_session_and_db(pg)
-        elif rest_type == "short":
-            pact_max = clamp_int(pg.get("pact_slots_max"), 0, 0, 99)
-            pg["pact_slots_current"] = pact_max
+        if rest_type in ("long", "short"):
+            slots = _spell_slots(pg)
+            if rest_type == "long":
+                slots.long_rest()
+            else:
+                slots.short_rest()
             _persist_pg_to_session_and_db(pg)
 
         if request.headers.get("X-Requested-With") == "XMLHttpRequest":
@@ -2014,7 +2251,7 @@ def create_app() -> Flask:
         if not data:
             flash("Personaggio non trovato.", "warning")
             return redirect(url_for("index"))
-        pg = normalize_pg(data)
+        pg = _incoming_pg(data)
         save_pg(pg)
         flash(f"Caricato: {pg.get('nome') or 'personaggio'}", "success")
         return redirect(url_for("index"))
@@ -2060,7 +2297,7 @@ def create_app() -> Flask:
             raw = file.read()
             text = raw.decode("utf-8-sig", errors="strict")
             data = json.loads(text)
-            pg = normalize_pg(data)
+            pg = _incoming_pg(data)
             save_pg(pg)
             flash(f"Import completato: {pg.get('nome') or 'personaggio'}", "success")
         except Exception:
@@ -2084,9 +2321,12 @@ def create_app() -> Flask:
         concentration_only = (request.args.get("concentration_only") or "") == "1"
         include_private = (request.args.get("include_private") or "") == "1"
         pg_limits = _parse_bool_flag(request.args.get("pg_limits") or request.args.get("pg_mode"))
+        sort = (request.args.get("sort") or "").strip().lower()
         page_raw = (request.args.get("page") or "1").strip()
         if class_code not in class_options:
             class_code = ""
+        if sort not in ("level", "relevance"):
+            sort = "relevance" if q else "level"
         level = None
         if level_raw.isdigit():
             level = int(level_raw)
@@ -2096,10 +2336,14 @@ def create_app() -> Flask:
         effective_class_codes = None
         pg_filter_max_spell_level = None
         pg_filter_class_label = None
+        pg_eligible_count = None
         if pg_limits and character_id:
             allowed_class_codes, pg_filter_max_spell_level, pg_labels = _compute_pg_spell_limits(pg)
             if allowed_class_codes:
                 effective_class_codes = sorted(allowed_class_codes)
+                pg_eligible_count = len(
+                    eligible_spells(effective_class_codes, pg_filter_max_spell_level, include_private)
+                )
             else:
                 # PG presente ma classi non risolvibili: non mostrare risultati fuori limite.
                 effective_class_code = "__no_class__"
@@ -2110,8 +2354,15 @@ def create_app() -> Flask:
         page_size = 30
         has_prev = page > 1
         has_next = False
+        # Paginazione keyset (ordine per livello): `after`/`before` sono cursori
+        # opachi; `page` resta per il numero mostrato e come fallback OFFSET.
+        use_cursors = sort == "level"
+        after = (request.args.get("after") or "").strip() if use_cursors else ""
+        before = "" if after or not use_cursors else (request.args.get("before") or "").strip()
+        page_cursor = after
+        next_cursor = prev_cursor = ""
         if has_filters:
-            raw_results = search_spells(
+            search_kwargs = dict(
                 q=q,
                 level=level,
                 class_code=effective_class_code,
@@ -2122,23 +2373,55 @@ def create_app() -> Flask:
                 include_private=include_private,
                 limit=page_size + 1,
                 offset=(page - 1) * page_size,
+                sort=sort,
             )
-            has_next = len(raw_results) > page_size
-            results = raw_results[:page_size]
+            try:
+                raw_results = search_spells(**search_kwargs, after=after or None, before=before or None)
+            except ValueError:
+                after = before = page_cursor = ""
+                raw_results = search_spells(**search_kwargs)
+            if before:
+                # La riga in piu' e' quella che precede la pagina: il suo cursore
+                # riproduce questa pagina con `after`.
+                has_prev = len(raw_results) > page_size
+                results = raw_results[-page_size:]
+                has_next = True
+                page_cursor = spell_cursor(raw_results[0]) if has_prev else ""
+                if not has_prev:
+                    page = 1
+            else:
+                has_next = len(raw_results) > page_size
+                results = raw_results[:page_size]
+            if use_cursors and results:
+                next_cursor = spell_cursor(results[-1]) if has_next else ""
+                prev_cursor = spell_cursor(results[0]) if has_prev else ""
         else:
             results = []
+        # Conteggi accanto ai filtri: bitset in memoria o una query aggregata, in cache.
+        facets = spell_facets(
+            q=q,
+            level=level,
+            class_code=effective_class_code,
+            class_codes=effective_class_codes,
+            max_level=pg_filter_max_spell_level,
+            ritual_only=ritual_only,
+            concentration_only=concentration_only,
+            include_private=include_private,
+        )
         owned = list_character_spells(character_id) if character_id else []
+        # Slot letti e validati una volta per tutta la richiesta.
+        slots = _spell_slots(pg)
         for sp in results:
-            options = _available_cast_options_for_spell(pg, int(sp.get("level") or 0))
+            options = _available_cast_options_for_spell(slots, int(sp.get("level") or 0))
             sp["cast_options"] = options
             sp["can_cast"] = bool(options)
         for sp in owned:
-            levels = _available_cast_levels_for_spell(pg, int(sp.get("level") or 0))
+            levels = _available_cast_levels_for_spell(slots, int(sp.get("level") or 0))
             sp["cast_levels"] = levels
             sp["can_cast"] = bool(levels)
         characters = list_characters()
-        slots_vm = _build_spell_slots_view_model(pg)
-        sheet = build_sheet_context(pg)
+        slots_vm = _build_spell_slots_view_model(slots)
+        sheet = build_sheet_context(pg, sections=("spellcasting",))
 
         return render_template(
             "spells.html",
@@ -2152,12 +2435,19 @@ def create_app() -> Flask:
             concentration_only=concentration_only,
             include_private=include_private,
             pg_limits=pg_limits,
+            sort=sort,
             pg_filter_class_label=pg_filter_class_label,
             pg_filter_max_spell_level=pg_filter_max_spell_level,
+            pg_eligible_count=pg_eligible_count,
             page=page,
+            page_cursor=page_cursor,
+            next_cursor=next_cursor,
+            prev_cursor=prev_cursor,
             has_prev=has_prev,
             has_next=has_next,
+            has_filters=has_filters,
             results=results,
+            facets=facets,
             owned=owned,
             characters=characters,
             **slots_vm,
@@ -2184,21 +2474,19 @@ def create_app() -> Flask:
                         concentration_only=request.form.get("concentration_only") or "",
                         include_private=request.form.get("include_private") or "",
                         pg_limits=request.form.get("pg_limits") or request.form.get("pg_mode") or "",
+                        sort=request.form.get("sort") or "",
+                        after=request.form.get("after") or "",
                         page=request.form.get("page") or "1",
                     )
                 )
-            spell = get_by_id(spell_id, origin="srd")
-            owned = list_character_spells(character_id)
-            if any(int(sp.get("id") or 0) == spell_id for sp in owned):
-                flash("Incantesimo gia' presente nel personaggio.", "warning")
-            elif not spell:
-                flash("Incantesimo non trovato.", "warning")
-            else:
-                allowed, reason = _can_add_spell_for_pg(pg, owned, spell)
-                if allowed:
-                    add_spell_to_character(character_id, spell_id)
-                else:
-                    flash(f"Aggiunta bloccata: {reason}", "warning")
+            # Controllo limiti e INSERT in un'unica transazione (engine.spellbook).
+            result = add_known_spell(
+                character_id,
+                spell_id,
+                check=lambda owned, spell: _can_add_spell_for_pg(pg, owned, spell),
+            )
+            if not result.added:
+                flash(result.message, "warning")
         return redirect(
             url_for(
                 "spells",
@@ -2209,6 +2497,8 @@ def create_app() -> Flask:
                 concentration_only=request.form.get("concentration_only") or "",
                 include_private=request.form.get("include_private") or "",
                 pg_limits=request.form.get("pg_limits") or request.form.get("pg_mode") or "",
+                sort=request.form.get("sort") or "",
+                after=request.form.get("after") or "",
                 page=request.form.get("page") or "1",
             )
         )
@@ -2229,6 +2519,48 @@ def create_app() -> Flask:
                 concentration_only=request.form.get("concentration_only") or "",
                 include_private=request.form.get("include_private") or "",
                 pg_limits=request.form.get("pg_limits") or request.form.get("pg_mode") or "",
+                sort=request.form.get("sort") or "",
+                after=request.form.get("after") or "",
+                page=request.form.get("page") or "1",
+            )
+        )
+
+    @app.post("/spells/bulk")
+    def spells_bulk():
+        # Selezione multipla: aggiunte e rimozioni validate e scritte in un'unica transazione.
+        pg = get_pg()
+        character_id = _ensure_current_character_id()
+        add_ids = request.form.getlist("spell_ids")
+        remove_ids = request.form.getlist("remove_ids")
+        if character_id and (add_ids or remove_ids):
+            changes = apply_changes(
+                character_id,
+                add=add_ids,
+                remove=remove_ids,
+                check=lambda owned, spell: _can_add_spell_for_pg(pg, owned, spell),
+            )
+            if changes.added or changes.removed:
+                parts = []
+                if changes.added:
+                    parts.append(f"{len(changes.added)} aggiunti")
+                if changes.removed:
+                    parts.append(f"{len(changes.removed)} rimossi")
+                flash(f"Incantesimi aggiornati: {', '.join(parts)}.", "success")
+            for result in changes.rejected:
+                name = (result.spell or {}).get("name") or f"#{result.spell_id}"
+                flash(f"{name}: {result.message}", "warning")
+        return redirect(
+            url_for(
+                "spells",
+                q=request.form.get("q") or "",
+                level=request.form.get("level") or "",
+                class_code=request.form.get("class_code") or "",
+                ritual_only=request.form.get("ritual_only") or "",
+                concentration_only=request.form.get("concentration_only") or "",
+                include_private=request.form.get("include_private") or "",
+                pg_limits=request.form.get("pg_limits") or request.form.get("pg_mode") or "",
+                sort=request.form.get("sort") or "",
+                after=request.form.get("after") or "",
                 page=request.form.get("page") or "1",
             )
         )
@@ -2255,6 +2587,8 @@ def create_app() -> Flask:
                 concentration_only=request.form.get("concentration_only") or "",
                 include_private=request.form.get("include_private") or "",
                 pg_limits=request.form.get("pg_limits") or request.form.get("pg_mode") or "",
+                sort=request.form.get("sort") or "",
+                after=request.form.get("after") or "",
                 page=request.form.get("page") or "1",
             )
         )
@@ -2322,29 +2656,61 @@ def create_app() -> Flask:
 
             where_parts: list[str] = []
             params: list[Any] = []
-            if q:
-                where_parts.append(f"{name_col} LIKE ?")
-                params.append(f"%{q}%")
             if cr and cr_col:
                 where_parts.append(f"{cr_col} = ?")
                 params.append(cr)
 
-            where_sql = f" WHERE {' AND '.join(where_parts)}" if where_parts else ""
-
+            # Nome: "contiene" sulla chiave normalizzata (accenti/maiuscole
+            # ignorati), con i nomi che iniziano per `q` in testa.
+            name_sql, name_params = "", []
+            order_sql, order_params = f"{name_col} ASC", []
+            if q and SEARCH_KEY_COLUMN in cols:
+                prefix_sql, prefix_params = name_key_filter(SEARCH_KEY_COLUMN, q)
+                contains_sql, contains_params = name_key_contains(SEARCH_KEY_COLUMN, q)
+                if prefix_sql:
+                    name_sql = f"({prefix_sql} OR {contains_sql})"
+                    name_params = [*prefix_params, *contains_params]
+                    order_sql = f"{prefix_sql} DESC, {name_col} ASC"
+                    order_params = list(prefix_params)
+            if q and not name_sql:
+                name_sql, name_params = f"{name_col} LIKE ?", [f"%{q}%"]
+
+            parts = ([name_sql] if name_sql else []) + where_parts
+            where_sql = f" WHERE {' AND '.join(parts)}" if parts else ""
+            query_params = [*name_params, *params]
             count_row = conn.execute(
                 f"SELECT COUNT(*) AS c FROM {table_name}{where_sql}",
-                tuple(params),
+                tuple(query_params),
             ).fetchone()
             total = int((count_row["c"] if isinstance(count_row, sqlite3.Row) else count_row[0]) or 0)
 
             offset = (page - 1) * page_size
             rows = conn.execute(
                 f"SELECT {', '.join(select_cols)} FROM {table_name}{where_sql} "
-                f"ORDER BY {name_col} ASC LIMIT ? OFFSET ?",
-                tuple(params + [page_size, offset]),
+                f"ORDER BY {order_sql} LIMIT ? OFFSET ?",
+                tuple(query_params + order_params + [page_size, offset]),
             ).fetchall()
             monsters = [_row_to_dict(r) for r in rows]
 
+            # Pochi risultati per nome: suggerimenti tolleranti ai refusi
+            # dall'indice a trigrammi (solo in prima pagina).
+            if q and page == 1 and len(monsters) < FUZZY_MIN_HITS:
+                seen_ids = {int(m["id"]) for m in monsters}
+                index = _monster_name_index(conn, table_name, name_col)
+                hits = [(mid, score) for mid, score in index.search(q) if mid not in seen_ids]
+                if hits:
+                    id_sql = ", ".join("?" for _ in hits)
+                    fuzzy_where = " AND ".join([f"id IN ({id_sql})", *where_parts])
+                    fuzzy_rows = conn.execute(
+                        f"SELECT {', '.join(select_cols)} FROM {table_name} WHERE {fuzzy_where}",
+                        tuple([mid for mid, _score in hits] + params),
+                    ).fetchall()
+                    order = {mid: pos for pos, (mid, _score) in enumerate(hits)}
+                    for r in sorted(fuzzy_rows, key=lambda r: order[int(r["id"])]):
+                        item = _row_to_dict(r)
+                        item["fuzzy"] = True
+                        monsters.append(item)
+
             cr_options: list[str] = []
             if cr_col:
                 cr_rows = conn.execute(f"SELECT DISTINCT {cr_col} AS cr_value FROM {table_name}").fetchall()
@@ -2458,22 +2824,85 @@ def create_app() -> Flask:
             available_columns=sorted(cols),
         )
 
+    def _render_spell_detail(spell_id: int, origin: str):
+        # Solo sorgenti registrate: la chiave di cache usa l'origin normalizzato.
+        source = get_source(origin)
+        if source is None or not source.available():
+            return ("Not found", 404)
+        # Il frammento dipende solo dall'incantesimo: stessa cache/invalidazione del dettaglio.
+        key = (source.origin, spell_id)
+        stamp = detail_stamp()
+        html = SPELL_DETAIL_HTML_CACHE.get(key, stamp)
+        if html is None:
+            spell = get_by_id(spell_id, origin=source.origin, include_private=source.opt_in)
+            if not spell:
+                return ("Not found", 404)
+            html = render_template("spell_detail.html", spell=spell)
+            SPELL_DETAIL_HTML_CACHE.put(key, html, stamp)
+        return html
+
     @app.get("/spell/<int:spell_id>")
     def spell_detail(spell_id: int):
         origin = (request.args.get("origin") or "srd").strip().lower()
-        include_private = origin == "private"
-        spell = get_by_id(spell_id, origin=origin, include_private=include_private)
-        if not spell:
-            return ("Not found", 404)
-
-        return render_template("spell_detail.html", spell=spell)
+        return _render_spell_detail(spell_id, origin)
 
     @app.get("/spell/private/<int:spell_id>")
     def spell_detail_private(spell_id: int):
-        spell = get_by_id(spell_id, origin="private", include_private=True)
-        if not spell:
-            return ("Not found", 404)
-        return render_template("spell_detail.html", spell=spell)
+        return _render_spell_detail(spell_id, "private")
+
+    @app.get("/debug/derived")
+    def debug_derived():
+        """Grafo delle statistiche derivate del PG corrente con i contatori di ricalcolo."""
+        pg = get_pg()
+        state = derived_state()
+        with state.lock:
+            state.update(pg)
+            state.values()
+            rows = state.stats()
+        if request.args.get("format") == "json":
+            return jsonify({"inputs": list(CHARACTER_GRAPH.inputs), "nodes": rows})
+        return render_template(
+            "debug_derived.html",
+            pg=pg,
+            characters=list_characters(),
+            inputs=CHARACTER_GRAPH.inputs,
+            rows=rows,
+        )
+
+    @app.get("/api/suggest")
+    def api_suggest():
+        # Typeahead: fino a 10 nomi che completano `q`, risposta piccola e cacheabile.
+        kind = (request.args.get("kind") or "").strip().lower()
+        q = (request.args.get("q") or "").strip()
+        include_private = kind == "spell" and _parse_bool_flag(request.args.get("include_private"))
+        if kind not in ("spell", "monster"):
+            return jsonify({"error": "kind deve essere 'spell' o 'monster'"}), 400
+
+        key = search_key(q)
+        stamp = detail_stamp() if kind == "spell" else catalog_version()
+        etag = hashlib.sha1(repr((kind, key, include_private, stamp)).encode("utf-8")).hexdigest()
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            if kind == "spell":
+                items = [
+                    {
+                        "name": sp["name"],
+                        "key": sp["spell_key"],
+                        "url": url_for("spell_detail", spell_id=sp["id"], origin=sp["origin"]),
+                    }
+                    for sp in suggest_spells(key, include_private=include_private)
+                ]
+            else:
+                items = [
+                    {"name": m["name"], "url": url_for("bestiary_detail", monster_id=m["id"])}
+                    for m in _suggest_monsters(key)
+                ]
+            response = jsonify({"kind": kind, "q": key, "items": items})
+        response.set_etag(etag)
+        # Le spell private restano nella cache del browser, non in quelle condivise.
+        response.headers["Cache-Control"] = f"{'private' if include_private else 'public'}, max-age=300"
+        return response
 
     return app
 
@@ -0,0 +1,114 @@
+# engine/cache.py
+"""Cache LRU in processo, limitate e con invalidazione per versione.
+
+Ogni cache ha uno `stamp` (es. versione catalogo + identita' del DB privato):
+se il chiamante passa uno stamp diverso da quello delle voci presenti, la
+cache si svuota prima di rispondere. Con `ttl` (secondi) ogni voce scade anche
+da sola. Contatori di hit/miss per cache, leggibili con `cache_stats()`.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, name: str, maxsize: int = 256, ttl: float | None = None) -> None:
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl) if ttl else None
+        # chiave -> (scadenza monotonic o None, valore)
+        self._data: OrderedDict[Hashable, tuple[float | None, Any]] = OrderedDict()
+        self._stamp: Any = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.expirations = 0
+        _CACHES[name] = self
+
+    def _check_stamp(self, stamp: Any) -> None:
+        if stamp != self._stamp:
+            if self._data:
+                self.invalidations += 1
+            self._data.clear()
+            self._stamp = stamp
+
+    def get(self, key: Hashable, stamp: Any = None, default: Any = None) -> Any:
+        with self._lock:
+            self._check_stamp(stamp)
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                entry = _MISSING
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any, stamp: Any = None) -> None:
+        with self._lock:
+            self._check_stamp(stamp)
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, stamp: Any, loader: Callable[[], Any]) -> Any:
+        """Valore in cache o `loader()`; i None non vengono memorizzati."""
+        value = self.get(key, stamp, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = loader()
+        if value is not None:
+            self.put(key, value, stamp)
+        return value
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[1] if entry is not None else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._stamp = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "expirations": self.expirations,
+                "ttl": self.ttl,
+            }
+
+
+_CACHES: dict[str, LRUCache] = {}
+
+
+def cache_stats() -> dict[str, dict]:
+    """Statistiche di tutte le cache create nel processo."""
+    return {name: cache.stats() for name, cache in _CACHES.items()}
+
+
+def clear_caches() -> None:
+    for cache in _CACHES.values():
+        cache.clear()
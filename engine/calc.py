@@ -1,7 +1,6 @@
 # engine/calc.py
 from .rules import HIT_DIE_BY_CLASS, SPELLCASTING_ABILITY_BY_CLASS, SAVING_THROWS_BY_CLASS, STATS
-from .db import connect, ensure_schema
-import json
+from .rules_registry import ClassRules, get_rules_registry
 
 def ability_mod(score: int) -> int:
     return (score - 10) // 2
@@ -51,35 +50,25 @@ def _class_code(classe) -> str | None:
     return None
 
 
+def _class_rules(classe) -> ClassRules | None:
+    """Regole di classe dal registro in memoria (stesso match della vecchia query:
+    classes.name_it = nome OR classes.code = code)."""
+    registry = get_rules_registry()
+    name = _normalize_class_name(classe)
+    code = _class_code(classe)
+    return registry.by_name.get(name) or registry.by_code.get(code or name)
+
+
 def hit_die(classe: str) -> int:
     """Ritorna il dado vita della classe.
 
     Priorità:
-    1) DB (class_details.hit_die) usando name_it (es: "Warlock")
+    1) registro regole (class_details.hit_die) usando name_it (es: "Warlock")
     2) fallback su mapping hardcoded (engine.rules)
     """
-    try:
-        conn = connect()
-        try:
-            ensure_schema(conn)
-            name = _normalize_class_name(classe)
-            code = _class_code(classe)
-            row = conn.execute(
-                """
-                SELECT cd.hit_die
-                FROM classes c
-                JOIN class_details cd ON cd.class_code = c.code
-                WHERE c.name_it = ? OR c.code = ?
-                """,
-                (name, code or name),
-            ).fetchone()
-            if row and row[0] is not None:
-                return int(row[0])
-        finally:
-            conn.close()
-    except Exception:
-        # DB non disponibile / schema non pronto: andiamo di fallback
-        pass
+    rules = _class_rules(classe)
+    if rules and rules.hit_die is not None:
+        return int(rules.hit_die)
 
     name = _normalize_class_name(classe)
     return HIT_DIE_BY_CLASS.get(name, 8)
@@ -108,33 +97,12 @@ def saving_throws(classe: str) -> list[str]:
     """Ritorna la lista dei TS proficienti per la classe (es: ['sag','car']).
 
     Priorità:
-    1) DB (class_details.saving_throws_json) usando classes.name_it (es: "Warlock")
+    1) registro regole (class_details.saving_throws_json) usando classes.name_it (es: "Warlock")
     2) fallback su mapping hardcoded (engine.rules)
     """
-    try:
-        conn = connect()
-        try:
-            ensure_schema(conn)
-            name = _normalize_class_name(classe)
-            code = _class_code(classe)
-            row = conn.execute(
-                """
-                SELECT cd.saving_throws_json
-                FROM classes c
-                JOIN class_details cd ON cd.class_code = c.code
-                WHERE c.name_it = ? OR c.code = ?
-                """,
-                (name, code or name),
-            ).fetchone()
-
-            if row and row[0]:
-                data = json.loads(row[0])
-                if isinstance(data, list):
-                    return [str(x) for x in data]
-        finally:
-            conn.close()
-    except Exception:
-        pass
+    rules = _class_rules(classe)
+    if rules and rules.saving_throws is not None:
+        return list(rules.saving_throws)
 
     name = _normalize_class_name(classe)
     return SAVING_THROWS_BY_CLASS.get(name, [])
@@ -144,32 +112,8 @@ def class_skill_choices(classe: str) -> dict | None:
     {"choose": 2, "from": ["Arcano", "Indagare", ...]}
 
     Priorità:
-    1) DB (class_details.skill_choices_json) usando classes.name_it oppure classes.code
+    1) registro regole (class_details.skill_choices_json) usando classes.name_it oppure classes.code
     2) None se non disponibile
     """
-    try:
-        conn = connect()
-        try:
-            ensure_schema(conn)
-            name = _normalize_class_name(classe)
-            code = _class_code(classe)
-            row = conn.execute(
-                """
-                SELECT cd.skill_choices_json
-                FROM classes c
-                JOIN class_details cd ON cd.class_code = c.code
-                WHERE c.name_it = ? OR c.code = ?
-                """,
-                (name, code or name),
-            ).fetchone()
-
-            if row and row[0]:
-                data = json.loads(row[0])
-                if isinstance(data, dict):
-                    return data
-        finally:
-            conn.close()
-    except Exception:
-        pass
-
-    return None
+    rules = _class_rules(classe)
+    return rules.skill_choices() if rules else None
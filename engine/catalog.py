@@ -0,0 +1,144 @@
+# engine/catalog.py
+"""Catalogo SRD in un file separato, in sola lettura.
+
+Il catalogo (incantesimi, mostri, classi...) viene copiato dal DB principale
+in `db/srd_catalog.sqlite3`. Le connessioni lo agganciano come schema
+"catalog" in modalita' read-only/immutable con mmap (vedi engine.db), cosi'
+le letture non competono con WAL e checkpoint dei dati utente.
+
+Uso:
+    python -m engine.catalog build [--source PATH] [--dest PATH]
+    python -m engine.catalog rebuild-fts
+    python -m engine.catalog ingest
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+from . import db
+from .ingest import ensure_spell_fields, reset_spell_fields
+from .spell_fts import create_spell_fts, has_spell_fts, rebuild_spell_fts
+from .spell_sources import spell_sources
+
+# Tabelle con dati dell'utente: non finiscono nel catalogo.
+USER_TABLES = ("characters", "character_spells", "sessions")
+
+
+def build_catalog(source: Path | None = None, dest: Path | None = None) -> Path:
+    """Genera il file catalogo dal DB corrente e lo sostituisce in modo atomico.
+
+    La copia passa da `VACUUM INTO` su un file temporaneo accanto alla
+    destinazione, poi `os.replace`: chi ha gia' il vecchio file aperto continua
+    a leggerlo, le connessioni nuove vedono quello nuovo.
+    """
+    source = Path(source or db.SQLITE_PATH)
+    dest = Path(dest or db.CATALOG_PATH)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(dest.name + ".tmp")
+    if tmp.exists():
+        tmp.unlink()
+
+    src = sqlite3.connect(source)
+    try:
+        db.ensure_schema(src)
+        src.execute("VACUUM INTO ?", (str(tmp),))
+    finally:
+        src.close()
+
+    out = sqlite3.connect(tmp)
+    try:
+        for table in USER_TABLES:
+            out.execute(f"DROP TABLE IF EXISTS {table}")
+        out.execute("PRAGMA journal_mode = DELETE")
+        out.commit()
+        out.execute("VACUUM")
+    finally:
+        out.close()
+
+    os.replace(tmp, dest)
+    db.invalidate_catalog()
+    return dest
+
+
+def rebuild_fts() -> list[str]:
+    """Ricostruisce l'indice FTS degli incantesimi nel DB principale e nelle sorgenti su file.
+
+    Serve dopo import massivi fatti senza trigger (es. tool esterni). Il
+    catalogo read-only non si tocca: va rigenerato con `build`.
+    """
+    done: list[str] = []
+    targets = [Path(db.SQLITE_PATH)]
+    targets += [src.path for src in spell_sources(include_private=True) if src.path is not None]
+    for path in targets:
+        conn = sqlite3.connect(path)
+        try:
+            if path == Path(db.SQLITE_PATH):
+                db.ensure_schema(conn)
+            if has_spell_fts(conn):
+                rebuild_spell_fts(conn)
+            else:
+                create_spell_fts(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        done.append(str(path))
+    return done
+
+
+def refresh_fields() -> list[str]:
+    """Ricalcola i campi derivati degli incantesimi (engine.ingest) ovunque.
+
+    Da lanciare quando cambiano le regole di pulizia/visualizzazione: le righe
+    nuove o modificate vengono gia' completate da ensure_schema e dall'aggancio
+    delle sorgenti.
+    """
+    done: list[str] = []
+    targets = [Path(db.SQLITE_PATH)]
+    targets += [src.path for src in spell_sources(include_private=True) if src.path is not None]
+    for path in targets:
+        conn = sqlite3.connect(path)
+        try:
+            if path == Path(db.SQLITE_PATH):
+                db.ensure_schema(conn)
+            reset_spell_fields(conn)
+            ensure_spell_fields(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        done.append(str(path))
+    return done
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m engine.catalog")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_build = sub.add_parser("build", help="genera il catalogo SRD read-only dal DB corrente")
+    p_build.add_argument("--source", type=Path, default=None)
+    p_build.add_argument("--dest", type=Path, default=None)
+    sub.add_parser("rebuild-fts", help="ricostruisce l'indice full-text degli incantesimi")
+    sub.add_parser("ingest", help="ricalcola descrizione ripulita e campi di visualizzazione")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        path = build_catalog(args.source, args.dest)
+        print(f"Catalogo scritto in {path}")
+    elif args.command == "rebuild-fts":
+        for path in rebuild_fts():
+            print(f"Indice FTS ricostruito in {path}")
+        if db.CATALOG_PATH.exists():
+            print("Ricorda di rigenerare il catalogo: python -m engine.catalog build")
+    elif args.command == "ingest":
+        for path in refresh_fields():
+            print(f"Campi derivati ricalcolati in {path}")
+        if db.CATALOG_PATH.exists():
+            print("Ricorda di rigenerare il catalogo: python -m engine.catalog build")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# engine/class_mask.py
+"""Bitmask delle classi per incantesimo (`spells.class_mask`).
+
+Ogni classe SRD ha un bit; `class_mask` e' la somma dei bit delle righe di
+`spell_classes` dello stesso incantesimo. La colonna e' tenuta allineata da
+trigger in SQL puro su `spell_classes`, cosi' il filtro per classe diventa
+`class_mask & ? != 0` e i codici classe si leggono senza sottoquery.
+
+Codici non presenti in CLASS_BITS valgono 0 (non filtrabili): aggiungere una
+classe significa aggiungere un bit qui e una migrazione che ricalcola.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from typing import Iterable
+
+MASK_COLUMN = "class_mask"
+# L'ordine fissa il bit: non riordinare, aggiungere solo in coda.
+CLASS_BITS: tuple[str, ...] = (
+    "barbarian",
+    "bard",
+    "cleric",
+    "druid",
+    "fighter",
+    "monk",
+    "paladin",
+    "ranger",
+    "rogue",
+    "sorcerer",
+    "warlock",
+    "wizard",
+)
+_BIT_BY_CODE = {code: 1 << pos for pos, code in enumerate(CLASS_BITS)}
+
+
+def class_bit(code: str | None) -> int:
+    return _BIT_BY_CODE.get((code or "").strip().lower(), 0)
+
+
+def mask_for(codes: Iterable[str | None]) -> int:
+    mask = 0
+    for code in codes:
+        mask |= class_bit(code)
+    return mask
+
+
+def codes_for(mask: int | None) -> str:
+    """Mask -> codici separati da virgola (stesso formato del vecchio group_concat)."""
+    mask = int(mask or 0)
+    return ",".join(code for code, bit in _BIT_BY_CODE.items() if mask & bit)
+
+
+def _bit_case(column: str) -> str:
+    whens = " ".join(f"WHEN '{code}' THEN {bit}" for code, bit in _BIT_BY_CODE.items())
+    return f"CASE {column} {whens} ELSE 0 END"
+
+
+def mask_subquery(spell_classes: str, spell_id_expr: str) -> str:
+    """Espressione SQL che calcola la mask da `spell_classes` (per DB senza colonna)."""
+    return (
+        f"(SELECT coalesce(sum(DISTINCT {_bit_case('mc.class_code')}), 0) "
+        f"FROM {spell_classes} mc WHERE mc.spell_id = {spell_id_expr})"
+    )
+
+
+def has_class_mask(conn: sqlite3.Connection, schema: str = "main") -> bool:
+    cols = {r[1] for r in conn.execute(f"PRAGMA {schema}.table_info(spells)").fetchall()}
+    return MASK_COLUMN in cols
+
+
+def mask_expr(conn: sqlite3.Connection, schema: str, alias: str) -> str:
+    """Colonna materializzata se c'e', altrimenti calcolo al volo (DB privato read-only)."""
+    if has_class_mask(conn, schema):
+        return f"{alias}.{MASK_COLUMN}"
+    return mask_subquery(f"{schema}.spell_classes", f"{alias}.id")
+
+
+def ensure_class_mask(conn: sqlite3.Connection, schema: str = "main") -> None:
+    """Colonna + trigger di sync su spell_classes nello schema indicato, poi ricalcolo."""
+    if not has_class_mask(conn, schema):
+        conn.execute(
+            f"ALTER TABLE {schema}.spells ADD COLUMN {MASK_COLUMN} INTEGER NOT NULL DEFAULT 0"
+        )
+    recompute = (
+        f"UPDATE spells SET {MASK_COLUMN} = {mask_subquery('spell_classes', '{ref}.spell_id')} "
+        "WHERE id = {ref}.spell_id;"
+    )
+    for event, refs in (("INSERT", ("new",)), ("DELETE", ("old",)), ("UPDATE", ("old", "new"))):
+        body = "\n".join(recompute.format(ref=ref) for ref in refs)
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {schema}.trg_spell_classes_{event.lower()}_{MASK_COLUMN}
+            AFTER {event} ON spell_classes
+            BEGIN
+                {body}
+            END
+            """
+        )
+    conn.execute(
+        f"UPDATE {schema}.spells SET {MASK_COLUMN} = "
+        f"{mask_subquery(f'{schema}.spell_classes', f'{schema}.spells.id')}"
+    )
@@ -1,279 +1,352 @@
 # engine/db.py
 from __future__ import annotations
 
+import os
 import sqlite3
+import threading
+import time
 from pathlib import Path
 
+from .ingest import refresh_spell_fields
+from .migrations import LATEST_VERSION, migrate, schema_version
+from .search_keys import refresh_search_keys
+
 
 # Root progetto (cartella che contiene main.py)
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DB_ROOT = PROJECT_ROOT / "db"
 SQLITE_PATH = DB_ROOT / "dnd_sheet.sqlite3"
 
-
-def connect() -> sqlite3.Connection:
-    """Connessione SQLite con PRAGMA utili e row_factory."""
-    DB_ROOT.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(SQLITE_PATH)
+# Catalogo SRD in sola lettura (generato con `python -m engine.catalog build`).
+# Se presente e aggiornato viene agganciato come schema "catalog".
+CATALOG_PATH = DB_ROOT / "srd_catalog.sqlite3"
+CATALOG_SCHEMA = "catalog"
+CATALOG_ENABLED = (os.getenv("DND_CATALOG") or "1").strip().lower() not in {"0", "false", "off", "no"}
+CATALOG_MMAP_SIZE = int(os.getenv("DND_CATALOG_MMAP_SIZE") or 256 * 1024 * 1024)
+
+# Pool di connessioni (disattivabile con DND_DB_POOL=0, es. nei test)
+POOL_MAX_SIZE = int(os.getenv("DND_DB_POOL_SIZE") or 8)
+POOL_TIMEOUT = float(os.getenv("DND_DB_POOL_TIMEOUT") or 10.0)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Nessuna connessione libera entro il timeout del pool."""
+
+
+class PooledConnection(sqlite3.Connection):
+    """Connessione SQLite che torna al pool su close() o all'uscita dal `with`.
+
+    Il contratto resta quello di sqlite3.Connection: `with connect() as conn`
+    fa commit/rollback come prima; in piu' all'uscita la connessione viene
+    rilasciata (al pool se attivo, altrimenti chiusa davvero).
+    """
+
+    _pool: "ConnectionPool | None" = None
+    _schema_ready: bool = False
+    # Schema da cui leggere le tabelle di catalogo: "catalog" se agganciato, altrimenti "main".
+    catalog_schema: str = "main"
+    _catalog_file: tuple | None = None
+
+    def close(self) -> None:
+        pool = self._pool
+        if pool is None:
+            super().close()
+        else:
+            pool.release(self)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return super().__exit__(exc_type, exc, tb)
+        finally:
+            self.close()
+
+
+def _catalog_file_stamp() -> tuple | None:
+    """Identita' del file catalogo: cambia se viene ricostruito o sostituito."""
+    try:
+        st = os.stat(CATALOG_PATH)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _attach_catalog(conn: PooledConnection) -> None:
+    """Aggancia il catalogo read-only/immutable con mmap, se utilizzabile.
+
+    Un catalogo costruito con uno schema piu' vecchio viene ignorato: in quel
+    caso le letture restano sulle tabelle di `main`.
+    """
+    conn._catalog_file = _catalog_file_stamp()
+    if not CATALOG_ENABLED or conn._catalog_file is None:
+        return
+    uri = Path(CATALOG_PATH).resolve().as_uri() + "?mode=ro&immutable=1"
+    try:
+        conn.execute(f"ATTACH DATABASE ? AS {CATALOG_SCHEMA}", (uri,))
+        if schema_version(conn, CATALOG_SCHEMA) != LATEST_VERSION:
+            conn.execute(f"DETACH DATABASE {CATALOG_SCHEMA}")
+            return
+        conn.execute(f"PRAGMA {CATALOG_SCHEMA}.mmap_size = {int(CATALOG_MMAP_SIZE)}")
+    except sqlite3.Error:
+        return
+    conn.catalog_schema = CATALOG_SCHEMA
+
+
+def _open_connection(path: Path) -> PooledConnection:
+    """Apre una connessione nuova applicando i PRAGMA una sola volta."""
+    path = Path(path).resolve()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path.as_uri(), factory=PooledConnection, check_same_thread=False, uri=True)
     conn.row_factory = sqlite3.Row
 
     # PRAGMA: foreign keys, journaling sicuro, ecc.
     conn.execute("PRAGMA foreign_keys = ON;")
     conn.execute("PRAGMA journal_mode = WAL;")
     conn.execute("PRAGMA synchronous = NORMAL;")
+    _attach_catalog(conn)
     return conn
 
 
+def catalog_schema(conn: sqlite3.Connection) -> str:
+    """Nome dello schema che contiene le tabelle di catalogo per questa connessione."""
+    return getattr(conn, "catalog_schema", "main")
+
+
+class ConnectionPool:
+    """Pool limitato e thread-safe di connessioni verso un unico file SQLite."""
+
+    def __init__(self, path: Path, max_size: int, timeout: float) -> None:
+        self.path = Path(path)
+        self.max_size = max(1, int(max_size))
+        self.timeout = float(timeout)
+        self._cond = threading.Condition()
+        self._idle: list[PooledConnection] = []
+        self._open = 0
+        self._closed = False
+        self._stats = {
+            "created": 0,
+            "reused": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "discarded": 0,
+        }
+
+    def acquire(self) -> PooledConnection:
+        deadline = None
+        waited_from = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    self._stats["reused"] += 1
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    conn = None
+                    break
+                if waited_from is None:
+                    waited_from = time.perf_counter()
+                    deadline = waited_from + self.timeout
+                    self._stats["waits"] += 1
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    self._stats["wait_seconds"] += time.perf_counter() - waited_from
+                    raise PoolTimeout("Nessuna connessione SQLite disponibile nel pool.")
+                self._cond.wait(remaining)
+            if waited_from is not None:
+                self._stats["wait_seconds"] += time.perf_counter() - waited_from
+
+        if conn is not None:
+            if conn._catalog_file == _catalog_file_stamp():
+                return conn
+            # Catalogo ricostruito/sostituito: la connessione vede ancora il file vecchio.
+            conn._pool = None
+            conn.close()
+            with self._cond:
+                self._stats["discarded"] += 1
+
+        # Apertura fuori dal lock: e' la parte costosa.
+        try:
+            conn = _open_connection(self.path)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        conn._pool = self
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def release(self, conn: PooledConnection) -> None:
+        reusable = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            reusable = False
+
+        with self._cond:
+            if conn in self._idle:
+                return
+            if self._closed or not reusable:
+                self._open -= 1
+                self._stats["discarded"] += 1
+                self._cond.notify()
+            else:
+                self._idle.append(conn)
+                self._cond.notify()
+                return
+        conn._pool = None
+        conn.close()
+
+    def close(self) -> None:
+        """Chiude le connessioni inattive; quelle in uso vengono chiuse al rilascio."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            conn._pool = None
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            out.update(
+                {
+                    "max_size": self.max_size,
+                    "size": self._open,
+                    "idle": len(self._idle),
+                    "in_use": self._open - len(self._idle),
+                }
+            )
+        return out
+
+
+_POOL: ConnectionPool | None = None
+_POOL_LOCK = threading.Lock()
+_POOL_ENABLED = (os.getenv("DND_DB_POOL") or "1").strip().lower() not in {"0", "false", "off", "no"}
+
+
+def _get_pool() -> ConnectionPool:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None or _POOL.path != Path(SQLITE_PATH):
+            if _POOL is not None:
+                _POOL.close()
+            _POOL = ConnectionPool(Path(SQLITE_PATH), POOL_MAX_SIZE, POOL_TIMEOUT)
+        return _POOL
+
+
+def configure_pool(enabled: bool | None = None, max_size: int | None = None, timeout: float | None = None) -> None:
+    """Riconfigura il pool (chiude quello corrente; il prossimo connect() lo ricrea)."""
+    global _POOL, _POOL_ENABLED, POOL_MAX_SIZE, POOL_TIMEOUT
+    with _POOL_LOCK:
+        if enabled is not None:
+            _POOL_ENABLED = bool(enabled)
+        if max_size is not None:
+            POOL_MAX_SIZE = max(1, int(max_size))
+        if timeout is not None:
+            POOL_TIMEOUT = float(timeout)
+        if _POOL is not None:
+            _POOL.close()
+            _POOL = None
+
+
+def pool_stats() -> dict:
+    """Metriche del pool (dimensione, attese, riusi...)."""
+    if not _POOL_ENABLED:
+        return {"enabled": False}
+    out = _get_pool().stats()
+    out["enabled"] = True
+    return out
+
+
+def connect() -> sqlite3.Connection:
+    """Connessione SQLite con PRAGMA utili e row_factory.
+
+    Con il pool attivo la connessione viene riutilizzata: close() o l'uscita
+    dal blocco `with` la restituiscono al pool invece di chiuderla.
+    """
+    if not _POOL_ENABLED:
+        return _open_connection(Path(SQLITE_PATH))
+    return _get_pool().acquire()
+
+
+_MIGRATE_LOCK = threading.Lock()
+
+
 def ensure_schema(conn: sqlite3.Connection) -> None:
-    """Crea lo schema DB (idempotente)."""
-    conn.executescript(
-        """
-        -- =========================================
-        -- Meta / migrazioni (semplice)
-        -- =========================================
-        CREATE TABLE IF NOT EXISTS schema_migrations (
-            version INTEGER PRIMARY KEY,
-            applied_at TEXT NOT NULL DEFAULT (datetime('now'))
-        );
-
-        -- =========================================
-        -- CHARACTERS (PG)
-        -- =========================================
-        CREATE TABLE IF NOT EXISTS characters (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-
-            -- Chiave "umana" usata oggi dalla UI (dropdown).
-            name TEXT NOT NULL UNIQUE,
-
-            -- Chiave stabile futura (può restare NULL finché non la usiamo).
-            slug TEXT UNIQUE,
-
-            -- Stato completo del PG (flessibile: non ti costringe a migrazioni frequenti)
-            data_json TEXT NOT NULL,
-
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_characters_name ON characters(name);
-        CREATE INDEX IF NOT EXISTS idx_characters_slug ON characters(slug);
-
-
-        -- =========================================
-        -- SPELLS (catalogo)
-        -- Descrizioni parafrasate (no testo dei libri)
-        -- =========================================
-        CREATE TABLE IF NOT EXISTS spells (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-
-            slug TEXT NOT NULL UNIQUE,
-            name_it TEXT NOT NULL,
-            level INTEGER NOT NULL,              -- 0 = trucchetto
-            school TEXT NOT NULL,                -- es: "Invocazione", "Abiurazione"...
-            casting_time TEXT NOT NULL,          -- es: "1 azione", "1 reazione"...
-            range_text TEXT NOT NULL,            -- es: "18 m", "Sé", "Contatto"...
-            components_v INTEGER NOT NULL DEFAULT 0,
-            components_s INTEGER NOT NULL DEFAULT 0,
-            components_m INTEGER NOT NULL DEFAULT 0,
-            material_text TEXT,                  -- testo libero (se M=1)
-            duration_text TEXT NOT NULL,         -- es: "Istantanea", "1 minuto"...
-            concentration INTEGER NOT NULL DEFAULT 0,
-            ritual INTEGER NOT NULL DEFAULT 0,
-
-            description TEXT NOT NULL,           -- parafrasi
-            at_higher_levels TEXT,               -- parafrasi, opzionale
-            source TEXT,                         -- es: "PHB", "Tasha"
-
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_spells_name_it ON spells(name_it);
-        CREATE INDEX IF NOT EXISTS idx_spells_level ON spells(level);
-        CREATE INDEX IF NOT EXISTS idx_spells_school ON spells(school);
-
-
-        -- Classi (per mapping spell <-> classi)
-        CREATE TABLE IF NOT EXISTS classes (
-            code TEXT PRIMARY KEY,   -- es: "wizard", "cleric", "druid"...
-            name_it TEXT NOT NULL
-        );
-
-        -- Dettagli classi (SRD)
-        -- Nota: teniamo JSON per liste/choice così evitiamo migrazioni frequenti.
-        CREATE TABLE IF NOT EXISTS class_details (
-            class_code TEXT PRIMARY KEY,
-            hit_die INTEGER NOT NULL,
-
-            armor_proficiencies_json TEXT,
-            weapon_proficiencies_json TEXT,
-            tool_proficiencies_json TEXT,
-            saving_throws_json TEXT,
-            skill_choices_json TEXT,
-            starting_equipment_json TEXT,
-
-            spellcasting_ability TEXT,   -- es: "car" per Warlock
-            spellcasting_type TEXT,      -- es: "pact", "full", "half", "none"
-
-            description TEXT,
-            source TEXT,
-
-            FOREIGN KEY (class_code) REFERENCES classes(code) ON DELETE CASCADE
-        );
-
-        -- Progressione per livello (per automatismi UI)
-        CREATE TABLE IF NOT EXISTS class_levels (
-            class_code TEXT NOT NULL,
-            level INTEGER NOT NULL,
-
-            prof_bonus INTEGER NOT NULL,
-            features_json TEXT,          -- lista di feature_key (ordine importante)
-
-            -- campi comuni (NULL se non applicabili)
-            cantrips_known INTEGER,
-            spells_known INTEGER,
-            -- Per Warlock (Magia del Patto): numero slot e loro livello
-            spell_slots INTEGER,
-            slot_level INTEGER,
-
-            -- Per incantatori "normali": lista slot per livello [1..9]
-            spell_slots_json TEXT,
-            invocations_known INTEGER,
-
-            PRIMARY KEY (class_code, level),
-            FOREIGN KEY (class_code) REFERENCES classes(code) ON DELETE CASCADE
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_class_levels_code ON class_levels(class_code);
-
-        -- Dettaglio privilegi/feature (testo SRD o parafrasi)
-        CREATE TABLE IF NOT EXISTS class_features (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            class_code TEXT NOT NULL,
-            feature_key TEXT NOT NULL,
-            level INTEGER NOT NULL,
-            name_it TEXT NOT NULL,
-            description TEXT,
-            source TEXT,
-
-            UNIQUE (class_code, feature_key),
-            FOREIGN KEY (class_code) REFERENCES classes(code) ON DELETE CASCADE
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_class_features_code ON class_features(class_code);
-
-        -- Molti-a-molti: quali classi hanno accesso a quali incantesimi
-        CREATE TABLE IF NOT EXISTS spell_classes (
-            spell_id INTEGER NOT NULL,
-            class_code TEXT NOT NULL,
-
-            PRIMARY KEY (spell_id, class_code),
-            FOREIGN KEY (spell_id) REFERENCES spells(id) ON DELETE CASCADE,
-            FOREIGN KEY (class_code) REFERENCES classes(code) ON DELETE CASCADE
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_spell_classes_class ON spell_classes(class_code);
-        CREATE INDEX IF NOT EXISTS idx_spell_classes_class_spell ON spell_classes(class_code, spell_id);
-
-
-        -- =========================================
-        -- MOSTERS (bestiario)
-        -- =========================================
-        CREATE TABLE IF NOT EXISTS monsters (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-
-            slug TEXT NOT NULL UNIQUE,
-            name_it TEXT NOT NULL,
-            cr REAL NOT NULL,                  -- GS (Challenge Rating)
-            size TEXT NOT NULL,                -- es: "Piccola", "Media"...
-            type TEXT NOT NULL,                -- es: "Umanoide", "Bestia"...
-            alignment TEXT,                    -- testo libero
-
-            ac INTEGER,                        -- opzionale
-            hp INTEGER,                        -- opzionale
-            speed_text TEXT,                   -- testo libero (es: "9 m, volare 18 m")
-
-            senses_text TEXT,
-            languages_text TEXT,
-
-            -- Campi “semi-strutturati” in JSON (azioni/abilità ecc.)
-            stats_json TEXT,                   -- For/Des/Con/Int/Sag/Car
-            traits_json TEXT,
-            actions_json TEXT,
-            reactions_json TEXT,
-            legendary_actions_json TEXT,
-
-            description TEXT,                  -- parafrasi/riassunto (opzionale)
-            source TEXT,
-
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_monsters_name_it ON monsters(name_it);
-        CREATE INDEX IF NOT EXISTS idx_monsters_cr ON monsters(cr);
-        CREATE INDEX IF NOT EXISTS idx_monsters_type ON monsters(type);
-
-
-        -- Tag (riutilizzabili)
-        CREATE TABLE IF NOT EXISTS tags (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE
-        );
-
-        CREATE TABLE IF NOT EXISTS monster_tags (
-            monster_id INTEGER NOT NULL,
-            tag_id INTEGER NOT NULL,
-
-            PRIMARY KEY (monster_id, tag_id),
-            FOREIGN KEY (monster_id) REFERENCES monsters(id) ON DELETE CASCADE,
-            FOREIGN KEY (tag_id) REFERENCES tags(id) ON DELETE CASCADE
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_monster_tags_tag ON monster_tags(tag_id);
-
-
-        -- =========================================
-        -- RELAZIONI PG <-> INCANTESIMI
-        -- (serve dopo, ma meglio averla pronta)
-        -- =========================================
-        CREATE TABLE IF NOT EXISTS character_spells (
-            character_id INTEGER NOT NULL,
-            spell_id INTEGER NOT NULL,
-
-            -- known / prepared / always / pact ecc. (stringa, semplice)
-            status TEXT NOT NULL,
-
-            -- opzionale: da quale classe/sottoclasse arriva (se multiclasse)
-            source_class_code TEXT,
-
-            notes TEXT,
-
-            PRIMARY KEY (character_id, spell_id, status),
-            FOREIGN KEY (character_id) REFERENCES characters(id) ON DELETE CASCADE,
-            FOREIGN KEY (spell_id) REFERENCES spells(id) ON DELETE CASCADE,
-            FOREIGN KEY (source_class_code) REFERENCES classes(code) ON DELETE SET NULL
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_character_spells_character ON character_spells(character_id);
-        CREATE INDEX IF NOT EXISTS idx_character_spells_spell ON character_spells(spell_id);
-        """
-    )
-
-    # -------------------------
-    # Migrazioni leggere (ALTER TABLE)
-    # -------------------------
-    # Nota: CREATE TABLE IF NOT EXISTS non aggiunge colonne nuove su DB esistenti.
-    # Qui aggiungiamo le colonne mancanti in modo idempotente.
-
-    def _ensure_column(table: str, column: str, ddl: str) -> None:
-        cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table});").fetchall()]
-        if column not in cols:
-            conn.execute(f"ALTER TABLE {table} ADD COLUMN {ddl};")
-
-    _ensure_column(
-        "class_levels",
-        "spell_slots_json",
-        "spell_slots_json TEXT",
-    )
-    conn.commit()
+    """Porta lo schema all'ultima versione (idempotente).
+
+    Il runner gira al massimo una volta per connessione: dopo il primo
+    controllo (una PRAGMA user_version) le chiamate successive non fanno I/O.
+    Allo stesso passaggio si completano le chiavi di ricerca mancanti
+    (righe del catalogo inserite o rinominate da tool esterni) e i campi
+    derivati degli incantesimi (engine.ingest).
+    """
+    if getattr(conn, "_schema_ready", False):
+        return
+    if schema_version(conn) < LATEST_VERSION:
+        with _MIGRATE_LOCK:
+            if schema_version(conn) < LATEST_VERSION:
+                migrate(conn)
+    refresh_search_keys(conn)
+    refresh_spell_fields(conn)
+    try:
+        conn._schema_ready = True
+    except AttributeError:
+        # sqlite3.Connection "nuda" (non dal pool): ricontrolliamo la volta dopo.
+        pass
+
+
+# -------------------------
+# Versione catalogo
+# -------------------------
+# Le cache in memoria (regole, incantesimi...) confrontano questa versione per
+# invalidarsi. catalog_meta.version viene riletta al massimo ogni
+# CATALOG_CHECK_INTERVAL secondi; invalidate_catalog() forza il ricaricamento.
+CATALOG_CHECK_INTERVAL = float(os.getenv("DND_CATALOG_CHECK_INTERVAL") or 2.0)
+
+_CATALOG_LOCK = threading.Lock()
+_catalog_generation = 0
+_catalog_stamp: tuple | None = None
+_catalog_checked_at = 0.0
+
+
+def _read_catalog_stamp() -> tuple | None:
+    try:
+        with connect() as conn:
+            ensure_schema(conn)
+            schema = catalog_schema(conn)
+            row = conn.execute(f"SELECT version FROM {schema}.catalog_meta WHERE id = 1").fetchone()
+            file_stamp = conn._catalog_file if schema != "main" else None
+    except sqlite3.Error:
+        return None
+    return (file_stamp, int(row[0])) if row else None
+
+
+def catalog_version() -> tuple:
+    """Ritorna un identificativo che cambia quando cambia il catalogo."""
+    global _catalog_stamp, _catalog_checked_at
+    now = time.monotonic()
+    with _CATALOG_LOCK:
+        if now - _catalog_checked_at < CATALOG_CHECK_INTERVAL:
+            return (_catalog_generation, _catalog_stamp)
+        _catalog_checked_at = now
+    stamp = _read_catalog_stamp()
+    with _CATALOG_LOCK:
+        _catalog_stamp = stamp
+        return (_catalog_generation, _catalog_stamp)
+
+
+def invalidate_catalog() -> None:
+    """Da chiamare dopo import/aggiornamenti del catalogo fatti da questo processo."""
+    global _catalog_generation, _catalog_checked_at
+    with _CATALOG_LOCK:
+        _catalog_generation += 1
+        _catalog_checked_at = 0.0
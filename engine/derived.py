@@ -0,0 +1,155 @@
+# engine/derived.py
+"""Grafo reattivo per le statistiche derivate del personaggio.
+
+Ogni `Node` dichiara i suoi ingressi: campi del PG (foglie, es. `stats_base`,
+`level`, `classe`) o altri nodi. `DerivedGraph` controlla che il grafo sia
+aciclico e ne tiene l'ordine topologico; `DerivedState` conserva valori e
+versioni per un personaggio.
+
+Valutazione pigra con versioni: cambiare un ingresso incrementa solo la sua
+versione; un nodo si ricalcola quando lo si legge e una delle versioni dei
+suoi ingressi e' cambiata. Se il nuovo valore e' uguale al precedente la
+versione del nodo resta ferma e i nodi a valle non si ricalcolano (es. FOR da
+14 a 15 non cambia il modificatore). I contatori di ricalcolo per nodo
+servono alla vista di debug.
+
+Uno stato puo' essere condiviso tra thread: ogni metodo prende `lock` (un
+RLock), e chi deve aggiornare e poi leggere in modo coerente lo tiene per
+tutta la sequenza.
+"""
+
+from __future__ import annotations
+
+import copy
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Mapping
+
+
+@dataclass(frozen=True, slots=True)
+class Node:
+    name: str
+    inputs: tuple[str, ...]
+    # Riceve i valori degli ingressi nell'ordine di `inputs`.
+    compute: Callable[..., Any]
+    label: str = ""
+
+
+class DerivedGraph:
+    def __init__(self, nodes: Iterable[Node]) -> None:
+        self.nodes: dict[str, Node] = {}
+        for node in nodes:
+            if node.name in self.nodes:
+                raise ValueError(f"Nodo duplicato: {node.name}")
+            self.nodes[node.name] = node
+        self.inputs: tuple[str, ...] = tuple(
+            sorted({name for node in self.nodes.values() for name in node.inputs if name not in self.nodes})
+        )
+        self.order: tuple[str, ...] = self._topological_order()
+        dependents: dict[str, list[str]] = {name: [] for name in (*self.inputs, *self.order)}
+        for name in self.order:
+            for dep in self.nodes[name].inputs:
+                dependents[dep].append(name)
+        self.dependents: dict[str, tuple[str, ...]] = {k: tuple(v) for k, v in dependents.items()}
+
+    def _topological_order(self) -> tuple[str, ...]:
+        order: list[str] = []
+        state: dict[str, int] = {}  # 1 = in visita, 2 = fatto
+
+        def visit(name: str, path: tuple[str, ...]) -> None:
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"Ciclo nel grafo: {' -> '.join((*path, name))}")
+            state[name] = 1
+            for dep in self.nodes[name].inputs:
+                if dep in self.nodes:
+                    visit(dep, (*path, name))
+            state[name] = 2
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name, ())
+        return tuple(order)
+
+    def affected(self, changed: Iterable[str]) -> set[str]:
+        """Nodi a valle (transitivamente) degli ingressi o nodi indicati."""
+        out: set[str] = set()
+        stack = list(changed)
+        while stack:
+            for dep in self.dependents.get(stack.pop(), ()):
+                if dep not in out:
+                    out.add(dep)
+                    stack.append(dep)
+        return out
+
+    def describe(self) -> list[dict]:
+        """Righe per la vista di debug, in ordine topologico."""
+        return [
+            {
+                "name": name,
+                "label": self.nodes[name].label,
+                "inputs": list(self.nodes[name].inputs),
+                "dependents": list(self.dependents.get(name, ())),
+            }
+            for name in self.order
+        ]
+
+
+class DerivedState:
+    """Valori di un grafo per un personaggio."""
+
+    def __init__(self, graph: DerivedGraph, inputs: Mapping[str, Any] | None = None) -> None:
+        self.graph = graph
+        self.lock = threading.RLock()
+        self._values: dict[str, Any] = {}
+        self._versions: dict[str, int] = {}
+        # nodo -> versioni degli ingressi usate nell'ultimo calcolo
+        self._seen: dict[str, tuple[int, ...]] = {}
+        self.recomputes: dict[str, int] = {name: 0 for name in graph.order}
+        if inputs:
+            self.update(inputs)
+
+    def update(self, inputs: Mapping[str, Any]) -> set[str]:
+        """Aggiorna gli ingressi noti al grafo; ritorna quelli effettivamente cambiati."""
+        changed: set[str] = set()
+        with self.lock:
+            for name in self.graph.inputs:
+                value = inputs.get(name)
+                if name in self._versions and self._values.get(name) == value:
+                    continue
+                # Copia: il PG viene modificato sul posto, il confronto deve vedere il vecchio valore.
+                self._values[name] = copy.deepcopy(value)
+                self._versions[name] = self._versions.get(name, 0) + 1
+                changed.add(name)
+        return changed
+
+    def get(self, name: str) -> Any:
+        with self.lock:
+            node = self.graph.nodes.get(name)
+            if node is None:
+                return self._values.get(name)
+            args = [self.get(dep) for dep in node.inputs]
+            seen = tuple(self._versions.get(dep, 0) for dep in node.inputs)
+            if name in self._versions and self._seen.get(name) == seen:
+                return self._values[name]
+            value = node.compute(*args)
+            self.recomputes[name] += 1
+            self._seen[name] = seen
+            if name not in self._versions or self._values[name] != value:
+                self._values[name] = value
+                self._versions[name] = self._versions.get(name, 0) + 1
+            return self._values[name]
+
+    def values(self, names: Iterable[str] | None = None) -> dict[str, Any]:
+        with self.lock:
+            return {name: self.get(name) for name in (self.graph.order if names is None else names)}
+
+    def stats(self) -> list[dict]:
+        """describe() del grafo con contatori di ricalcolo e valori correnti."""
+        rows = self.graph.describe()
+        with self.lock:
+            for row in rows:
+                row["recomputes"] = self.recomputes.get(row["name"], 0)
+                row["value"] = self._values.get(row["name"])
+        return rows
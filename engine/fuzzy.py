@@ -0,0 +1,130 @@
+# engine/fuzzy.py
+"""Indice a trigrammi in memoria per la ricerca tollerante agli errori di battitura.
+
+I nomi (chiavi normalizzate di engine.search_keys) vengono spezzati in
+trigrammi; la similarita' e' il coefficiente di Jaccard fra i trigrammi della
+query e quelli del nome, oppure di una finestra di parole consecutive del nome
+lunga quanto la query ("invisibilta" trova "Invisibilita Superiore").
+
+Gli indici sono piccoli (qualche centinaio di nomi) e si ricostruiscono solo
+quando cambia il loro `stamp` (versione catalogo, mtime del DB privato...).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable, Iterable
+
+from .search_keys import search_key
+
+# Soglia minima di similarita' (0..1) e numero massimo di suggerimenti.
+FUZZY_THRESHOLD = float(os.getenv("DND_FUZZY_THRESHOLD") or 0.3)
+FUZZY_LIMIT = 10
+# La ricerca fuzzy entra in gioco se i risultati esatti/prefisso sono meno di cosi'.
+FUZZY_MIN_HITS = int(os.getenv("DND_FUZZY_MIN_HITS") or 3)
+
+
+def trigrams(key: str) -> frozenset[str]:
+    """Trigrammi di una chiave, parola per parola, con bordo di spazi (stile pg_trgm)."""
+    grams: set[str] = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+@dataclass(frozen=True, slots=True)
+class _Entry:
+    item: Hashable
+    words: tuple[str, ...]
+    grams: frozenset[str]
+
+
+@dataclass(slots=True)
+class TrigramIndex:
+    stamp: Any = None
+    entries: list[_Entry] = field(default_factory=list)
+    postings: dict[str, list[int]] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, names: Iterable[tuple[Hashable, str]], stamp: Any = None) -> "TrigramIndex":
+        """`names`: coppie (chiave dell'elemento, nome visualizzato)."""
+        index = cls(stamp=stamp)
+        for item, name in names:
+            key = search_key(name)
+            if not key:
+                continue
+            pos = len(index.entries)
+            entry = _Entry(item=item, words=tuple(key.split()), grams=trigrams(key))
+            index.entries.append(entry)
+            for gram in entry.grams:
+                index.postings.setdefault(gram, []).append(pos)
+        return index
+
+    def search(
+        self,
+        q: str,
+        limit: int = FUZZY_LIMIT,
+        threshold: float = FUZZY_THRESHOLD,
+    ) -> list[tuple[Hashable, float]]:
+        """Top-k (elemento, similarita') con similarita' >= threshold, dal migliore."""
+        key = search_key(q)
+        if not key:
+            return []
+        q_grams = trigrams(key)
+        q_words = len(key.split())
+
+        # Solo i nomi che condividono almeno un trigramma con la query.
+        shared: dict[int, int] = {}
+        for gram in q_grams:
+            for pos in self.postings.get(gram, ()):
+                shared[pos] = shared.get(pos, 0) + 1
+
+        scored: list[tuple[float, int]] = []
+        for pos, common in shared.items():
+            entry = self.entries[pos]
+            # Limite superiore: se neanche il caso migliore supera la soglia, salta.
+            if common / len(q_grams) < threshold:
+                continue
+            best = common / len(q_grams | entry.grams)
+            if len(entry.words) > q_words:
+                for start in range(len(entry.words) - q_words + 1):
+                    window = trigrams(" ".join(entry.words[start : start + q_words]))
+                    inter = len(q_grams & window)
+                    if inter:
+                        best = max(best, inter / len(q_grams | window))
+            if best >= threshold:
+                scored.append((best, pos))
+
+        # A parita' di punteggio vince il nome piu' corto (piu' vicino alla query).
+        scored.sort(key=lambda x: (-x[0], len(self.entries[x[1]].words), self.entries[x[1]].words))
+        return [(self.entries[pos].item, round(score, 3)) for score, pos in scored[:limit]]
+
+
+_LOCK = threading.Lock()
+_INDEXES: dict[str, TrigramIndex] = {}
+
+
+def cached_index(
+    name: str,
+    stamp: Any,
+    loader: Callable[[], Iterable[tuple[Hashable, str]]],
+) -> TrigramIndex:
+    """Indice `name` in cache; lo ricostruisce con `loader()` se lo stamp e' cambiato."""
+    current = _INDEXES.get(name)
+    if current is not None and current.stamp == stamp:
+        return current
+    with _LOCK:
+        current = _INDEXES.get(name)
+        if current is not None and current.stamp == stamp:
+            return current
+        current = TrigramIndex.build(loader(), stamp=stamp)
+        _INDEXES[name] = current
+        return current
+
+
+def clear_indexes() -> None:
+    with _LOCK:
+        _INDEXES.clear()
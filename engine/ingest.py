@@ -0,0 +1,165 @@
+# engine/ingest.py
+"""Campi derivati degli incantesimi, calcolati una volta all'import.
+
+Descrizione ripulita (residui OCR, durata ripetuta in testa), tempo di lancio
+e gittata in forma leggibile e testo delle componenti non cambiano mai per una
+riga: li salviamo nelle colonne DERIVED_COLUMNS di `spells` (SRD e sorgenti su
+file), cosi' get_by_id li legge senza regex sul percorso della richiesta.
+
+Le colonne valgono NULL finche' non sono calcolate; un trigger le azzera quando
+cambiano i campi sorgente e `refresh_spell_fields` (migrazione, ensure_schema,
+aggancio di una sorgente) riempie le righe mancanti.
+"""
+
+from __future__ import annotations
+
+import re
+import sqlite3
+from functools import lru_cache
+from typing import Any, Mapping
+
+DERIVED_COLUMNS = ("description_clean", "casting_time_display", "range_display", "components_text")
+SOURCE_COLUMNS = (
+    "description",
+    "duration_text",
+    "casting_time",
+    "range_text",
+    "components_v",
+    "components_s",
+    "components_m",
+    "material_text",
+)
+
+_ACTION_TYPE_MAP = {
+    "action": "1 azione",
+    "bonus_action": "1 azione bonus",
+    "bonus action": "1 azione bonus",
+    "reaction": "1 reazione",
+}
+
+
+def display_casting_time(value: str | None) -> str:
+    raw = (value or "").strip()
+    if not raw:
+        return "—"
+    return _ACTION_TYPE_MAP.get(raw.lower(), raw)
+
+
+def display_range(value: str | None) -> str:
+    raw = (value or "").strip()
+    if not raw:
+        return "—"
+    if raw.lower() in {"self", "incantatore"}:
+        return "Incantatore"
+    return raw
+
+
+_OCR_ORA_RE = re.compile(r"^\s*ora\s+(?=Per\b)", flags=re.IGNORECASE)
+
+
+@lru_cache(maxsize=512)
+def _duration_prefix_re(candidate: str) -> re.Pattern[str]:
+    return re.compile(rf"^\s*{re.escape(candidate)}(?:\s+|[:;,\-])+", flags=re.IGNORECASE)
+
+
+def clean_description(description: str | None, duration_text: str | None) -> str:
+    text = (description or "").strip()
+    if not text:
+        return "—"
+
+    # OCR residue: "ora Per ..."
+    text = _OCR_ORA_RE.sub("", text).strip()
+
+    duration = (duration_text or "").strip()
+    if duration:
+        candidates = [duration]
+        if "," in duration:
+            tail = duration.split(",")[-1].strip()
+            if tail:
+                candidates.append(tail)
+
+        for cand in candidates:
+            pat = _duration_prefix_re(cand)
+            if pat.match(text):
+                text = pat.sub("", text, count=1).strip()
+                break
+
+    return text or "—"
+
+
+def components_text(v: Any, s: Any, m: Any, material_text: str | None) -> str:
+    components = []
+    if v:
+        components.append("V")
+    if s:
+        components.append("S")
+    if m:
+        components.append("M")
+    text = ", ".join(components) if components else "-"
+    if m and material_text:
+        text = f"{text} ({material_text})"
+    return text
+
+
+def spell_fields(row: Mapping[str, Any]) -> dict[str, str]:
+    """Valori di DERIVED_COLUMNS per una riga con le SOURCE_COLUMNS."""
+    return {
+        "description_clean": clean_description(row["description"], row["duration_text"]),
+        "casting_time_display": display_casting_time(row["casting_time"]),
+        "range_display": display_range(row["range_text"]),
+        "components_text": components_text(
+            row["components_v"], row["components_s"], row["components_m"], row["material_text"]
+        ),
+    }
+
+
+def has_spell_fields(conn: sqlite3.Connection, schema: str = "main") -> bool:
+    cols = {r[1] for r in conn.execute(f"PRAGMA {schema}.table_info(spells)").fetchall()}
+    return all(col in cols for col in DERIVED_COLUMNS)
+
+
+def ensure_spell_fields(conn: sqlite3.Connection, schema: str = "main") -> None:
+    """Colonne derivate + trigger di reset nello schema indicato, poi backfill."""
+    cols = {r[1] for r in conn.execute(f"PRAGMA {schema}.table_info(spells)").fetchall()}
+    if not cols:
+        return
+    for col in DERIVED_COLUMNS:
+        if col not in cols:
+            conn.execute(f"ALTER TABLE {schema}.spells ADD COLUMN {col} TEXT")
+    reset = ", ".join(f"{col} = NULL" for col in DERIVED_COLUMNS)
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.trg_spells_derived_reset
+        AFTER UPDATE OF {", ".join(SOURCE_COLUMNS)} ON spells
+        BEGIN
+            UPDATE spells SET {reset} WHERE id = new.id;
+        END
+        """
+    )
+    refresh_spell_fields(conn, schema)
+
+
+def reset_spell_fields(conn: sqlite3.Connection, schema: str = "main") -> None:
+    """Azzera i campi derivati: il prossimo refresh li ricalcola tutti (regole cambiate)."""
+    if has_spell_fields(conn, schema):
+        conn.execute(f"UPDATE {schema}.spells SET {', '.join(f'{col} = NULL' for col in DERIVED_COLUMNS)}")
+
+
+def refresh_spell_fields(conn: sqlite3.Connection, schema: str = "main") -> int:
+    """Hook di import: calcola i campi derivati delle righe nuove o modificate."""
+    if not has_spell_fields(conn, schema):
+        return 0
+    rows = conn.execute(
+        f"SELECT id, {', '.join(SOURCE_COLUMNS)} FROM {schema}.spells WHERE description_clean IS NULL"
+    ).fetchall()
+    if not rows:
+        return 0
+    names = ("id",) + SOURCE_COLUMNS
+    assignments = ", ".join(f"{col} = ?" for col in DERIVED_COLUMNS)
+    values = []
+    for r in rows:
+        fields = spell_fields(dict(zip(names, r)))
+        values.append((*(fields[col] for col in DERIVED_COLUMNS), r[0]))
+    conn.executemany(f"UPDATE {schema}.spells SET {assignments} WHERE id = ?", values)
+    conn.commit()
+    return len(values)
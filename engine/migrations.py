@@ -0,0 +1,492 @@
+# engine/migrations.py
+"""Migrazioni schema numerate.
+
+Ogni step e' registrato in `schema_migrations` (e la versione piu' alta in
+`PRAGMA user_version`, cosi' il controllo sul percorso caldo e' una sola PRAGMA).
+Gli step devono restare idempotenti: un DB creato prima del runner non ha
+versioni registrate e li riesegue tutti.
+
+Ogni step contiene il suo SQL, congelato: non chiama gli helper di runtime
+(`create_spell_fts`, `ensure_search_keys`, ...), che possono cambiare in
+seguito e servono solo a riparare/allineare schemi esistenti. I backfill
+calcolati in Python (chiavi di ricerca, campi derivati) li completa
+`engine.db.ensure_schema` subito dopo il runner.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from typing import Callable
+
+
+
+Migration = tuple[int, str, Callable[[sqlite3.Connection], None]]
+
+SPELLS_KEYSET_INDEX = "idx_spells_level_name_id"
+
+
+def _ensure_column(conn: sqlite3.Connection, table: str, column: str, ddl: str) -> None:
+    """ALTER TABLE ADD COLUMN solo se la colonna manca (CREATE IF NOT EXISTS non la aggiunge)."""
+    cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table});").fetchall()]
+    if column not in cols:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {ddl};")
+
+
+def _m001_baseline(conn: sqlite3.Connection) -> None:
+    """Schema iniziale (idempotente)."""
+    conn.executescript(
+        """
+        -- =========================================
+        -- CHARACTERS (PG)
+        -- =========================================
+        CREATE TABLE IF NOT EXISTS characters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+            -- Chiave "umana" usata oggi dalla UI (dropdown).
+            name TEXT NOT NULL UNIQUE,
+
+            -- Chiave stabile futura (può restare NULL finché non la usiamo).
+            slug TEXT UNIQUE,
+
+            -- Stato completo del PG (flessibile: non ti costringe a migrazioni frequenti)
+            data_json TEXT NOT NULL,
+
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_characters_name ON characters(name);
+        CREATE INDEX IF NOT EXISTS idx_characters_slug ON characters(slug);
+
+
+        -- =========================================
+        -- SPELLS (catalogo)
+        -- Descrizioni parafrasate (no testo dei libri)
+        -- =========================================
+        CREATE TABLE IF NOT EXISTS spells (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+            slug TEXT NOT NULL UNIQUE,
+            name_it TEXT NOT NULL,
+            level INTEGER NOT NULL,              -- 0 = trucchetto
+            school TEXT NOT NULL,                -- es: "Invocazione", "Abiurazione"...
+            casting_time TEXT NOT NULL,          -- es: "1 azione", "1 reazione"...
+            range_text TEXT NOT NULL,            -- es: "18 m", "Sé", "Contatto"...
+            components_v INTEGER NOT NULL DEFAULT 0,
+            components_s INTEGER NOT NULL DEFAULT 0,
+            components_m INTEGER NOT NULL DEFAULT 0,
+            material_text TEXT,                  -- testo libero (se M=1)
+            duration_text TEXT NOT NULL,         -- es: "Istantanea", "1 minuto"...
+            concentration INTEGER NOT NULL DEFAULT 0,
+            ritual INTEGER NOT NULL DEFAULT 0,
+
+            description TEXT NOT NULL,           -- parafrasi
+            at_higher_levels TEXT,               -- parafrasi, opzionale
+            source TEXT,                         -- es: "PHB", "Tasha"
+
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_spells_name_it ON spells(name_it);
+        CREATE INDEX IF NOT EXISTS idx_spells_level ON spells(level);
+        CREATE INDEX IF NOT EXISTS idx_spells_school ON spells(school);
+
+
+        -- Classi (per mapping spell <-> classi)
+        CREATE TABLE IF NOT EXISTS classes (
+            code TEXT PRIMARY KEY,   -- es: "wizard", "cleric", "druid"...
+            name_it TEXT NOT NULL
+        );
+
+        -- Dettagli classi (SRD)
+        -- Nota: teniamo JSON per liste/choice così evitiamo migrazioni frequenti.
+        CREATE TABLE IF NOT EXISTS class_details (
+            class_code TEXT PRIMARY KEY,
+            hit_die INTEGER NOT NULL,
+
+            armor_proficiencies_json TEXT,
+            weapon_proficiencies_json TEXT,
+            tool_proficiencies_json TEXT,
+            saving_throws_json TEXT,
+            skill_choices_json TEXT,
+            starting_equipment_json TEXT,
+
+            spellcasting_ability TEXT,   -- es: "car" per Warlock
+            spellcasting_type TEXT,      -- es: "pact", "full", "half", "none"
+
+            description TEXT,
+            source TEXT,
+
+            FOREIGN KEY (class_code) REFERENCES classes(code) ON DELETE CASCADE
+        );
+
+        -- Progressione per livello (per automatismi UI)
+        CREATE TABLE IF NOT EXISTS class_levels (
+            class_code TEXT NOT NULL,
+            level INTEGER NOT NULL,
+
+            prof_bonus INTEGER NOT NULL,
+            features_json TEXT,          -- lista di feature_key (ordine importante)
+
+            -- campi comuni (NULL se non applicabili)
+            cantrips_known INTEGER,
+            spells_known INTEGER,
+            -- Per Warlock (Magia del Patto): numero slot e loro livello
+            spell_slots INTEGER,
+            slot_level INTEGER,
+
+            -- Per incantatori "normali": lista slot per livello [1..9]
+            spell_slots_json TEXT,
+            invocations_known INTEGER,
+
+            PRIMARY KEY (class_code, level),
+            FOREIGN KEY (class_code) REFERENCES classes(code) ON DELETE CASCADE
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_class_levels_code ON class_levels(class_code);
+
+        -- Dettaglio privilegi/feature (testo SRD o parafrasi)
+        CREATE TABLE IF NOT EXISTS class_features (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            class_code TEXT NOT NULL,
+            feature_key TEXT NOT NULL,
+            level INTEGER NOT NULL,
+            name_it TEXT NOT NULL,
+            description TEXT,
+            source TEXT,
+
+            UNIQUE (class_code, feature_key),
+            FOREIGN KEY (class_code) REFERENCES classes(code) ON DELETE CASCADE
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_class_features_code ON class_features(class_code);
+
+        -- Molti-a-molti: quali classi hanno accesso a quali incantesimi
+        CREATE TABLE IF NOT EXISTS spell_classes (
+            spell_id INTEGER NOT NULL,
+            class_code TEXT NOT NULL,
+
+            PRIMARY KEY (spell_id, class_code),
+            FOREIGN KEY (spell_id) REFERENCES spells(id) ON DELETE CASCADE,
+            FOREIGN KEY (class_code) REFERENCES classes(code) ON DELETE CASCADE
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_spell_classes_class ON spell_classes(class_code);
+        CREATE INDEX IF NOT EXISTS idx_spell_classes_class_spell ON spell_classes(class_code, spell_id);
+
+
+        -- =========================================
+        -- MOSTERS (bestiario)
+        -- =========================================
+        CREATE TABLE IF NOT EXISTS monsters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+            slug TEXT NOT NULL UNIQUE,
+            name_it TEXT NOT NULL,
+            cr REAL NOT NULL,                  -- GS (Challenge Rating)
+            size TEXT NOT NULL,                -- es: "Piccola", "Media"...
+            type TEXT NOT NULL,                -- es: "Umanoide", "Bestia"...
+            alignment TEXT,                    -- testo libero
+
+            ac INTEGER,                        -- opzionale
+            hp INTEGER,                        -- opzionale
+            speed_text TEXT,                   -- testo libero (es: "9 m, volare 18 m")
+
+            senses_text TEXT,
+            languages_text TEXT,
+
+            -- Campi “semi-strutturati” in JSON (azioni/abilità ecc.)
+            stats_json TEXT,                   -- For/Des/Con/Int/Sag/Car
+            traits_json TEXT,
+            actions_json TEXT,
+            reactions_json TEXT,
+            legendary_actions_json TEXT,
+
+            description TEXT,                  -- parafrasi/riassunto (opzionale)
+            source TEXT,
+
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_monsters_name_it ON monsters(name_it);
+        CREATE INDEX IF NOT EXISTS idx_monsters_cr ON monsters(cr);
+        CREATE INDEX IF NOT EXISTS idx_monsters_type ON monsters(type);
+
+
+        -- Tag (riutilizzabili)
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        );
+
+        CREATE TABLE IF NOT EXISTS monster_tags (
+            monster_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+
+            PRIMARY KEY (monster_id, tag_id),
+            FOREIGN KEY (monster_id) REFERENCES monsters(id) ON DELETE CASCADE,
+            FOREIGN KEY (tag_id) REFERENCES tags(id) ON DELETE CASCADE
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_monster_tags_tag ON monster_tags(tag_id);
+
+
+        -- =========================================
+        -- RELAZIONI PG <-> INCANTESIMI
+        -- (serve dopo, ma meglio averla pronta)
+        -- =========================================
+        CREATE TABLE IF NOT EXISTS character_spells (
+            character_id INTEGER NOT NULL,
+            spell_id INTEGER NOT NULL,
+
+            -- known / prepared / always / pact ecc. (stringa, semplice)
+            status TEXT NOT NULL,
+
+            -- opzionale: da quale classe/sottoclasse arriva (se multiclasse)
+            source_class_code TEXT,
+
+            notes TEXT,
+
+            PRIMARY KEY (character_id, spell_id, status),
+            FOREIGN KEY (character_id) REFERENCES characters(id) ON DELETE CASCADE,
+            FOREIGN KEY (spell_id) REFERENCES spells(id) ON DELETE CASCADE,
+            FOREIGN KEY (source_class_code) REFERENCES classes(code) ON DELETE SET NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_character_spells_character ON character_spells(character_id);
+        CREATE INDEX IF NOT EXISTS idx_character_spells_spell ON character_spells(spell_id);
+        """
+    )
+
+
+def _m002_class_levels_spell_slots_json(conn: sqlite3.Connection) -> None:
+    _ensure_column(conn, "class_levels", "spell_slots_json", "spell_slots_json TEXT")
+
+
+# Tabelle di catalogo (SRD): ogni modifica incrementa catalog_meta.version,
+# usata dalle cache in memoria per capire quando ricaricare.
+CATALOG_TABLES = (
+    "classes",
+    "class_details",
+    "class_levels",
+    "class_features",
+    "spells",
+    "spell_classes",
+    "monsters",
+)
+
+
+def _m003_catalog_meta(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    conn.execute("INSERT OR IGNORE INTO catalog_meta (id, version) VALUES (1, 0)")
+    for table in CATALOG_TABLES:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_catalog_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+                END
+                """
+            )
+
+
+def _m004_spells_fts(conn: sqlite3.Connection) -> None:
+    try:
+        conn.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS spells_fts USING fts5(
+                name_it, description, at_higher_levels,
+                content='spells',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+            """
+        )
+    except sqlite3.OperationalError as exc:
+        # SQLite senza FTS5: la ricerca resta su LIKE.
+        if "fts5" not in str(exc).lower():
+            raise
+        return
+    conn.executescript(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_spells_fts_ai AFTER INSERT ON spells
+        BEGIN
+            INSERT INTO spells_fts (rowid, name_it, description, at_higher_levels)
+            VALUES (new.id, new.name_it, new.description, new.at_higher_levels);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_spells_fts_ad AFTER DELETE ON spells
+        BEGIN
+            INSERT INTO spells_fts (spells_fts, rowid, name_it, description, at_higher_levels)
+            VALUES ('delete', old.id, old.name_it, old.description, old.at_higher_levels);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_spells_fts_au
+        AFTER UPDATE OF name_it, description, at_higher_levels ON spells
+        BEGIN
+            INSERT INTO spells_fts (spells_fts, rowid, name_it, description, at_higher_levels)
+            VALUES ('delete', old.id, old.name_it, old.description, old.at_higher_levels);
+            INSERT INTO spells_fts (rowid, name_it, description, at_higher_levels)
+            VALUES (new.id, new.name_it, new.description, new.at_higher_levels);
+        END;
+
+        INSERT INTO spells_fts (spells_fts) VALUES ('rebuild');
+        """
+    )
+
+
+def _m005_name_keys(conn: sqlite3.Connection) -> None:
+    # Le chiavi (normalizzazione Unicode) si calcolano in Python: restano NULL
+    # qui e le completa refresh_search_keys in ensure_schema.
+    for table, source in (("spells", "name_it"), ("monsters", "name_it")):
+        _ensure_column(conn, table, "name_key", "name_key TEXT")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_name_key ON {table}(name_key)")
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_name_key_reset
+            AFTER UPDATE OF {source} ON {table}
+            BEGIN
+                UPDATE {table} SET name_key = NULL WHERE id = new.id;
+            END
+            """
+        )
+
+
+# Bit delle classi al momento della migrazione 006 (engine.class_mask.CLASS_BITS).
+_M006_CLASS_BIT_CASE = (
+    "CASE mc.class_code"
+    " WHEN 'barbarian' THEN 1 WHEN 'bard' THEN 2 WHEN 'cleric' THEN 4 WHEN 'druid' THEN 8"
+    " WHEN 'fighter' THEN 16 WHEN 'monk' THEN 32 WHEN 'paladin' THEN 64 WHEN 'ranger' THEN 128"
+    " WHEN 'rogue' THEN 256 WHEN 'sorcerer' THEN 512 WHEN 'warlock' THEN 1024 WHEN 'wizard' THEN 2048"
+    " ELSE 0 END"
+)
+
+
+def _m006_spells_class_mask(conn: sqlite3.Connection) -> None:
+    _ensure_column(conn, "spells", "class_mask", "class_mask INTEGER NOT NULL DEFAULT 0")
+
+    def mask_of(spell_id: str) -> str:
+        return (
+            f"(SELECT coalesce(sum(DISTINCT {_M006_CLASS_BIT_CASE}), 0) "
+            f"FROM spell_classes mc WHERE mc.spell_id = {spell_id})"
+        )
+
+    for event, refs in (("INSERT", ("new",)), ("DELETE", ("old",)), ("UPDATE", ("old", "new"))):
+        body = "\n".join(
+            f"UPDATE spells SET class_mask = {mask_of(f'{ref}.spell_id')} WHERE id = {ref}.spell_id;"
+            for ref in refs
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_spell_classes_{event.lower()}_class_mask
+            AFTER {event} ON spell_classes
+            BEGIN
+                {body}
+            END
+            """
+        )
+    conn.execute(f"UPDATE spells SET class_mask = {mask_of('spells.id')}")
+
+
+def _m007_spells_keyset_index(conn: sqlite3.Connection) -> None:
+    # Ordine di search_spells (level, name_it, id): la paginazione keyset e' una range scan.
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {SPELLS_KEYSET_INDEX} ON spells(level, name_it, id)")
+
+
+def _m008_spells_derived_fields(conn: sqlite3.Connection) -> None:
+    # Descrizione ripulita e campi di visualizzazione: li calcola
+    # refresh_spell_fields (engine.ingest) in ensure_schema, qui solo colonne e reset.
+    for col in ("description_clean", "casting_time_display", "range_display", "components_text"):
+        _ensure_column(conn, "spells", col, f"{col} TEXT")
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_spells_derived_reset
+        AFTER UPDATE OF description, duration_text, casting_time, range_text,
+            components_v, components_s, components_m, material_text ON spells
+        BEGIN
+            UPDATE spells SET
+                description_clean = NULL,
+                casting_time_display = NULL,
+                range_display = NULL,
+                components_text = NULL
+            WHERE id = new.id;
+        END
+        """
+    )
+
+
+def _m009_sessions(conn: sqlite3.Connection) -> None:
+    # Sessioni Flask lato server (engine.sessions): nel cookie resta solo il sid.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            sid TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at)")
+
+
+MIGRATIONS: list[Migration] = [
+    (1, "baseline", _m001_baseline),
+    (2, "class_levels.spell_slots_json", _m002_class_levels_spell_slots_json),
+    (3, "catalog_meta", _m003_catalog_meta),
+    (4, "spells_fts", _m004_spells_fts),
+    (5, "spells/monsters name_key", _m005_name_keys),
+    (6, "spells.class_mask", _m006_spells_class_mask),
+    (7, "spells keyset index", _m007_spells_keyset_index),
+    (8, "spells derived fields", _m008_spells_derived_fields),
+    (9, "sessions", _m009_sessions),
+]
+
+LATEST_VERSION = max(version for version, _, _ in MIGRATIONS)
+
+
+def schema_version(conn: sqlite3.Connection, schema: str = "main") -> int:
+    return int(conn.execute(f"PRAGMA {schema}.user_version").fetchone()[0] or 0)
+
+
+def applied_versions(conn: sqlite3.Connection) -> set[int]:
+    rows = conn.execute("SELECT version FROM schema_migrations").fetchall()
+    return {int(r[0]) for r in rows}
+
+
+def migrate(conn: sqlite3.Connection) -> list[int]:
+    """Applica gli step mancanti in ordine e ritorna le versioni applicate."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+        """
+    )
+    conn.commit()
+
+    done = applied_versions(conn)
+    applied: list[int] = []
+    for version, _name, step in MIGRATIONS:
+        if version in done:
+            continue
+        step(conn)
+        conn.execute("INSERT OR IGNORE INTO schema_migrations (version) VALUES (?)", (version,))
+        conn.commit()
+        applied.append(version)
+
+    conn.execute(f"PRAGMA user_version = {int(LATEST_VERSION)}")
+    conn.commit()
+    return applied
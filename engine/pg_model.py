@@ -0,0 +1,183 @@
+# engine/pg_model.py
+"""Modello tipizzato del PG, validato una volta ai confini.
+
+In sessione e su DB il PG resta il dict JSON di sempre (caratteristiche in
+`stats_base`, mappe degli slot con chiavi stringa "1".."9"). `Character.from_pg`
+legge e limita una volta livello, caratteristiche (array in ordine `STATS`) e
+slot (array a dimensione fissa): l'app lo costruisce quando carica il PG della
+richiesta, all'import/caricamento e dopo il salvataggio del form. Gli handler
+lavorano sugli array e `write_to` riporta la stessa forma JSON nel dict.
+"""
+
+from __future__ import annotations
+
+from array import array
+from typing import Any
+
+from .rules import STATS
+
+SLOT_LEVELS = 9
+SLOT_MAX = 99
+STAT_MIN = 1
+STAT_MAX = 30
+STAT_DEFAULT = 10
+LEVEL_MAX = 20
+
+
+def clamp_int(v: Any, default: int, min_v: int | None = None, max_v: int | None = None) -> int:
+    try:
+        x = int(v)
+    except Exception:
+        x = default
+    if min_v is not None:
+        x = max(min_v, x)
+    if max_v is not None:
+        x = min(max_v, x)
+    return x
+
+
+def _as_dict(value: Any) -> dict:
+    return value if isinstance(value, dict) else {}
+
+
+class SpellSlots:
+    """Slot standard (indice 0 = livello 1) e slot del patto, sempre entro i limiti."""
+
+    __slots__ = ("max", "current", "pact_max", "pact_current", "pact_level")
+
+    def __init__(
+        self,
+        slot_max: array | None = None,
+        slot_current: array | None = None,
+        pact_max: int = 0,
+        pact_current: int = 0,
+        pact_level: int = 0,
+    ) -> None:
+        self.max = slot_max if slot_max is not None else array("H", bytes(2 * SLOT_LEVELS))
+        self.current = slot_current if slot_current is not None else array("H", self.max)
+        self.pact_max = pact_max
+        self.pact_current = pact_current
+        self.pact_level = pact_level
+
+    @classmethod
+    def from_pg(cls, pg: dict) -> "SpellSlots":
+        max_map = _as_dict(pg.get("spell_slots_max"))
+        cur_map = _as_dict(pg.get("spell_slots_current"))
+        max_arr = array("H")
+        cur_arr = array("H")
+        for lv in range(1, SLOT_LEVELS + 1):
+            key = str(lv)
+            max_v = clamp_int(max_map.get(key, 0), 0, 0, SLOT_MAX)
+            max_arr.append(max_v)
+            cur_arr.append(clamp_int(cur_map.get(key, max_v), max_v, 0, max_v))
+        pact_max = clamp_int(pg.get("pact_slots_max"), 0, 0, SLOT_MAX)
+        return cls(
+            slot_max=max_arr,
+            slot_current=cur_arr,
+            pact_max=pact_max,
+            pact_current=clamp_int(pg.get("pact_slots_current"), pact_max, 0, pact_max),
+            pact_level=clamp_int(pg.get("pact_slot_level"), 0, 0, SLOT_LEVELS),
+        )
+
+    def to_pg(self) -> dict:
+        return {
+            "spell_slots_max": {str(lv): int(self.max[lv - 1]) for lv in range(1, SLOT_LEVELS + 1)},
+            "spell_slots_current": {str(lv): int(self.current[lv - 1]) for lv in range(1, SLOT_LEVELS + 1)},
+            "pact_slots_max": int(self.pact_max),
+            "pact_slots_current": int(self.pact_current),
+            "pact_slot_level": int(self.pact_level),
+        }
+
+    def write_to(self, pg: dict) -> None:
+        pg.update(self.to_pg())
+
+    def rows(self) -> list[dict[str, int]]:
+        """Livelli con almeno uno slot: righe del widget."""
+        return [
+            {"level": lv, "current": int(self.current[lv - 1]), "max": int(self.max[lv - 1])}
+            for lv in range(1, SLOT_LEVELS + 1)
+            if self.max[lv - 1] > 0
+        ]
+
+    def adjust(self, level: int, delta: int) -> None:
+        idx = level - 1
+        if 0 <= idx < SLOT_LEVELS and self.max[idx] > 0:
+            self.current[idx] = min(self.max[idx], max(0, self.current[idx] + delta))
+
+    def adjust_pact(self, delta: int) -> None:
+        self.pact_current = min(self.pact_max, max(0, self.pact_current + delta))
+
+    def long_rest(self) -> None:
+        self.current = array("H", self.max)
+        self.pact_current = self.pact_max
+
+    def short_rest(self) -> None:
+        self.pact_current = self.pact_max
+
+    def use_standard(self, level: int) -> bool:
+        idx = level - 1
+        if 0 <= idx < SLOT_LEVELS and self.current[idx] > 0:
+            self.current[idx] -= 1
+            return True
+        return False
+
+    def use_pact(self) -> bool:
+        if self.pact_current > 0:
+            self.pact_current -= 1
+            return True
+        return False
+
+
+class Character:
+    """Campi tipizzati del PG; il resto del dict non passa di qui.
+
+    `nome`, `classe` e `level` sono in sola lettura (il form li scrive nel dict
+    e il modello viene ricostruito al salvataggio); caratteristiche e slot si
+    modificano sul modello e `write_to` li riporta nel dict.
+    """
+
+    __slots__ = ("nome", "classe", "level", "stats", "slots")
+
+    def __init__(self, nome: str, classe: str, level: int, stats: array, slots: SpellSlots) -> None:
+        self.nome = nome
+        self.classe = classe
+        self.level = level
+        self.stats = stats
+        self.slots = slots
+
+    @classmethod
+    def from_pg(cls, pg: dict) -> "Character":
+        base = _as_dict(pg.get("stats_base"))
+        return cls(
+            nome=str(pg.get("nome") or ""),
+            classe=str(pg.get("classe") or ""),
+            level=clamp_int(pg.get("level"), 1, 1, LEVEL_MAX),
+            stats=array("B", (clamp_int(base.get(s), STAT_DEFAULT, STAT_MIN, STAT_MAX) for s in STATS)),
+            slots=SpellSlots.from_pg(pg),
+        )
+
+    def stat(self, code: str) -> int:
+        return int(self.stats[STATS.index(code)])
+
+    def set_stat(self, code: str, value: Any) -> int:
+        """Assegna una caratteristica limitata a 1..30 (valore non numerico: resta quella attuale)."""
+        idx = STATS.index(code)
+        self.stats[idx] = clamp_int(value, self.stats[idx], STAT_MIN, STAT_MAX)
+        return int(self.stats[idx])
+
+    def stats_base(self) -> dict[str, int]:
+        return {s: int(v) for s, v in zip(STATS, self.stats)}
+
+    def to_pg(self) -> dict:
+        return {
+            "nome": self.nome,
+            "classe": self.classe,
+            "level": self.level,
+            "stats_base": self.stats_base(),
+            **self.slots.to_pg(),
+        }
+
+    def write_to(self, pg: dict) -> None:
+        """Riporta nel dict i campi modificabili sul modello (caratteristiche e slot)."""
+        pg["stats_base"] = self.stats_base()
+        self.slots.write_to(pg)
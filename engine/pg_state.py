@@ -0,0 +1,98 @@
+# engine/pg_state.py
+"""Stato del PG in sessione: versione del contenuto e ingressi degli slot.
+
+Accanto a `session["pg"]` teniamo `session[STATE_KEY]`:
+- `version`: digest del PG subito dopo l'ultima normalizzazione (in lettura o
+  in `save_pg`). Se il payload letto ha ancora quel digest, normalize_pg non
+  serve (e' gia' in forma), nemmeno nella GET che segue un salvataggio;
+- `slots`: digest dei campi che entrano in recalc_spell_slots (SLOT_FIELDS)
+  all'ultimo ricalcolo degli slot.
+
+Per richiesta si calcola un solo digest dell'intero PG, in lettura: serve
+perche' il PG puo' essere modificato sul posto e salvato dalla sessione senza
+passare da save_pg. `changed()` ne calcola un secondo solo al salvataggio, e
+il digest degli slot si calcola solo quando si normalizza o si salva.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Iterable
+
+from .pg_model import Character
+
+STATE_KEY = "pg_state"
+
+# Ingressi di recalc_spell_slots (classi e livelli, slot correnti da limitare)
+# e i campi che riscrive: un valore modificato a mano va ricalcolato.
+SLOT_FIELDS = frozenset(
+    {
+        "classe",
+        "level",
+        "classes",
+        "multiclass",
+        "spell_classes",
+        "spell_slots_max",
+        "spell_slots_current",
+        "pact_slots_max",
+        "pact_slots_current",
+        "pact_slot_level",
+    }
+)
+
+
+def digest(value: Any) -> str:
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def fields_digest(pg: dict, fields: Iterable[str]) -> str:
+    return digest({key: pg.get(key) for key in sorted(fields)})
+
+
+class PGState:
+    """PG della richiesta con lo stato letto dalla sessione."""
+
+    __slots__ = ("data", "version", "slots", "character")
+
+    def __init__(self, data: dict, version: str | None = None, slots: str | None = None) -> None:
+        self.data = data
+        # Digest dell'ultima forma normalizzata (None: da normalizzare).
+        self.version = version
+        self.slots = slots
+        # Modello tipizzato di `data`, costruito da _pg_state e da save_pg.
+        self.character: Character | None = None
+
+    @classmethod
+    def load(cls, raw: Any, meta: Any) -> "PGState":
+        meta = meta if isinstance(meta, dict) else {}
+        data = raw if isinstance(raw, dict) else {}
+        version = meta.get("version") if isinstance(meta.get("version"), str) else None
+        slots = meta.get("slots") if isinstance(meta.get("slots"), str) else None
+        state = cls(data, version, slots)
+        if version is not None and version != digest(data):
+            state.version = None
+        return state
+
+    @property
+    def normalized(self) -> bool:
+        return self.version is not None
+
+    def changed(self) -> bool:
+        """True se il PG e' diverso dall'ultima forma normalizzata (o non lo e' mai stato)."""
+        return self.version is None or digest(self.data) != self.version
+
+    def slots_stale(self) -> bool:
+        return self.slots != fields_digest(self.data, SLOT_FIELDS)
+
+    def slots_synced(self) -> None:
+        self.slots = fields_digest(self.data, SLOT_FIELDS)
+
+    def mark_normalized(self) -> dict:
+        """Dopo normalize_pg: nuova versione; ritorna i metadati per la sessione."""
+        self.version = digest(self.data)
+        return self.meta()
+
+    def meta(self) -> dict:
+        return {"version": self.version, "slots": self.slots}
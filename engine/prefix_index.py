@@ -0,0 +1,94 @@
+# engine/prefix_index.py
+"""Indice ordinato per completamento dei nomi (typeahead di /api/suggest).
+
+Ogni nome entra con la sua chiave normalizzata (engine.search_keys) e con le
+chiavi che partono da ciascuna parola successiva: "fuo" completa sia "Fuoco
+Fatuo" sia "Palla di Fuoco". La ricerca e' un bisect sull'array ordinato; i
+nomi che iniziano con la query vengono prima di quelli trovati a meta' nome.
+
+Come gli indici di engine.fuzzy, si ricostruisce solo quando cambia lo stamp.
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Iterable
+
+from .search_keys import search_key
+
+SUGGEST_LIMIT = 10
+
+
+@dataclass(frozen=True, slots=True)
+class PrefixIndex:
+    stamp: Any
+    # (chiave da una parola in poi, posizione della parola, chiave completa, posizione in `items`)
+    keys: tuple[tuple[str, int, str, int], ...]
+    items: tuple[tuple[Hashable, str], ...]
+
+    @classmethod
+    def build(cls, names: Iterable[tuple[Hashable, str]], stamp: Any = None) -> "PrefixIndex":
+        """`names`: coppie (chiave dell'elemento, nome visualizzato)."""
+        items: list[tuple[Hashable, str]] = []
+        keys: list[tuple[str, int, str, int]] = []
+        for item, name in names:
+            full = search_key(name)
+            if not full:
+                continue
+            pos = len(items)
+            items.append((item, name))
+            words = full.split()
+            for start in range(len(words)):
+                keys.append((" ".join(words[start:]), start, full, pos))
+        keys.sort()
+        return cls(stamp=stamp, keys=tuple(keys), items=tuple(items))
+
+    def complete(self, q: str, limit: int = SUGGEST_LIMIT) -> list[tuple[Hashable, str]]:
+        """Fino a `limit` (elemento, nome): prima i nomi che iniziano con `q`, poi gli altri."""
+        key = search_key(q)
+        if not key or limit <= 0:
+            return []
+        start = bisect.bisect_left(self.keys, (key,))
+        matches: list[tuple[int, str, int]] = []
+        for word_key, word_pos, full, pos in self.keys[start:]:
+            if not word_key.startswith(key):
+                break
+            matches.append((0 if word_pos == 0 else 1, full, pos))
+        out: list[tuple[Hashable, str]] = []
+        seen: set[int] = set()
+        for _rank, _full, pos in sorted(matches):
+            if pos not in seen:
+                seen.add(pos)
+                out.append(self.items[pos])
+                if len(out) >= limit:
+                    break
+        return out
+
+
+_LOCK = threading.Lock()
+_INDEXES: dict[str, PrefixIndex] = {}
+
+
+def cached_prefix_index(
+    name: str,
+    stamp: Any,
+    loader: Callable[[], Iterable[tuple[Hashable, str]]],
+) -> PrefixIndex:
+    """Indice `name` in cache; lo ricostruisce con `loader()` se lo stamp e' cambiato."""
+    current = _INDEXES.get(name)
+    if current is not None and current.stamp == stamp:
+        return current
+    with _LOCK:
+        current = _INDEXES.get(name)
+        if current is not None and current.stamp == stamp:
+            return current
+        current = PrefixIndex.build(loader(), stamp=stamp)
+        _INDEXES[name] = current
+        return current
+
+
+def clear_prefix_indexes() -> None:
+    with _LOCK:
+        _INDEXES.clear()
@@ -0,0 +1,212 @@
+# engine/rules_registry.py
+"""Registro in memoria delle regole di classe (SRD).
+
+Carica una sola volta `classes`, `class_details`, `class_levels` e
+`class_features` in strutture immutabili indicizzate per codice classe e per
+nome italiano. Il registro viene ricaricato solo quando cambia
+`engine.db.catalog_version()`, quindi il calcolo della scheda non fa I/O.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Mapping
+
+from .db import catalog_schema, catalog_version, connect, ensure_schema
+
+
+@dataclass(frozen=True, slots=True)
+class ClassLevel:
+    level: int
+    prof_bonus: int
+    features: tuple[str, ...] = ()
+    cantrips_known: int | None = None
+    spells_known: int | None = None
+    spell_slots: int | None = None
+    slot_level: int | None = None
+    spell_slots_by_level: tuple[int, ...] = ()
+    invocations_known: int | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class ClassFeature:
+    feature_key: str
+    level: int
+    name_it: str
+    description: str | None = None
+    source: str | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class ClassRules:
+    code: str
+    name_it: str
+    hit_die: int | None = None
+    saving_throws: tuple[str, ...] | None = None
+    skill_choose: int | None = None
+    skill_from: tuple[str, ...] | None = None
+    armor_proficiencies: tuple = ()
+    weapon_proficiencies: tuple = ()
+    tool_proficiencies: tuple = ()
+    spellcasting_ability: str | None = None
+    spellcasting_type: str | None = None
+    levels: Mapping[int, ClassLevel] = field(default_factory=lambda: MappingProxyType({}))
+    features: tuple[ClassFeature, ...] = ()
+
+    def skill_choices(self) -> dict | None:
+        """Scelte abilita' nel formato storico {"choose": n, "from": [...]}."""
+        if self.skill_choose is None and self.skill_from is None:
+            return None
+        out: dict[str, Any] = {}
+        if self.skill_choose is not None:
+            out["choose"] = self.skill_choose
+        if self.skill_from is not None:
+            out["from"] = list(self.skill_from)
+        return out
+
+    def level(self, level: int) -> ClassLevel | None:
+        return self.levels.get(int(level))
+
+
+@dataclass(frozen=True, slots=True)
+class RulesRegistry:
+    version: Any = None
+    by_code: Mapping[str, ClassRules] = field(default_factory=lambda: MappingProxyType({}))
+    by_name: Mapping[str, ClassRules] = field(default_factory=lambda: MappingProxyType({}))
+
+    def get(self, key: str | None) -> ClassRules | None:
+        """Cerca per codice ("wizard") o per nome italiano ("Mago")."""
+        if not key:
+            return None
+        raw = key.strip()
+        return self.by_code.get(raw) or self.by_name.get(raw) or self.by_code.get(raw.lower())
+
+    def code_for_name(self, name_it: str | None) -> str | None:
+        item = self.by_name.get((name_it or "").strip())
+        return item.code if item else None
+
+
+def _json_value(raw: Any) -> Any:
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_tuple(raw: Any) -> tuple:
+    data = _json_value(raw)
+    return tuple(data) if isinstance(data, list) else ()
+
+
+def _opt_int(value: Any) -> int | None:
+    return int(value) if value is not None else None
+
+
+def _load_registry(version: Any) -> RulesRegistry:
+    with connect() as conn:
+        ensure_schema(conn)
+        cat = catalog_schema(conn)
+        class_rows = conn.execute(f"SELECT code, name_it FROM {cat}.classes").fetchall()
+        detail_rows = {r["class_code"]: r for r in conn.execute(f"SELECT * FROM {cat}.class_details").fetchall()}
+        level_rows = conn.execute(f"SELECT * FROM {cat}.class_levels ORDER BY class_code, level").fetchall()
+        feature_rows = conn.execute(
+            "SELECT class_code, feature_key, level, name_it, description, source "
+            f"FROM {cat}.class_features ORDER BY class_code, level, id"
+        ).fetchall()
+
+    levels_by_code: dict[str, dict[int, ClassLevel]] = {}
+    for r in level_rows:
+        slots = _json_value(r["spell_slots_json"])
+        levels_by_code.setdefault(r["class_code"], {})[int(r["level"])] = ClassLevel(
+            level=int(r["level"]),
+            prof_bonus=int(r["prof_bonus"]),
+            features=tuple(str(x) for x in (_json_value(r["features_json"]) or [])),
+            cantrips_known=_opt_int(r["cantrips_known"]),
+            spells_known=_opt_int(r["spells_known"]),
+            spell_slots=_opt_int(r["spell_slots"]),
+            slot_level=_opt_int(r["slot_level"]),
+            spell_slots_by_level=tuple(int(x) for x in slots) if isinstance(slots, list) else (),
+            invocations_known=_opt_int(r["invocations_known"]),
+        )
+
+    features_by_code: dict[str, list[ClassFeature]] = {}
+    for r in feature_rows:
+        features_by_code.setdefault(r["class_code"], []).append(
+            ClassFeature(
+                feature_key=str(r["feature_key"]),
+                level=int(r["level"]),
+                name_it=str(r["name_it"]),
+                description=r["description"],
+                source=r["source"],
+            )
+        )
+
+    by_code: dict[str, ClassRules] = {}
+    by_name: dict[str, ClassRules] = {}
+    for r in class_rows:
+        code = str(r["code"])
+        detail = detail_rows.get(code)
+        saves = _json_value(detail["saving_throws_json"]) if detail else None
+        skills = _json_value(detail["skill_choices_json"]) if detail else None
+        if not isinstance(skills, dict):
+            skills = {}
+        skill_from = skills.get("from")
+        item = ClassRules(
+            code=code,
+            name_it=str(r["name_it"]),
+            hit_die=_opt_int(detail["hit_die"]) if detail else None,
+            saving_throws=tuple(str(x) for x in saves) if isinstance(saves, list) else None,
+            skill_choose=_opt_int(skills.get("choose")),
+            skill_from=tuple(str(x) for x in skill_from) if isinstance(skill_from, list) else None,
+            armor_proficiencies=_as_tuple(detail["armor_proficiencies_json"]) if detail else (),
+            weapon_proficiencies=_as_tuple(detail["weapon_proficiencies_json"]) if detail else (),
+            tool_proficiencies=_as_tuple(detail["tool_proficiencies_json"]) if detail else (),
+            spellcasting_ability=detail["spellcasting_ability"] if detail else None,
+            spellcasting_type=detail["spellcasting_type"] if detail else None,
+            levels=MappingProxyType(levels_by_code.get(code, {})),
+            features=tuple(features_by_code.get(code, [])),
+        )
+        by_code[code] = item
+        by_name[item.name_it] = item
+
+    return RulesRegistry(
+        version=version,
+        by_code=MappingProxyType(by_code),
+        by_name=MappingProxyType(by_name),
+    )
+
+
+_LOCK = threading.Lock()
+_REGISTRY: RulesRegistry | None = None
+
+
+def get_rules_registry() -> RulesRegistry:
+    """Registro corrente; lo ricarica se la versione del catalogo e' cambiata.
+
+    Se il DB non e' disponibile ritorna un registro vuoto (i chiamanti usano i
+    fallback di engine.rules) e riprova al controllo di versione successivo.
+    """
+    global _REGISTRY
+    version = catalog_version()
+    current = _REGISTRY
+    if current is not None and current.version == version:
+        return current
+    with _LOCK:
+        if _REGISTRY is not None and _REGISTRY.version == version:
+            return _REGISTRY
+        try:
+            _REGISTRY = _load_registry(version)
+        except Exception:
+            return RulesRegistry(version=None)
+        return _REGISTRY
+
+
+def clear_rules_registry() -> None:
+    global _REGISTRY
+    with _LOCK:
+        _REGISTRY = None
@@ -0,0 +1,115 @@
+# engine/search_keys.py
+"""Chiavi di ricerca normalizzate per i nomi del catalogo.
+
+`name_key` contiene il nome senza accenti, in casefold e con la punteggiatura
+ridotta a singoli spazi ("Rapidità" -> "rapidita", "Drago d'oro" ->
+"drago d oro"). La colonna e' indicizzata: una ricerca per prefisso diventa
+`name_key >= ? AND name_key < ?`, cioe' una range scan sull'indice.
+
+La normalizzazione Unicode non e' esprimibile in SQL puro, quindi le chiavi si
+calcolano in Python: alla migrazione e poi con `refresh_search_keys` (chiamata
+da engine.db.ensure_schema). I trigger si limitano ad azzerare la chiave quando
+il nome cambia, cosi' tool esterni che scrivono sul DB non si rompono.
+"""
+
+from __future__ import annotations
+
+import re
+import sqlite3
+import unicodedata
+
+KEY_COLUMN = "name_key"
+# (tabella, colonna sorgente) con chiave di ricerca.
+KEYED_TABLES = (("spells", "name_it"), ("monsters", "name_it"))
+
+_NON_WORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def search_key(text: str | None) -> str:
+    """Testo -> chiave: niente diacritici, casefold, punteggiatura collassata."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_WORD_RE.sub(" ", stripped.casefold()).strip()
+
+
+def prefix_bounds(key: str) -> tuple[str, str]:
+    """Estremi [lo, hi) delle chiavi che iniziano con `key` (confronto BINARY)."""
+    return key, key[:-1] + chr(ord(key[-1]) + 1)
+
+
+def has_search_key(conn: sqlite3.Connection, table: str, schema: str = "main") -> bool:
+    cols = {r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()}
+    return KEY_COLUMN in cols
+
+
+def _table_exists(conn: sqlite3.Connection, table: str, schema: str) -> bool:
+    row = conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?",
+        (table,),
+    ).fetchone()
+    return row is not None
+
+
+def ensure_search_keys(conn: sqlite3.Connection, schema: str = "main") -> None:
+    """Colonna, indice e trigger di reset per ogni tabella di KEYED_TABLES, poi backfill."""
+    for table, source in KEYED_TABLES:
+        if not _table_exists(conn, table, schema):
+            continue
+        if not has_search_key(conn, table, schema):
+            conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {KEY_COLUMN} TEXT")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_{KEY_COLUMN} ON {table}({KEY_COLUMN})"
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {schema}.trg_{table}_{KEY_COLUMN}_reset
+            AFTER UPDATE OF {source} ON {table}
+            BEGIN
+                UPDATE {table} SET {KEY_COLUMN} = NULL WHERE id = new.id;
+            END
+            """
+        )
+    refresh_search_keys(conn, schema)
+
+
+def refresh_search_keys(conn: sqlite3.Connection, schema: str = "main") -> int:
+    """Calcola le chiavi mancanti (righe nuove o rinominate); ritorna quante ne ha scritte."""
+    written = 0
+    for table, source in KEYED_TABLES:
+        if not _table_exists(conn, table, schema) or not has_search_key(conn, table, schema):
+            continue
+        rows = conn.execute(
+            f"SELECT id, {source} FROM {schema}.{table} WHERE {KEY_COLUMN} IS NULL"
+        ).fetchall()
+        if not rows:
+            continue
+        conn.executemany(
+            f"UPDATE {schema}.{table} SET {KEY_COLUMN} = ? WHERE id = ?",
+            [(search_key(r[1]), r[0]) for r in rows],
+        )
+        written += len(rows)
+    if written:
+        conn.commit()
+    return written
+
+
+def name_key_filter(column: str, q: str) -> tuple[str, list[str]]:
+    """Filtro SQL per prefisso sulla chiave normalizzata (range scan sull'indice).
+
+    Ritorna ("", []) se `q` non contiene caratteri utili.
+    """
+    key = search_key(q)
+    if not key:
+        return "", []
+    lo, hi = prefix_bounds(key)
+    return f"({column} >= ? AND {column} < ?)", [lo, hi]
+
+
+def name_key_contains(column: str, q: str) -> tuple[str, list[str]]:
+    """Filtro SQL "contiene" sulla chiave normalizzata (scansione, ma senza accenti)."""
+    key = search_key(q)
+    if not key:
+        return "", []
+    return f"instr({column}, ?) > 0", [key]
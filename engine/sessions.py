@@ -0,0 +1,270 @@
+# engine/sessions.py
+"""Sessione Flask lato server: nel cookie resta solo un id casuale.
+
+Il PG (statistiche, attacchi, slot, mostri rapidi...) vive nella tabella
+`sessions` del DB, serializzato come la sessione firmata di Flask
+(TaggedJSONSerializer: tuple, bytes e datetime tornano uguali). Davanti al DB
+c'e' una LRU in processo con TTL breve, cosi' la maggior parte delle richieste
+non legge nulla da SQLite; con piu' processi la TTL limita quanto una copia
+puo' restare indietro.
+
+La scrittura e' pigra: a fine richiesta si confronta il payload con quello
+caricato e si scrive solo se e' cambiato (o se la scadenza va rinnovata, al
+massimo una volta ogni SESSION_REFRESH secondi). Le righe scadute vengono
+eliminate a campione durante i salvataggi e da `gc_sessions()`.
+
+La scrittura e' condizionata a `updated_at`: si aggiorna la riga solo se e'
+ancora quella letta. Se un altro processo l'ha cambiata nel frattempo (copia
+vecchia nella LRU), la scrittura viene scartata e la voce tolta dalla LRU:
+vince la riga piu' recente invece di essere sovrascritta. Con piu' processi
+conviene comunque DND_SESSION_CACHE_TTL=0, che rilegge la riga a ogni
+richiesta.
+
+Il backend si sceglie con DND_SESSION_BACKEND: "sqlite" (default) oppure
+"cookie" per tornare alla sessione firmata di Flask.
+"""
+
+from __future__ import annotations
+
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from .cache import LRUCache
+from .db import connect, ensure_schema
+
+SESSION_BACKEND = (os.getenv("DND_SESSION_BACKEND") or "sqlite").strip().lower()
+SESSION_CACHE_SIZE = int(os.getenv("DND_SESSION_CACHE_SIZE") or 512)
+SESSION_CACHE_TTL = float(os.getenv("DND_SESSION_CACHE_TTL") or 30)
+# Rinnovo della scadenza senza modifiche: al piu' una scrittura ogni tanto.
+SESSION_REFRESH = float(os.getenv("DND_SESSION_REFRESH") or 3600)
+# Pulizia delle righe scadute: al piu' una volta ogni GC_INTERVAL secondi.
+GC_INTERVAL = float(os.getenv("DND_SESSION_GC_INTERVAL") or 600)
+
+_SERIALIZER = TaggedJSONSerializer()
+# sid -> (payload, scadenza epoch, updated_at della riga)
+_SESSION_CACHE = LRUCache("sessions", SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+
+
+def new_sid() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def _valid_sid(sid: str | None) -> bool:
+    return bool(sid) and len(sid) <= 64 and all(ch.isalnum() or ch in "-_" for ch in sid)
+
+
+class SessionStore:
+    """Righe (sid, payload, scadenza) nella tabella `sessions`, con LRU davanti."""
+
+    def __init__(self) -> None:
+        self._gc_lock = threading.Lock()
+        self._last_gc = 0.0
+
+    def load(self, sid: str) -> tuple[str, float, float] | None:
+        """(payload, scadenza epoch, updated_at) della sessione, None se assente o scaduta."""
+        entry = _SESSION_CACHE.get(sid)
+        if entry is None:
+            with connect() as conn:
+                ensure_schema(conn)
+                row = conn.execute(
+                    "SELECT data, expires_at, updated_at FROM sessions WHERE sid = ?", (sid,)
+                ).fetchone()
+            if row is None:
+                return None
+            entry = (str(row[0]), float(row[1]), float(row[2]))
+            _SESSION_CACHE.put(sid, entry)
+        if entry[1] <= time.time():
+            self.delete(sid)
+            return None
+        return entry
+
+    def save(self, sid: str, payload: str, expires_at: float, updated_at: float | None = None) -> bool:
+        """Scrive la sessione se la riga e' ancora quella letta.
+
+        `updated_at` e' quello caricato con la sessione (None = sessione nuova).
+        Ritorna False, senza scrivere, se nel frattempo la riga e' cambiata o
+        sparita.
+        """
+        now = time.time()
+        if updated_at is not None and now <= updated_at:
+            # Il token deve cambiare anche con orologi grossolani.
+            now = updated_at + 1e-6
+        with connect() as conn:
+            ensure_schema(conn)
+            if updated_at is None:
+                cur = conn.execute(
+                    """
+                    INSERT INTO sessions (sid, data, expires_at, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(sid) DO NOTHING
+                    """,
+                    (sid, payload, float(expires_at), now),
+                )
+            else:
+                cur = conn.execute(
+                    "UPDATE sessions SET data = ?, expires_at = ?, updated_at = ? WHERE sid = ? AND updated_at = ?",
+                    (payload, float(expires_at), now, sid, float(updated_at)),
+                )
+            conn.commit()
+            saved = bool(cur.rowcount)
+        if saved:
+            _SESSION_CACHE.put(sid, (payload, float(expires_at), now))
+        else:
+            _SESSION_CACHE.pop(sid)
+        self.maybe_gc()
+        return saved
+
+    def delete(self, sid: str) -> None:
+        _SESSION_CACHE.pop(sid)
+        with connect() as conn:
+            ensure_schema(conn)
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+            conn.commit()
+
+    def gc(self, now: float | None = None) -> int:
+        """Elimina le sessioni scadute e ritorna quante righe ha tolto."""
+        now = time.time() if now is None else float(now)
+        with connect() as conn:
+            ensure_schema(conn)
+            cur = conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            conn.commit()
+            removed = int(cur.rowcount or 0)
+        self._last_gc = time.monotonic()
+        return removed
+
+    def maybe_gc(self) -> None:
+        if time.monotonic() - self._last_gc < GC_INTERVAL:
+            return
+        if not self._gc_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._last_gc >= GC_INTERVAL:
+                self.gc()
+        except sqlite3.Error:
+            pass
+        finally:
+            self._gc_lock.release()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Sessione della richiesta; `payload`, `expires_at` e `updated_at` sono quelli letti dal DB."""
+
+    def __init__(
+        self,
+        initial: dict | None = None,
+        sid: str | None = None,
+        payload: str | None = None,
+        expires_at: float = 0.0,
+        updated_at: float | None = None,
+    ) -> None:
+        def on_update(self: ServerSession) -> None:
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid or new_sid()
+        self.new = payload is None
+        self.payload = payload
+        self.expires_at = expires_at
+        self.updated_at = updated_at
+        self.modified = False
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """SessionInterface Flask sopra SessionStore."""
+
+    serializer = _SERIALIZER
+
+    def __init__(self, store: SessionStore | None = None) -> None:
+        self.store = store or SessionStore()
+
+    def open_session(self, app, request) -> ServerSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if _valid_sid(sid):
+            entry = self.store.load(sid)
+            if entry is not None:
+                payload, expires_at, updated_at = entry
+                try:
+                    data = self.serializer.loads(payload)
+                except ValueError:
+                    data = None
+                if isinstance(data, dict):
+                    return ServerSession(
+                        data, sid=sid, payload=payload, expires_at=expires_at, updated_at=updated_at
+                    )
+        return ServerSession()
+
+    def save_session(self, app, session: ServerSession, response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        partitioned = self.get_cookie_partitioned(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(
+                    name,
+                    domain=domain,
+                    path=path,
+                    secure=secure,
+                    partitioned=partitioned,
+                    samesite=samesite,
+                    httponly=httponly,
+                )
+                response.vary.add("Cookie")
+            return
+
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        payload = self.serializer.dumps(dict(session))
+        changed = payload != session.payload
+        stale = session.expires_at - now < lifetime - SESSION_REFRESH
+        if changed or stale:
+            saved = self.store.save(session.sid, payload, now + lifetime, session.updated_at)
+            if session.new and not saved:
+                # sid gia' preso da un'altra sessione: niente cookie.
+                return
+
+        if session.new or self.should_set_cookie(app, session):
+            expires = self.get_expiration_time(app, session)
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=expires,
+                httponly=httponly,
+                domain=domain,
+                path=path,
+                secure=secure,
+                partitioned=partitioned,
+                samesite=samesite,
+            )
+            response.vary.add("Cookie")
+
+
+def init_app(app, backend: str | None = None) -> None:
+    """Installa il backend di sessione scelto (DND_SESSION_BACKEND)."""
+    if (backend or SESSION_BACKEND) == "cookie":
+        return
+    app.session_interface = SQLiteSessionInterface()
+
+
+def gc_sessions(now: float | None = None) -> int:
+    """Pulizia esplicita delle sessioni scadute (CLI/cron)."""
+    return SessionStore().gc(now)
+
+
+def clear_session_cache() -> None:
+    _SESSION_CACHE.clear()
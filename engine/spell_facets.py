@@ -0,0 +1,97 @@
+# engine/spell_facets.py
+"""Conteggi per faccetta della ricerca incantesimi (livello, classe, scuola...).
+
+Ogni faccetta conta le righe che soddisfano tutti gli altri filtri ma non il
+proprio: la tendina "Livello" mostra quanti incantesimi si troverebbero
+scegliendo un altro livello, non solo quello selezionato. `total` e `school`
+applicano invece tutti i filtri.
+
+Due strade con lo stesso risultato:
+- `facets_from_index`: AND e popcount sui bitset di SpellIndex (nessun SQL);
+- `facets_from_groups`: righe gia' raggruppate da una sola query aggregata
+  (level, school, ritual, concentration, class_mask, COUNT(*)).
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from .class_mask import CLASS_BITS, class_bit
+from .spell_index import SpellIndex
+
+FacetGroup = tuple[int, str, bool, bool, int, int]  # (level, school, ritual, concentration, class_mask, count)
+
+
+def empty_facets() -> dict:
+    return {"total": 0, "level": {}, "class": {}, "school": {}, "ritual": 0, "concentration": 0}
+
+
+def facets_from_index(
+    index: SpellIndex,
+    base: int,
+    level: int | None = None,
+    class_mask: int | None = None,
+    ritual_only: bool = False,
+    concentration_only: bool = False,
+) -> dict:
+    """Conteggi dal bitset `base` (filtri non a faccetta gia' applicati)."""
+    lv = index.by_level.get(int(level), 0) if level is not None else index.all_bits
+    cl = index.select(class_masks=[class_mask]) if class_mask is not None else index.all_bits
+    rit = index.ritual if ritual_only else index.all_bits
+    conc = index.concentration if concentration_only else index.all_bits
+
+    everything = base & lv & cl & rit & conc
+    out = empty_facets()
+    out["total"] = everything.bit_count()
+    for value, bits in sorted(index.by_level.items()):
+        n = (base & cl & rit & conc & bits).bit_count()
+        if n:
+            out["level"][value] = n
+    no_class = base & lv & rit & conc
+    for code in CLASS_BITS:
+        n = (no_class & index.by_class_bit.get(class_bit(code), 0)).bit_count()
+        if n:
+            out["class"][code] = n
+    for school, bits in sorted(index.by_school.items()):
+        n = (everything & bits).bit_count()
+        if n:
+            out["school"][school] = n
+    out["ritual"] = (base & lv & cl & conc & index.ritual).bit_count()
+    out["concentration"] = (base & lv & cl & rit & index.concentration).bit_count()
+    return out
+
+
+def facets_from_groups(
+    groups: Iterable[FacetGroup],
+    level: int | None = None,
+    class_mask: int | None = None,
+    ritual_only: bool = False,
+    concentration_only: bool = False,
+) -> dict:
+    """Stessi conteggi di `facets_from_index` da righe aggregate, in un passaggio."""
+    out = empty_facets()
+    levels: dict[int, int] = {}
+    classes: dict[str, int] = {}
+    schools: dict[str, int] = {}
+    for g_level, g_school, g_ritual, g_conc, g_mask, count in groups:
+        m_level = level is None or int(g_level) == int(level)
+        m_class = class_mask is None or bool(int(g_mask or 0) & class_mask)
+        m_rit = not ritual_only or bool(g_ritual)
+        m_conc = not concentration_only or bool(g_conc)
+        if m_class and m_rit and m_conc:
+            levels[int(g_level)] = levels.get(int(g_level), 0) + count
+        if m_level and m_rit and m_conc:
+            for code in CLASS_BITS:
+                if int(g_mask or 0) & class_bit(code):
+                    classes[code] = classes.get(code, 0) + count
+        if m_level and m_class and m_rit and m_conc:
+            out["total"] += count
+            schools[g_school] = schools.get(g_school, 0) + count
+        if m_level and m_class and m_conc and g_ritual:
+            out["ritual"] += count
+        if m_level and m_class and m_rit and g_conc:
+            out["concentration"] += count
+    out["level"] = dict(sorted(levels.items()))
+    out["class"] = {code: classes[code] for code in CLASS_BITS if code in classes}
+    out["school"] = dict(sorted(schools.items()))
+    return out
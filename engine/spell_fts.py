@@ -0,0 +1,115 @@
+# engine/spell_fts.py
+"""Indice full-text FTS5 sugli incantesimi (nome, descrizione, livelli superiori).
+
+L'indice e' "external content" sulla tabella `spells` dello stesso schema ed
+e' tenuto allineato da trigger; `rebuild_spell_fts` lo ricostruisce da zero.
+Le stesse funzioni valgono per il DB principale e per `priv` (spell private).
+"""
+
+from __future__ import annotations
+
+import html
+import re
+import sqlite3
+
+FTS_TABLE = "spells_fts"
+FTS_COLUMNS = ("name_it", "description", "at_higher_levels")
+# Pesi bm25 per colonna: il nome conta piu' del testo.
+BM25_WEIGHTS = (10.0, 1.0, 0.5)
+
+# Delimitatori usati da snippet(): caratteri di controllo, poi sostituiti con
+# <mark> dopo l'escape HTML del testo.
+SNIPPET_OPEN = "\x02"
+SNIPPET_CLOSE = "\x03"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def create_spell_fts(conn: sqlite3.Connection, schema: str = "main") -> None:
+    """Crea tabella FTS5 + trigger di sync nello schema indicato e la popola."""
+    cols = ", ".join(FTS_COLUMNS)
+    new_cols = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+    old_cols = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+    conn.execute(
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.{FTS_TABLE} USING fts5(
+            {cols},
+            content='spells',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.trg_spells_fts_ai AFTER INSERT ON spells
+        BEGIN
+            INSERT INTO {FTS_TABLE} (rowid, {cols}) VALUES (new.id, {new_cols});
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.trg_spells_fts_ad AFTER DELETE ON spells
+        BEGIN
+            INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.trg_spells_fts_au AFTER UPDATE OF {cols} ON spells
+        BEGIN
+            INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            INSERT INTO {FTS_TABLE} (rowid, {cols}) VALUES (new.id, {new_cols});
+        END
+        """
+    )
+    rebuild_spell_fts(conn, schema)
+
+
+def rebuild_spell_fts(conn: sqlite3.Connection, schema: str = "main") -> None:
+    conn.execute(f"INSERT INTO {schema}.{FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def has_spell_fts(conn: sqlite3.Connection, schema: str = "main") -> bool:
+    row = conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?",
+        (FTS_TABLE,),
+    ).fetchone()
+    return row is not None
+
+
+def fts_query(q: str) -> str | None:
+    """Testo libero -> query FTS5: ogni parola diventa un prefisso, tutte in AND."""
+    tokens = _TOKEN_RE.findall(q or "")
+    if not tokens:
+        return None
+    return " ".join(f'"{tok}"*' for tok in tokens)
+
+
+def match_subquery(schema: str) -> str:
+    """Sottoquery (rid, rank, snippet) per un MATCH sull'indice dello schema.
+
+    Lo snippet viene sempre dalla descrizione: il nome e' gia' mostrato a parte.
+    """
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    return f"""
+        SELECT
+            rowid AS rid,
+            bm25({FTS_TABLE}, {weights}) AS rank,
+            snippet({FTS_TABLE}, 1, char(2), char(3), '…', 12) AS snippet
+        FROM {schema}.{FTS_TABLE}
+        WHERE {FTS_TABLE} MATCH ?
+    """
+
+
+def snippet_html(raw: str | None) -> str:
+    """Snippet con escape HTML e termini trovati evidenziati in <mark>.
+
+    Se nella descrizione non c'e' nessun termine trovato ritorna "".
+    """
+    if not raw or SNIPPET_OPEN not in raw:
+        return ""
+    text = html.escape(raw)
+    return text.replace(SNIPPET_OPEN, "<mark>").replace(SNIPPET_CLOSE, "</mark>")
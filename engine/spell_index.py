@@ -0,0 +1,246 @@
+# engine/spell_index.py
+"""Indice in memoria dell'intero catalogo incantesimi, con filtri a bitset.
+
+Le righe sono ordinate come in search_spells (level, name_it, origin, id) e la
+posizione di ogni riga e' il suo bit. Per ogni classe, livello, scuola, rituale
+e concentrazione c'e' un intero Python con i bit delle righe corrispondenti:
+una combinazione di filtri e' un AND fra interi, senza SQL.
+
+L'indice copre solo le ricerche senza testo (`q` passa da FTS5 in SQL) e si
+ricostruisce quando cambia il suo stamp (versione catalogo, DB privato).
+Disattivabile con DND_SPELL_INDEX=0: search_spells usa allora solo SQL.
+"""
+
+from __future__ import annotations
+
+import bisect
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Mapping, Sequence
+
+from .class_mask import codes_for
+from .search_keys import search_key
+
+SPELL_INDEX_ENABLED = (os.getenv("DND_SPELL_INDEX") or "1").strip() != "0"
+
+SortKey = tuple[int, str, str, int]
+
+
+@dataclass(frozen=True, slots=True)
+class IndexedSpell:
+    id: int
+    origin: str
+    name: str
+    level: int
+    school: str
+    ritual: bool
+    concentration: bool
+    class_mask: int
+
+    @property
+    def sort_key(self) -> SortKey:
+        return (self.level, self.name, self.origin, self.id)
+
+    def as_dict(self) -> dict:
+        """Stesso formato delle righe di search_spells."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "level": self.level,
+            "school": self.school,
+            "ritual": self.ritual,
+            "concentration": self.concentration,
+            "origin": self.origin,
+            "spell_key": f"{self.origin}:{self.id}",
+            "class_codes": codes_for(self.class_mask),
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class EligibleSpells:
+    """Incantesimi ammessi da classi + livello massimo (browsing con limiti PG)."""
+
+    keys: tuple[str, ...]
+    # Bitset sull'indice da cui e' stato calcolato; None se viene da SQL.
+    bits: int | None = None
+    key_set: frozenset[str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "key_set", frozenset(self.keys))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, spell_key: object) -> bool:
+        return spell_key in self.key_set
+
+
+@dataclass(slots=True)
+class SpellIndex:
+    stamp: Any = None
+    spells: tuple[IndexedSpell, ...] = ()
+    keys: tuple[SortKey, ...] = ()
+    all_bits: int = 0
+    by_class_bit: dict[int, int] = field(default_factory=dict)
+    by_level: dict[int, int] = field(default_factory=dict)
+    by_school: dict[str, int] = field(default_factory=dict)
+    ritual: int = 0
+    concentration: int = 0
+    # (chiave normalizzata del nome, posizione) in ordine: ricerca per prefisso con bisect.
+    names: tuple[tuple[str, int], ...] = ()
+
+    @classmethod
+    def build(cls, rows: Iterable[IndexedSpell], stamp: Any = None) -> "SpellIndex":
+        spells = tuple(sorted(rows, key=lambda sp: sp.sort_key))
+        index = cls(stamp=stamp, spells=spells, keys=tuple(sp.sort_key for sp in spells))
+        index.all_bits = (1 << len(spells)) - 1
+        for pos, sp in enumerate(spells):
+            bit = 1 << pos
+            mask = sp.class_mask
+            while mask:
+                low = mask & -mask
+                index.by_class_bit[low] = index.by_class_bit.get(low, 0) | bit
+                mask ^= low
+            index.by_level[sp.level] = index.by_level.get(sp.level, 0) | bit
+            index.by_school[sp.school] = index.by_school.get(sp.school, 0) | bit
+            if sp.ritual:
+                index.ritual |= bit
+            if sp.concentration:
+                index.concentration |= bit
+        index.names = tuple(sorted((search_key(sp.name), pos) for pos, sp in enumerate(spells)))
+        return index
+
+    def _class_bits(self, class_mask: int) -> int:
+        bits = 0
+        mask = class_mask
+        while mask:
+            low = mask & -mask
+            bits |= self.by_class_bit.get(low, 0)
+            mask ^= low
+        return bits
+
+    def select(
+        self,
+        level: int | None = None,
+        max_level: int | None = None,
+        class_masks: Sequence[int] = (),
+        school: str | None = None,
+        ritual_only: bool = False,
+        concentration_only: bool = False,
+    ) -> int:
+        """Bitset delle righe che soddisfano tutti i filtri."""
+        bits = self.all_bits
+        if level is not None:
+            bits &= self.by_level.get(int(level), 0)
+        if max_level is not None:
+            allowed = 0
+            for lv, lv_bits in self.by_level.items():
+                if lv <= int(max_level):
+                    allowed |= lv_bits
+            bits &= allowed
+        for mask in class_masks:
+            bits &= self._class_bits(mask)
+        if school is not None:
+            bits &= self.by_school.get(school, 0)
+        if ritual_only:
+            bits &= self.ritual
+        if concentration_only:
+            bits &= self.concentration
+        return bits
+
+    def eligible(self, class_mask: int | None = None, max_level: int | None = None) -> EligibleSpells:
+        bits = self.select(max_level=max_level, class_masks=[class_mask] if class_mask is not None else ())
+        keys = []
+        rest = bits
+        while rest:
+            low = rest & -rest
+            rest ^= low
+            sp = self.spells[low.bit_length() - 1]
+            keys.append(f"{sp.origin}:{sp.id}")
+        return EligibleSpells(keys=tuple(keys), bits=bits)
+
+    def page(
+        self,
+        bits: int,
+        limit: int,
+        offset: int = 0,
+        after: SortKey | None = None,
+        before: SortKey | None = None,
+    ) -> list[IndexedSpell]:
+        """Righe del bitset in ordine, con OFFSET o cursori keyset (come search_spells)."""
+        if after is not None:
+            bits &= ~((1 << bisect.bisect_right(self.keys, after)) - 1)
+            offset = 0
+        elif before is not None:
+            bits &= (1 << bisect.bisect_left(self.keys, before)) - 1
+            positions = []
+            while bits and len(positions) < limit:
+                pos = bits.bit_length() - 1
+                positions.append(pos)
+                bits ^= 1 << pos
+            return [self.spells[pos] for pos in reversed(positions)]
+
+        out: list[IndexedSpell] = []
+        skipped = 0
+        while bits and len(out) < limit:
+            low = bits & -bits
+            bits ^= low
+            if skipped < offset:
+                skipped += 1
+                continue
+            out.append(self.spells[low.bit_length() - 1])
+        return out
+
+    def prefix(self, q: str, limit: int = 10) -> list[IndexedSpell]:
+        """Incantesimi il cui nome normalizzato inizia con `q`, in ordine alfabetico."""
+        key = search_key(q)
+        if not key:
+            return []
+        start = bisect.bisect_left(self.names, (key, -1))
+        out: list[IndexedSpell] = []
+        for name_key, pos in self.names[start:]:
+            if not name_key.startswith(key) or len(out) >= limit:
+                break
+            out.append(self.spells[pos])
+        return out
+
+
+_LOCK = threading.Lock()
+_INDEXES: dict[str, SpellIndex] = {}
+
+
+def cached_spell_index(
+    name: str,
+    stamp: Any,
+    loader: Callable[[], Iterable[IndexedSpell]],
+) -> SpellIndex:
+    """Indice `name` in cache; lo ricostruisce con `loader()` se lo stamp e' cambiato."""
+    current = _INDEXES.get(name)
+    if current is not None and current.stamp == stamp:
+        return current
+    with _LOCK:
+        current = _INDEXES.get(name)
+        if current is not None and current.stamp == stamp:
+            return current
+        current = SpellIndex.build(loader(), stamp=stamp)
+        _INDEXES[name] = current
+        return current
+
+
+def configure_spell_index(enabled: bool) -> None:
+    global SPELL_INDEX_ENABLED
+    SPELL_INDEX_ENABLED = bool(enabled)
+    clear_spell_indexes()
+
+
+def clear_spell_indexes() -> None:
+    with _LOCK:
+        _INDEXES.clear()
+
+
+def index_stats() -> Mapping[str, Any]:
+    return {
+        "enabled": SPELL_INDEX_ENABLED,
+        "indexes": {name: len(index.spells) for name, index in _INDEXES.items()},
+    }
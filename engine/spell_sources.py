@@ -0,0 +1,252 @@
+# engine/spell_sources.py
+"""Registro delle sorgenti di incantesimi (SRD, private, future homebrew).
+
+Ogni sorgente ha un'origine ("srd", "private"...), un alias di ATTACH e un
+flag di abilitazione. L'SRD vive nel catalogo (schema `catalog` o `main`); le
+altre sono file SQLite con la stessa tabella `spells`/`spell_classes`.
+
+`attach_sources` aggancia i file una sola volta per connessione (lo stato
+resta sulla connessione del pool) e ne prepara indice FTS, chiavi di ricerca e
+class_mask. Se il file viene sostituito (inode, mtime o dimensione diversi)
+la connessione lo sgancia e lo riaggancia, come fa il pool col catalogo. `union_sql` genera la UNION ALL fra le sorgenti e la tiene in
+cache per combinazione di sorgenti e modalita' di filtro: aggiungere una
+sorgente e' una chiamata a `register_source`, senza toccare le query.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from pathlib import Path
+from typing import Sequence
+
+from .class_mask import ensure_class_mask, has_class_mask, mask_subquery
+from .db import DB_ROOT, catalog_schema
+from .ingest import ensure_spell_fields, has_spell_fields
+from .migrations import SPELLS_KEYSET_INDEX
+from .search_keys import ensure_search_keys, has_search_key
+from .spell_fts import create_spell_fts, has_spell_fts, match_subquery
+
+PRIVATE_DB_PATH = DB_ROOT / "private_spells.sqlite3"
+
+
+@dataclass(frozen=True, slots=True)
+class SpellSource:
+    origin: str
+    # Alias di ATTACH; None = catalogo SRD (schema deciso da engine.db).
+    alias: str | None = None
+    path: Path | None = None
+    enabled: bool = True
+    # Inclusa solo se richiesto (include_private=True).
+    opt_in: bool = False
+
+    def available(self) -> bool:
+        return self.enabled and (self.path is None or self.path.exists())
+
+    def stamp(self) -> tuple[int, int] | None:
+        """Identita' del file (mtime, size) per invalidare cache e indici."""
+        if self.path is None:
+            return None
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def file_identity(self) -> tuple[int, int, int] | None:
+        """(inode, mtime, size): cambia anche se il file viene sostituito con uno nuovo."""
+        if self.path is None:
+            return None
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+@dataclass(frozen=True, slots=True)
+class AttachedSource:
+    """Sorgente agganciata a una connessione, con le capacita' del suo schema."""
+
+    source: SpellSource
+    schema: str
+    has_fts: bool
+    has_name_key: bool
+    has_class_mask: bool
+    has_fields: bool = False
+    # file_identity() al momento dell'ATTACH (None per il catalogo).
+    file: tuple[int, int, int] | None = None
+
+    @property
+    def origin(self) -> str:
+        return self.source.origin
+
+
+_LOCK = threading.Lock()
+_SOURCES: dict[str, SpellSource] = {
+    "srd": SpellSource("srd"),
+    "private": SpellSource("private", alias="priv", path=PRIVATE_DB_PATH, opt_in=True),
+}
+
+
+def register_source(source: SpellSource) -> None:
+    """Aggiunge (o sostituisce) una sorgente; l'ordine di registrazione e' quello della UNION."""
+    if source.path is not None and not source.alias:
+        raise ValueError(f"la sorgente {source.origin!r} su file richiede un alias")
+    with _LOCK:
+        _SOURCES[source.origin] = source
+
+
+def set_source_enabled(origin: str, enabled: bool) -> None:
+    with _LOCK:
+        _SOURCES[origin] = replace(_SOURCES[origin], enabled=bool(enabled))
+
+
+def get_source(origin: str) -> SpellSource | None:
+    return _SOURCES.get(origin)
+
+
+def spell_sources(include_private: bool = False) -> tuple[SpellSource, ...]:
+    """Sorgenti attive per una richiesta, in ordine di registrazione."""
+    return tuple(
+        src for src in _SOURCES.values() if src.available() and (include_private or not src.opt_in)
+    )
+
+
+def sources_stamp(sources: Sequence[SpellSource]) -> tuple:
+    return tuple((src.origin, src.stamp()) for src in sources)
+
+
+def _prepare_file_source(conn: sqlite3.Connection, schema: str) -> None:
+    """FTS, chiavi, class_mask e campi derivati su una sorgente file; se e' read-only si va avanti senza."""
+    try:
+        if not has_spell_fts(conn, schema):
+            create_spell_fts(conn, schema)
+        ensure_search_keys(conn, schema)
+        # Il ricalcolo della mask riscrive tutte le righe (e cambia mtime del
+        # file, cioe' la sua identita'): solo se la colonna manca.
+        if not has_class_mask(conn, schema):
+            ensure_class_mask(conn, schema)
+        ensure_spell_fields(conn, schema)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.{SPELLS_KEYSET_INDEX} ON spells(level, name_it, id)")
+        conn.commit()
+    except sqlite3.Error:
+        # DB in sola lettura o senza FTS5: le query ripiegano su LIKE e sottoquery.
+        conn.rollback()
+
+
+def _describe(
+    conn: sqlite3.Connection,
+    source: SpellSource,
+    schema: str,
+    file: tuple[int, int, int] | None = None,
+) -> AttachedSource:
+    return AttachedSource(
+        source=source,
+        schema=schema,
+        has_fts=has_spell_fts(conn, schema),
+        has_name_key=has_search_key(conn, "spells", schema),
+        has_class_mask=has_class_mask(conn, schema),
+        has_fields=has_spell_fields(conn, schema),
+        file=file,
+    )
+
+
+def attach_sources(conn: sqlite3.Connection, sources: Sequence[SpellSource]) -> tuple[AttachedSource, ...]:
+    """Aggancia (una volta per connessione) e descrive le sorgenti richieste."""
+    state: dict[str, AttachedSource] | None = getattr(conn, "spell_sources", None)
+    if state is None:
+        state = {}
+        try:
+            conn.spell_sources = state
+        except AttributeError:
+            # sqlite3.Connection "nuda": nessuna cache, si rifa' ogni volta.
+            pass
+
+    out: list[AttachedSource] = []
+    for source in sources:
+        current = state.get(source.origin)
+        file = source.file_identity()
+        if current is None or current.source != source or current.file != file:
+            if source.path is None:
+                current = _describe(conn, source, catalog_schema(conn))
+            else:
+                attached = {row[1] for row in conn.execute("PRAGMA database_list").fetchall()}
+                if source.alias in attached and current is not None and current.file != file:
+                    # File sostituito: la connessione legge ancora quello vecchio.
+                    conn.execute(f"DETACH DATABASE {source.alias}")
+                    attached.discard(source.alias)
+                if source.alias not in attached:
+                    conn.execute(f"ATTACH DATABASE ? AS {source.alias}", (str(source.path),))
+                    _prepare_file_source(conn, source.alias)
+                    # La preparazione puo' aver scritto sul file.
+                    file = source.file_identity()
+                current = _describe(conn, source, source.alias, file)
+            state[source.origin] = current
+        out.append(current)
+    return tuple(out)
+
+
+# Modalita' del filtro testuale di ogni ramo della UNION.
+TEXT_ALL = "all"
+TEXT_FTS = "fts"
+TEXT_KEY = "key"
+TEXT_LIKE = "like"
+TEXT_IDS = "ids"
+
+UnionPart = tuple[str, str, bool, str]  # (schema, origin, has_class_mask, text_mode)
+
+
+@lru_cache(maxsize=128)
+def union_sql(parts: tuple[UnionPart, ...]) -> str:
+    """UNION ALL delle sorgenti; un parametro per ramo filtrato, nell'ordine dei rami."""
+    branches = []
+    for pos, (schema, origin, with_mask, mode) in enumerate(parts):
+        a = f"s{pos}"
+        mask_sql = f"{a}.class_mask" if with_mask else mask_subquery(f"{schema}.spell_classes", f"{a}.id")
+        fts = mode == TEXT_FTS
+        sql = f"""
+            SELECT
+                {a}.id AS id,
+                '{origin}' AS origin,
+                '{origin}:' || {a}.id AS spell_key,
+                {a}.name_it,
+                {a}.level,
+                {a}.school,
+                {a}.ritual,
+                {a}.concentration,
+                {mask_sql} AS class_mask,
+                {"f.rank" if fts else "NULL"} AS rank,
+                {"f.snippet" if fts else "NULL"} AS snippet
+            FROM {schema}.spells {a}
+        """
+        if fts:
+            sql += f"JOIN ({match_subquery(schema)}) f ON f.rid = {a}.id\n"
+        elif mode == TEXT_KEY:
+            sql += f"WHERE instr({a}.name_key, ?) > 0\n"
+        elif mode == TEXT_LIKE:
+            sql += f"WHERE {a}.name_it LIKE ?\n"
+        elif mode == TEXT_IDS:
+            sql += f"WHERE {a}.id IN (SELECT value FROM json_each(?))\n"
+        branches.append(sql)
+    if not branches:
+        # Nessuna sorgente: stessa forma, zero righe.
+        return (
+            "SELECT NULL AS id, NULL AS origin, NULL AS spell_key, NULL AS name_it, NULL AS level, "
+            "NULL AS school, NULL AS ritual, NULL AS concentration, NULL AS class_mask, "
+            "NULL AS rank, NULL AS snippet WHERE 0"
+        )
+    return "\n            UNION ALL\n".join(branches)
+
+
+def text_mode(source: AttachedSource, fts_match: str | None, name_key: str, q: str) -> str:
+    """Modalita' di filtro testuale per una sorgente, in base alle sue capacita'."""
+    if not q:
+        return TEXT_ALL
+    if fts_match and source.has_fts:
+        return TEXT_FTS
+    if name_key and source.has_name_key:
+        return TEXT_KEY
+    return TEXT_LIKE
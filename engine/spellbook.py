@@ -1,23 +1,180 @@
+# engine/spellbook.py
+"""Incantesimi conosciuti dai personaggi (`character_spells`).
+
+`apply_changes` (e `add_known_spell` per un solo incantesimo) fa lettura
+degli incantesimi, lettura del libro, controllo dei limiti e scritture sulla
+stessa connessione e dentro una sola transazione (BEGIN IMMEDIATE): due
+richieste concorrenti non possono superare entrambe il controllo e poi
+inserire. I limiti del PG li decide il chiamante con `check`
+(le regole di classe arrivano dal registro in memoria, senza query).
+"""
+
 from __future__ import annotations
 
+import sqlite3
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
 from engine.db import connect, ensure_schema
-from engine.spells_repo import list_by_character
+from engine.spells_repo import catalog_spells, character_spells, list_by_character
+
+# Esiti per incantesimo (SpellbookResult.status).
+ADDED = "added"
+ALREADY_KNOWN = "already_known"
+NOT_FOUND = "not_found"
+BLOCKED = "blocked"
+
+# (incantesimi gia' conosciuti, incantesimo da aggiungere) -> (ammesso, motivo)
+SpellCheck = Callable[[list[dict], dict], tuple[bool, str]]
+
+
+@dataclass(frozen=True, slots=True)
+class SpellbookResult:
+    status: str
+    spell_id: int
+    reasons: tuple[str, ...] = ()
+    spell: dict | None = None
+
+    @property
+    def added(self) -> bool:
+        return self.status == ADDED
+
+    @property
+    def message(self) -> str:
+        """Messaggio per l'utente (vuoto se l'aggiunta e' riuscita)."""
+        if self.status == ALREADY_KNOWN:
+            return "Incantesimo gia' presente nel personaggio."
+        if self.status == NOT_FOUND:
+            return "Incantesimo non trovato."
+        if self.status == BLOCKED:
+            return f"Aggiunta bloccata: {'; '.join(self.reasons) or 'Limiti di apprendimento superati.'}"
+        return ""
 
 
 def list_character_spells(character_id: int) -> list[dict]:
     return list_by_character(character_id)
 
 
+def _spells_for_add(conn: sqlite3.Connection, spell_ids: Iterable[int]) -> dict[int, dict]:
+    return catalog_spells(conn, list(spell_ids))
+
+
+def _owned_spells(conn: sqlite3.Connection, character_id: int) -> list[dict]:
+    return character_spells(conn, character_id)
+
+
+def _insert_known(conn: sqlite3.Connection, character_id: int, spell_ids: Iterable[int]) -> None:
+    conn.executemany(
+        """
+        INSERT OR IGNORE INTO character_spells (character_id, spell_id, status)
+        VALUES (?, ?, 'known')
+        """,
+        [(int(character_id), int(spell_id)) for spell_id in spell_ids],
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class SpellbookChanges:
+    """Esito di apply_changes: un SpellbookResult per ogni id da aggiungere, piu' i rimossi."""
+
+    results: tuple[SpellbookResult, ...] = ()
+    removed: tuple[int, ...] = ()
+
+    @property
+    def added(self) -> tuple[int, ...]:
+        return tuple(r.spell_id for r in self.results if r.added)
+
+    @property
+    def rejected(self) -> tuple[SpellbookResult, ...]:
+        return tuple(r for r in self.results if not r.added)
+
+
+def _unique_ids(values: Iterable[int | str] | None) -> list[int]:
+    out: list[int] = []
+    for raw in values or ():
+        try:
+            spell_id = int(raw)
+        except (TypeError, ValueError):
+            continue
+        if spell_id > 0 and spell_id not in out:
+            out.append(spell_id)
+    return out
+
+
+def apply_changes(
+    character_id: int,
+    add: Iterable[int | str] | None = None,
+    remove: Iterable[int | str] | None = None,
+    check: SpellCheck | None = None,
+) -> SpellbookChanges:
+    """Aggiunte e rimozioni in blocco, validate e applicate in una transazione.
+
+    Prima si tolgono le rimozioni (liberano posti), poi ogni aggiunta passa da
+    `check` con il libro gia' comprensivo delle aggiunte accettate prima nello
+    stesso lotto. Quelle bloccate sono riportate nel risultato, le altre
+    vengono scritte con executemany.
+    """
+    add_ids = _unique_ids(add)
+    remove_ids = _unique_ids(remove)
+    with connect() as conn:
+        ensure_schema(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            owned = _owned_spells(conn, character_id)
+            owned_ids = {int(sp.get("id") or 0) for sp in owned}
+            removed = [spell_id for spell_id in remove_ids if spell_id in owned_ids and spell_id not in add_ids]
+            owned = [sp for sp in owned if int(sp.get("id") or 0) not in removed]
+            known = {int(sp.get("id") or 0) for sp in owned}
+            spells = _spells_for_add(conn, [spell_id for spell_id in add_ids if spell_id not in known]) if add_ids else {}
+
+            results: list[SpellbookResult] = []
+            for spell_id in add_ids:
+                if spell_id in known:
+                    results.append(SpellbookResult(ALREADY_KNOWN, spell_id))
+                    continue
+                spell = spells.get(spell_id)
+                if spell is None:
+                    results.append(SpellbookResult(NOT_FOUND, spell_id))
+                    continue
+                if check is not None:
+                    allowed, reason = check(owned, spell)
+                    if not allowed:
+                        reasons = tuple(part.strip() for part in (reason or "").split(";") if part.strip())
+                        results.append(SpellbookResult(BLOCKED, spell_id, reasons, spell))
+                        continue
+                owned.append(spell)
+                known.add(spell_id)
+                results.append(SpellbookResult(ADDED, spell_id, spell=spell))
+
+            if removed:
+                conn.executemany(
+                    """
+                    DELETE FROM character_spells
+                    WHERE character_id = ? AND spell_id = ? AND status = 'known'
+                    """,
+                    [(int(character_id), spell_id) for spell_id in removed],
+                )
+            added = [r.spell_id for r in results if r.added]
+            if added:
+                _insert_known(conn, character_id, added)
+            if removed or added:
+                conn.commit()
+            return SpellbookChanges(results=tuple(results), removed=tuple(removed))
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+
+def add_known_spell(character_id: int, spell_id: int, check: SpellCheck | None = None) -> SpellbookResult:
+    """Aggiunge un incantesimo SRD al personaggio se `check` lo consente, in una transazione."""
+    results = apply_changes(character_id, add=[int(spell_id)], check=check).results
+    return results[0] if results else SpellbookResult(NOT_FOUND, int(spell_id))
+
+
 def add_spell_to_character(character_id: int, spell_id: int) -> None:
     with connect() as conn:
         ensure_schema(conn)
-        conn.execute(
-            """
-            INSERT OR IGNORE INTO character_spells (character_id, spell_id, status)
-            VALUES (?, ?, 'known')
-            """,
-            (int(character_id), int(spell_id)),
-        )
+        _insert_known(conn, character_id, [spell_id])
         conn.commit()
 
 
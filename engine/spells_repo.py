@@ -1,12 +1,45 @@
 from __future__ import annotations
 
-import re
-from pathlib import Path
+import base64
+import binascii
+import json
+import os
+import sqlite3
 from typing import Iterable, Sequence
 
-from engine.db import connect, ensure_schema
-
-PRIVATE_DB_PATH = Path(__file__).resolve().parent.parent / "db" / "private_spells.sqlite3"
+from engine import spell_index
+from engine.cache import LRUCache
+from engine.class_mask import codes_for, mask_expr, mask_for
+from engine.db import catalog_schema, catalog_version, connect, ensure_schema
+from engine.fuzzy import FUZZY_MIN_HITS, TrigramIndex, cached_index
+from engine.ingest import DERIVED_COLUMNS, spell_fields
+from engine.prefix_index import SUGGEST_LIMIT, cached_prefix_index
+from engine.search_keys import search_key
+from engine.spell_facets import facets_from_groups, facets_from_index
+from engine.spell_fts import fts_query, snippet_html
+from engine.spell_index import EligibleSpells, IndexedSpell, SpellIndex, cached_spell_index
+from engine.spell_sources import (
+    TEXT_ALL,
+    TEXT_FTS,
+    TEXT_IDS,
+    TEXT_KEY,
+    TEXT_LIKE,
+    AttachedSource,
+    SpellSource,
+    attach_sources,
+    get_source,
+    sources_stamp,
+    spell_sources,
+    text_mode,
+    union_sql,
+)
+
+SPELL_DETAIL_CACHE_SIZE = int(os.getenv("DND_SPELL_DETAIL_CACHE_SIZE") or 512)
+SPELL_FACET_CACHE_SIZE = int(os.getenv("DND_SPELL_FACET_CACHE_SIZE") or 256)
+# Cache dei risultati di search_spells: DND_SEARCH_CACHE=0 la disattiva.
+SEARCH_CACHE_ENABLED = (os.getenv("DND_SEARCH_CACHE") or "1").strip().lower() not in {"0", "false", "off", "no"}
+SEARCH_CACHE_SIZE = int(os.getenv("DND_SEARCH_CACHE_SIZE") or 256)
+SEARCH_CACHE_TTL = float(os.getenv("DND_SEARCH_CACHE_TTL") or 300)
 
 
 def _rows_to_spells(rows: Iterable) -> list[dict]:
@@ -28,12 +61,125 @@ def _rows_to_spells(rows: Iterable) -> list[dict]:
             item["spell_key"] = str(r["spell_key"])
         else:
             item["spell_key"] = f"{item['origin']}:{item['id']}"
-        if "class_codes" in r.keys():
+        if "class_mask" in r.keys():
+            item["class_codes"] = codes_for(r["class_mask"])
+        elif "class_codes" in r.keys():
             item["class_codes"] = r["class_codes"] or ""
+        if "snippet" in r.keys() and r["snippet"]:
+            item["snippet"] = snippet_html(r["snippet"])
         spells.append(item)
     return spells
 
 
+def _spell_name_index(conn, attached: Sequence[AttachedSource]) -> TrigramIndex:
+    """Indice a trigrammi dei nomi delle sorgenti agganciate, chiavi (origin, id)."""
+
+    def load() -> list[tuple[tuple[str, int], str]]:
+        names: list[tuple[tuple[str, int], str]] = []
+        for src in attached:
+            rows = conn.execute(f"SELECT id, name_it FROM {src.schema}.spells").fetchall()
+            names += [((src.origin, int(r[0])), str(r[1])) for r in rows]
+        return names
+
+    sources = tuple(src.source for src in attached)
+    name = "spells:" + "+".join(src.origin for src in sources)
+    return cached_index(name, (catalog_version(), sources_stamp(sources)), load)
+
+
+def suggest_spells(q: str, limit: int = SUGGEST_LIMIT, include_private: bool = False) -> list[dict]:
+    """Completamenti del nome per il typeahead (indice a prefissi in memoria)."""
+    sources = spell_sources(include_private)
+
+    def load() -> list[tuple[tuple[str, int], str]]:
+        with connect() as conn:
+            ensure_schema(conn)
+            names: list[tuple[tuple[str, int], str]] = []
+            for src in attach_sources(conn, sources):
+                rows = conn.execute(f"SELECT id, name_it FROM {src.schema}.spells").fetchall()
+                names += [((src.origin, int(r[0])), str(r[1])) for r in rows]
+            return names
+
+    name = "spells:" + "+".join(src.origin for src in sources)
+    index = cached_prefix_index(name, (catalog_version(), sources_stamp(sources)), load)
+    return [
+        {"id": spell_id, "origin": origin, "spell_key": f"{origin}:{spell_id}", "name": label}
+        for (origin, spell_id), label in index.complete(q, limit)
+    ]
+
+
+def _catalog_spell_index(include_private: bool) -> SpellIndex:
+    """Indice in memoria di tutte le sorgenti attive (private solo se richieste)."""
+    sources = spell_sources(include_private)
+    name = "+".join(src.origin for src in sources)
+
+    def load() -> list[IndexedSpell]:
+        with connect() as conn:
+            ensure_schema(conn)
+            out: list[IndexedSpell] = []
+            for src in attach_sources(conn, sources):
+                mask_sql = "s.class_mask" if src.has_class_mask else mask_expr(conn, src.schema, "s")
+                rows = conn.execute(
+                    f"""
+                    SELECT s.id, s.name_it, s.level, s.school, s.ritual, s.concentration,
+                           {mask_sql} AS class_mask
+                    FROM {src.schema}.spells s
+                    """
+                ).fetchall()
+                out.extend(
+                    IndexedSpell(
+                        id=int(r["id"]),
+                        origin=src.origin,
+                        name=str(r["name_it"]),
+                        level=int(r["level"]),
+                        school=str(r["school"]),
+                        ritual=bool(r["ritual"]),
+                        concentration=bool(r["concentration"]),
+                        class_mask=int(r["class_mask"] or 0),
+                    )
+                    for r in rows
+                )
+            return out
+
+    return cached_spell_index(name, (catalog_version(), sources_stamp(sources)), load)
+
+
+def warm_spell_index(include_private: bool = True) -> None:
+    """Costruisce subito l'indice in memoria (avvio app) se abilitato."""
+    if spell_index.SPELL_INDEX_ENABLED:
+        _catalog_spell_index(include_private)
+
+
+def spell_cursor(spell: dict) -> str:
+    """Cursore opaco di un risultato di search_spells (posizione nell'ordine per livello)."""
+    raw = json.dumps([int(spell["level"]), spell["name"], spell["origin"], int(spell["id"])], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_spell_cursor(cursor: str) -> tuple[int, str, str, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        level, name, origin, spell_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return int(level), str(name), str(origin), int(spell_id)
+    except (TypeError, ValueError, UnicodeError, binascii.Error) as exc:
+        raise ValueError(f"cursore non valido: {cursor!r}") from exc
+
+
+_SEARCH_CACHE = LRUCache("spell_search", maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+
+
+def _class_filters(class_code: str | None, class_codes: Sequence[str] | None) -> tuple[str | None, list[str]]:
+    """Codice classe singolo normalizzato e lista codici senza duplicati (ordine preservato)."""
+    class_code_single = (class_code or "").strip().lower() or None
+    unique_codes: list[str] = []
+    seen: set[str] = set()
+    for raw in (class_codes or []):
+        code = (raw or "").strip().lower()
+        if code and code not in seen:
+            unique_codes.append(code)
+            seen.add(code)
+    return class_code_single, unique_codes
+
+
 def search_spells(
     q: str,
     level: int | None = None,
@@ -45,14 +191,97 @@ def search_spells(
     include_private: bool = False,
     limit: int = 20,
     offset: int = 0,
+    sort: str = "level",
+    after: str | None = None,
+    before: str | None = None,
+) -> list[dict]:
+    """Ricerca incantesimi (SRD + eventuali private).
+
+    `q` usa l'indice FTS5 (nome, descrizione, livelli superiori; prefissi,
+    accenti ignorati); senza indice ricade su LIKE sul nome.
+    `sort="relevance"` ordina per bm25 quando c'e' una query testuale.
+
+    Paginazione keyset sull'ordine (level, name_it, origin, id): `after`
+    ritorna le righe dopo il cursore (vedi `spell_cursor`), `before` quelle
+    immediatamente prima (sempre in ordine crescente). I cursori valgono solo
+    per l'ordinamento per livello e hanno precedenza su `offset`; un cursore
+    non valido solleva ValueError.
+
+    I risultati passano da una cache LRU con TTL per tupla di argomenti
+    normalizzata, invalidata da catalogo e file sorgente (vedi
+    `search_cache_stats`); ogni chiamata riceve copie delle righe.
+    """
+    q = " ".join((q or "").split())
+    class_code_single, unique_codes = _class_filters(class_code, class_codes)
+    relevance = sort == "relevance" and bool(q)
+    key = (
+        q,
+        int(level) if level is not None else None,
+        mask_for([class_code_single]) if class_code_single else None,
+        mask_for(unique_codes) if unique_codes else None,
+        int(max_level) if max_level is not None else None,
+        bool(ritual_only),
+        bool(concentration_only),
+        bool(include_private),
+        int(limit),
+        int(offset),
+        "relevance" if relevance else "level",
+        None if relevance else (after or None),
+        None if relevance or after else (before or None),
+    )
+
+    def load() -> list[dict]:
+        return _search_spells(
+            q,
+            level,
+            class_code,
+            class_codes,
+            max_level,
+            ritual_only,
+            concentration_only,
+            include_private,
+            limit,
+            offset,
+            sort,
+            after,
+            before,
+        )
+
+    if not SEARCH_CACHE_ENABLED:
+        return load()
+    stamp = (catalog_version(), sources_stamp(spell_sources(include_private)))
+    return [dict(sp) for sp in _SEARCH_CACHE.get_or_load(key, stamp, load)]
+
+
+def search_cache_stats() -> dict:
+    return _SEARCH_CACHE.stats()
+
+
+def _search_spells(
+    q: str,
+    level: int | None,
+    class_code: str | None,
+    class_codes: Sequence[str] | None,
+    max_level: int | None,
+    ritual_only: bool,
+    concentration_only: bool,
+    include_private: bool,
+    limit: int,
+    offset: int,
+    sort: str,
+    after: str | None,
+    before: str | None,
 ) -> list[dict]:
     params: list = []
     where: list[str] = []
 
     q = (q or "").strip()
-    if q:
-        where.append("u.name_it LIKE ?")
-        params.append(f"%{q}%")
+    relevance = sort == "relevance" and bool(q)
+    seek = None
+    if (after or before) and not relevance:
+        seek = (">", decode_spell_cursor(after)) if after else ("<", decode_spell_cursor(before))
+        offset = 0
+    match = fts_query(q) if q else None
 
     if level is not None:
         where.append("u.level = ?")
@@ -65,267 +294,405 @@ def search_spells(
     if concentration_only:
         where.append("u.concentration = 1")
 
-    class_code_single = (class_code or "").strip().lower() or None
-    unique_codes: list[str] = []
-    seen: set[str] = set()
-    for raw in (class_codes or []):
-        code = (raw or "").strip().lower()
-        if code and code not in seen:
-            unique_codes.append(code)
-            seen.add(code)
+    class_code_single, unique_codes = _class_filters(class_code, class_codes)
+
+    # Senza testo libero i filtri si risolvono sull'indice in memoria (stesso
+    # ordine e stesse righe della query SQL, che resta il fallback).
+    if not q and spell_index.SPELL_INDEX_ENABLED:
+        try:
+            index = _catalog_spell_index(include_private)
+        except sqlite3.Error:
+            index = None
+        if index is not None:
+            bits = index.select(
+                level=level,
+                class_masks=[mask_for([class_code_single])] if class_code_single else (),
+                ritual_only=ritual_only,
+                concentration_only=concentration_only,
+            )
+            if unique_codes or max_level is not None:
+                # Limiti del PG: insieme precalcolato e in cache per (classi, livello massimo).
+                eligible = eligible_spells(unique_codes, max_level, include_private)
+                if eligible.bits is None:
+                    eligible = index.eligible(mask_for(unique_codes) if unique_codes else None, max_level)
+                bits &= eligible.bits
+            rows = index.page(
+                bits,
+                int(limit),
+                int(offset),
+                after=seek[1] if seek and seek[0] == ">" else None,
+                before=seek[1] if seek and seek[0] == "<" else None,
+            )
+            return [sp.as_dict() for sp in rows]
 
     with connect() as conn:
         ensure_schema(conn)
-        private_attached = False
-        if include_private and PRIVATE_DB_PATH.exists():
-            attached = {row[1] for row in conn.execute("PRAGMA database_list").fetchall()}
-            if "priv" not in attached:
-                conn.execute("ATTACH DATABASE ? AS priv", (str(PRIVATE_DB_PATH),))
-            private_attached = True
-
-        union_sql = """
-            SELECT
-                s.id AS id,
-                'srd' AS origin,
-                'srd:' || s.id AS spell_key,
-                s.name_it,
-                s.level,
-                s.school,
-                s.ritual,
-                s.concentration
-            FROM main.spells s
-        """
-        if private_attached:
-            union_sql += """
-            UNION ALL
-            SELECT
-                p.id AS id,
-                'private' AS origin,
-                'private:' || p.id AS spell_key,
-                p.name_it,
-                p.level,
-                p.school,
-                p.ritual,
-                p.concentration
-            FROM priv.spells p
-            """
+        attached = attach_sources(conn, spell_sources(include_private))
 
         if class_code_single:
-            class_filter = """
-                EXISTS (
-                    SELECT 1
-                    FROM main.spell_classes sc_filter
-                    WHERE u.origin = 'srd'
-                      AND sc_filter.spell_id = u.id
-                      AND sc_filter.class_code = ?
-                )
-            """
-            if private_attached:
-                class_filter = """
-                    (
-                        EXISTS (
-                            SELECT 1
-                            FROM main.spell_classes sc_filter
-                            WHERE u.origin = 'srd'
-                              AND sc_filter.spell_id = u.id
-                              AND sc_filter.class_code = ?
-                        )
-                        OR (
-                            u.origin = 'private'
-                            AND (
-                                EXISTS (
-                                    SELECT 1
-                                    FROM priv.spell_classes scp_filter
-                                    WHERE scp_filter.spell_id = u.id
-                                      AND scp_filter.class_code = ?
-                                )
-                            )
-                        )
-                    )
-                """
-            where.append(" ".join(class_filter.split()))
-            params.append(class_code_single)
-            if private_attached:
-                params.append(class_code_single)
-
+            where.append("(u.class_mask & ?) != 0")
+            params.append(mask_for([class_code_single]))
         if unique_codes:
-            placeholders = ", ".join("?" for _ in unique_codes)
-            class_filter_list = f"""
-                EXISTS (
-                    SELECT 1
-                    FROM main.spell_classes sc_filter_list
-                    WHERE u.origin = 'srd'
-                      AND sc_filter_list.spell_id = u.id
-                      AND sc_filter_list.class_code IN ({placeholders})
-                )
-            """
-            if private_attached:
-                class_filter_list = f"""
-                    (
-                        {class_filter_list}
-                        OR (
-                            u.origin = 'private'
-                            AND (
-                                EXISTS (
-                                    SELECT 1
-                                    FROM priv.spell_classes scp_filter_list
-                                    WHERE scp_filter_list.spell_id = u.id
-                                      AND scp_filter_list.class_code IN ({placeholders})
-                                )
-                            )
-                        )
+            where.append("(u.class_mask & ?) != 0")
+            params.append(mask_for(unique_codes))
+
+        if seek:
+            where.append(f"(u.level, u.name_it, u.origin, u.id) {seek[0]} (?, ?, ?, ?)")
+            params.extend(seek[1])
+
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+        if relevance:
+            order_sql = "u.rank IS NULL, u.rank ASC, u.level ASC, u.name_it ASC, u.origin ASC, u.id ASC"
+        elif seek and seek[0] == "<":
+            order_sql = "u.level DESC, u.name_it DESC, u.origin DESC, u.id DESC"
+        else:
+            order_sql = "u.level ASC, u.name_it ASC, u.origin ASC, u.id ASC"
+
+        def run(modes: Sequence[str], text_params: Sequence, order_sql: str, limit: int, offset: int) -> list:
+            parts = tuple(
+                (src.schema, src.origin, src.has_class_mask, mode) for src, mode in zip(attached, modes)
+            )
+            return conn.execute(
+                f"""
+                SELECT
+                    u.id,
+                    u.origin,
+                    u.spell_key,
+                    u.name_it,
+                    u.level,
+                    u.school,
+                    u.ritual,
+                    u.concentration,
+                    u.class_mask,
+                    u.rank,
+                    u.snippet
+                FROM ({union_sql(parts)}) u
+                {where_sql}
+                ORDER BY {order_sql}
+                LIMIT ? OFFSET ?
+                """,
+                (*text_params, *params, int(limit), int(offset)),
+            ).fetchall()
+
+        name_key = search_key(q)
+        modes = [text_mode(src, match, name_key, q) for src in attached]
+        text_values = {TEXT_FTS: match, TEXT_KEY: name_key, TEXT_LIKE: f"%{q}%"}
+        results = _rows_to_spells(
+            run(
+                modes,
+                [text_values[mode] for mode in modes if mode != TEXT_ALL],
+                order_sql,
+                limit,
+                offset,
+            )
+        )
+        if seek and seek[0] == "<":
+            results.reverse()
+
+        # Pochi risultati per una query testuale: prova a correggere i refusi
+        # con l'indice a trigrammi sui nomi (solo in prima pagina).
+        if q and offset == 0 and not seek and len(results) < min(FUZZY_MIN_HITS, limit):
+            seen_keys = {sp["spell_key"] for sp in results}
+            index = _spell_name_index(conn, attached)
+            hits = [(item, score) for item, score in index.search(q) if f"{item[0]}:{item[1]}" not in seen_keys]
+            if hits:
+                ids_by_origin: dict[str, list[int]] = {}
+                for (origin, spell_id), _score in hits:
+                    ids_by_origin.setdefault(origin, []).append(spell_id)
+                fuzzy_rows = _rows_to_spells(
+                    run(
+                        [TEXT_IDS] * len(attached),
+                        [json.dumps(ids_by_origin.get(src.origin, [])) for src in attached],
+                        "u.level ASC, u.name_it ASC, u.origin ASC, u.id ASC",
+                        len(hits),
+                        0,
                     )
-                """
-            where.append(" ".join(class_filter_list.split()))
-            params.extend(unique_codes)
-            if private_attached:
-                params.extend(unique_codes)
+                )
+                score_by_key = {f"{origin}:{spell_id}": score for (origin, spell_id), score in hits}
+                fuzzy_rows.sort(key=lambda sp: -score_by_key[sp["spell_key"]])
+                for sp in fuzzy_rows:
+                    sp["fuzzy"] = True
+                results.extend(fuzzy_rows[: max(0, int(limit) - len(results))])
+
+    return results
+
+
+_FACET_CACHE = LRUCache("spell_facets", maxsize=SPELL_FACET_CACHE_SIZE)
+
 
+def spell_facets(
+    q: str,
+    level: int | None = None,
+    class_code: str | None = None,
+    class_codes: Sequence[str] | None = None,
+    max_level: int | None = None,
+    ritual_only: bool = False,
+    concentration_only: bool = False,
+    include_private: bool = False,
+) -> dict:
+    """Conteggi per livello, classe, scuola, rituale e concentrazione (vedi engine.spell_facets).
+
+    Stessi filtri di search_spells. Livello, classe singola, rituale e
+    concentrazione sono faccette: ognuna e' contata senza il proprio filtro.
+    `class_codes` e `max_level` (limiti del PG) restano sempre applicati.
+    Senza testo si usano i bitset dell'indice in memoria, altrimenti una sola
+    query aggregata; il risultato e' in cache per tupla di filtri normalizzata
+    ed e' condiviso: non va modificato.
+    """
+    q = " ".join((q or "").split()).casefold()
+    class_code_single, unique_codes = _class_filters(class_code, class_codes)
+    single_mask = mask_for([class_code_single]) if class_code_single else None
+    multi_mask = mask_for(unique_codes) if unique_codes else None
+    level = int(level) if level is not None else None
+    max_level = int(max_level) if max_level is not None else None
+    sources = spell_sources(include_private)
+    key = (
+        q,
+        level,
+        single_mask,
+        multi_mask,
+        max_level,
+        bool(ritual_only),
+        bool(concentration_only),
+        tuple(src.origin for src in sources),
+    )
+    facet_filters = dict(
+        level=level,
+        class_mask=single_mask,
+        ritual_only=bool(ritual_only),
+        concentration_only=bool(concentration_only),
+    )
+
+    def load() -> dict:
+        if not q and spell_index.SPELL_INDEX_ENABLED:
+            try:
+                index = _catalog_spell_index(include_private)
+            except sqlite3.Error:
+                index = None
+            if index is not None:
+                base = index.select(
+                    max_level=max_level,
+                    class_masks=[multi_mask] if multi_mask is not None else (),
+                )
+                return facets_from_index(index, base, **facet_filters)
+
+        where: list[str] = []
+        params: list = []
+        if max_level is not None:
+            where.append("u.level <= ?")
+            params.append(max_level)
+        if multi_mask is not None:
+            where.append("(u.class_mask & ?) != 0")
+            params.append(multi_mask)
         where_sql = f"WHERE {' AND '.join(where)}" if where else ""
-        rows = conn.execute(
-            f"""
-            SELECT
-                u.id,
-                u.origin,
-                u.spell_key,
-                u.name_it,
-                u.level,
-                u.school,
-                u.ritual,
-                u.concentration,
-                (
-                    SELECT group_concat(DISTINCT x.class_code)
-                    FROM (
-                        SELECT scm.class_code AS class_code
-                        FROM main.spell_classes scm
-                        WHERE u.origin = 'srd' AND scm.spell_id = u.id
-                        {("UNION SELECT scp.class_code AS class_code FROM priv.spell_classes scp WHERE u.origin = 'private' AND scp.spell_id = u.id")
-                         if private_attached else ""}
-                    ) x
-                ) AS class_codes
-            FROM ({union_sql}) u
-            {where_sql}
-            ORDER BY u.level ASC, u.name_it ASC
-            LIMIT ? OFFSET ?
-            """,
-            (*params, int(limit), int(offset)),
-        ).fetchall()
 
-    return _rows_to_spells(rows)
+        with connect() as conn:
+            ensure_schema(conn)
+            attached = attach_sources(conn, sources)
+            match = fts_query(q) if q else None
+            name_key = search_key(q)
+            modes = [text_mode(src, match, name_key, q) for src in attached]
+            text_values = {TEXT_FTS: match, TEXT_KEY: name_key, TEXT_LIKE: f"%{q}%"}
+            parts = tuple((src.schema, src.origin, src.has_class_mask, mode) for src, mode in zip(attached, modes))
+            groups = conn.execute(
+                f"""
+                SELECT u.level, u.school, u.ritual, u.concentration, u.class_mask, COUNT(*)
+                FROM ({union_sql(parts)}) u
+                {where_sql}
+                GROUP BY u.level, u.school, u.ritual, u.concentration, u.class_mask
+                """,
+                (*(text_values[mode] for mode in modes if mode != TEXT_ALL), *params),
+            ).fetchall()
+        return facets_from_groups([tuple(g) for g in groups], **facet_filters)
+
+    return _FACET_CACHE.get_or_load(key, (catalog_version(), sources_stamp(sources)), load)
+
+
+_ELIGIBLE_CACHE = LRUCache("spell_eligible", maxsize=64)
+
+
+def eligible_spells(
+    class_codes: Iterable[str] | None,
+    max_level: int | None,
+    include_private: bool = False,
+) -> EligibleSpells:
+    """Chiavi degli incantesimi di almeno una delle classi e di livello <= max_level.
+
+    Costruito alla prima richiesta e tenuto in cache per
+    (frozenset(classi), max_level) fino al prossimo cambio di catalogo o file
+    sorgente. Ordine di search_spells (level, name_it, origin, id). Con l'indice
+    in memoria c'e' anche il bitset, che search_spells usa direttamente.
+    """
+    _single, codes = _class_filters(None, list(class_codes or ()))
+    max_level = int(max_level) if max_level is not None else None
+    mask = mask_for(codes) if codes else None
+    sources = spell_sources(include_private)
+    key = (frozenset(codes), max_level, bool(include_private), spell_index.SPELL_INDEX_ENABLED)
+
+    def load() -> EligibleSpells:
+        if spell_index.SPELL_INDEX_ENABLED:
+            try:
+                return _catalog_spell_index(include_private).eligible(mask, max_level)
+            except sqlite3.Error:
+                pass
+        where: list[str] = []
+        params: list = []
+        if mask is not None:
+            where.append("(u.class_mask & ?) != 0")
+            params.append(mask)
+        if max_level is not None:
+            where.append("u.level <= ?")
+            params.append(max_level)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+        with connect() as conn:
+            ensure_schema(conn)
+            attached = attach_sources(conn, sources)
+            parts = tuple((src.schema, src.origin, src.has_class_mask, TEXT_ALL) for src in attached)
+            rows = conn.execute(
+                f"""
+                SELECT u.spell_key FROM ({union_sql(parts)}) u
+                {where_sql}
+                ORDER BY u.level, u.name_it, u.origin, u.id
+                """,
+                params,
+            ).fetchall()
+        return EligibleSpells(keys=tuple(str(r[0]) for r in rows))
+
+    return _ELIGIBLE_CACHE.get_or_load(key, (catalog_version(), sources_stamp(sources)), load)
 
 
 def list_by_character(character_id: int) -> list[dict]:
     with connect() as conn:
         ensure_schema(conn)
-        rows = conn.execute(
-            """
-            SELECT
-                s.id,
-                s.name_it,
-                s.level,
-                s.school,
-                s.ritual,
-                s.concentration,
-                group_concat(DISTINCT sc.class_code) AS class_codes
-            FROM character_spells cs
-            JOIN spells s ON s.id = cs.spell_id
-            LEFT JOIN spell_classes sc ON sc.spell_id = s.id
-            WHERE cs.character_id = ? AND cs.status = 'known'
-            GROUP BY s.id
-            ORDER BY s.level ASC, s.name_it ASC
-            """,
-            (int(character_id),),
-        ).fetchall()
-
+        return character_spells(conn, character_id)
+
+
+def character_spells(conn: sqlite3.Connection, character_id: int) -> list[dict]:
+    """Incantesimi conosciuti dal personaggio, sulla connessione (e transazione) del chiamante."""
+    cat = catalog_schema(conn)
+    rows = conn.execute(
+        f"""
+        SELECT
+            s.id,
+            s.name_it,
+            s.level,
+            s.school,
+            s.ritual,
+            s.concentration,
+            {mask_expr(conn, cat, "s")} AS class_mask
+        FROM character_spells cs
+        JOIN {cat}.spells s ON s.id = cs.spell_id
+        WHERE cs.character_id = ? AND cs.status = 'known'
+        ORDER BY s.level ASC, s.name_it ASC
+        """,
+        (int(character_id),),
+    ).fetchall()
     return _rows_to_spells(rows)
 
 
-_ACTION_TYPE_MAP = {
-    "action": "1 azione",
-    "bonus_action": "1 azione bonus",
-    "bonus action": "1 azione bonus",
-    "reaction": "1 reazione",
-}
+def catalog_spells(conn: sqlite3.Connection, spell_ids: Sequence[int]) -> dict[int, dict]:
+    """Righe sintetiche (come search_spells) di incantesimi SRD per id, in una query."""
+    cat = catalog_schema(conn)
+    rows = conn.execute(
+        f"""
+        SELECT s.id, s.name_it, s.level, s.school, s.ritual, s.concentration,
+               {mask_expr(conn, cat, "s")} AS class_mask
+        FROM {cat}.spells s
+        WHERE s.id IN (SELECT value FROM json_each(?))
+        """,
+        (json.dumps([int(spell_id) for spell_id in spell_ids]),),
+    ).fetchall()
+    return {sp["id"]: sp for sp in _rows_to_spells(rows)}
 
 
-def _display_casting_time(value: str | None) -> str:
-    raw = (value or "").strip()
-    if not raw:
-        return "—"
-    return _ACTION_TYPE_MAP.get(raw.lower(), raw)
+_DETAIL_CACHE = LRUCache("spell_detail", maxsize=SPELL_DETAIL_CACHE_SIZE)
 
 
-def _display_range_text(value: str | None) -> str:
-    raw = (value or "").strip()
-    if not raw:
-        return "—"
-    if raw.lower() in {"self", "incantatore"}:
-        return "Incantatore"
-    return raw
+def detail_stamp() -> tuple:
+    """Stamp di invalidazione dei dettagli: versione catalogo + identita' dei file sorgente."""
+    return (catalog_version(), sources_stamp(spell_sources(include_private=True)))
 
 
-def _clean_description(description: str | None, duration_text: str | None) -> str:
-    text = (description or "").strip()
-    if not text:
-        return "—"
+def _resolve_source(origin: str | None, include_private: bool) -> SpellSource | None:
+    source = get_source((origin or "srd").strip().lower()) or get_source("srd")
+    if not source.available() or (source.opt_in and not include_private):
+        return None
+    return source
 
-    # OCR residue: "ora Per ..."
-    text = re.sub(r"^\s*ora\s+(?=Per\b)", "", text, flags=re.IGNORECASE).strip()
 
-    duration = (duration_text or "").strip()
-    if duration:
-        candidates = [duration]
-        if "," in duration:
-            tail = duration.split(",")[-1].strip()
-            if tail:
-                candidates.append(tail)
+def get_by_id(spell_id: int, origin: str = "srd", include_private: bool = False) -> dict | None:
+    """Dettaglio completo di un incantesimo, da una cache LRU per (origin, id).
 
-        for cand in candidates:
-            pat = re.compile(rf"^\s*{re.escape(cand)}(?:\s+|[:;,\-])+", flags=re.IGNORECASE)
-            if pat.match(text):
-                text = pat.sub("", text, count=1).strip()
-                break
+    La cache si svuota quando cambia la versione del catalogo o un file
+    sorgente (DB privato...). Ritorna una copia: il chiamante puo' modificarla.
+    """
+    source = _resolve_source(origin, include_private)
+    if source is None:
+        return None
+    spell = _DETAIL_CACHE.get_or_load(
+        (source.origin, int(spell_id)),
+        detail_stamp(),
+        lambda: _load_spell_details(source, [int(spell_id)]).get(int(spell_id)),
+    )
+    return dict(spell) if spell is not None else None
+
+
+def parse_spell_key(key: str | int) -> tuple[str, int] | None:
+    """Chiave "origin:id" (o solo id = SRD) -> (origin, id); None se non valida."""
+    origin, sep, raw_id = str(key).strip().rpartition(":")
+    try:
+        spell_id = int(raw_id)
+    except ValueError:
+        return None
+    return ((origin if sep else "srd").strip().lower() or "srd", spell_id)
+
+
+def get_by_ids(keys: Iterable[str | int], include_private: bool = False) -> list[dict]:
+    """Dettagli di piu' incantesimi ("origin:id") nell'ordine delle chiavi.
+
+    Le chiavi gia' in cache non toccano il DB; le altre costano una query per
+    sorgente. Chiavi non valide, sorgenti non incluse e id inesistenti vengono
+    saltati. Ogni voce e' una copia.
+    """
+    stamp = detail_stamp()
+    wanted: list[tuple[str, int]] = []
+    found: dict[tuple[str, int], dict] = {}
+    missing: dict[str, tuple[SpellSource, list[int]]] = {}
+    for parsed in map(parse_spell_key, keys):
+        source = _resolve_source(parsed[0], include_private) if parsed else None
+        if source is None:
+            continue
+        key = (source.origin, parsed[1])
+        wanted.append(key)
+        if key in found or key[1] in missing.get(source.origin, (None, ()))[1]:
+            continue
+        spell = _DETAIL_CACHE.get(key, stamp)
+        if spell is not None:
+            found[key] = spell
+        else:
+            missing.setdefault(source.origin, (source, []))[1].append(key[1])
 
-    return text or "—"
+    for origin, (source, ids) in missing.items():
+        for spell_id, spell in _load_spell_details(source, ids).items():
+            _DETAIL_CACHE.put((origin, spell_id), spell, stamp)
+            found[(origin, spell_id)] = spell
 
+    return [dict(found[key]) for key in wanted if key in found]
 
-def get_by_id(spell_id: int, origin: str = "srd", include_private: bool = False) -> dict | None:
+
+def _load_spell_details(source: SpellSource, spell_ids: Sequence[int]) -> dict[int, dict]:
+    """Dettagli per id da una sola sorgente, con una query (lista id via json_each)."""
+    origin_norm = source.origin
     with connect() as conn:
         ensure_schema(conn)
-        origin_norm = (origin or "srd").strip().lower()
-        if origin_norm not in {"srd", "private"}:
-            origin_norm = "srd"
-
-        private_attached = False
-        if include_private and PRIVATE_DB_PATH.exists():
-            attached = {row[1] for row in conn.execute("PRAGMA database_list").fetchall()}
-            if "priv" not in attached:
-                conn.execute("ATTACH DATABASE ? AS priv", (str(PRIVATE_DB_PATH),))
-            private_attached = True
-
-        if origin_norm == "private":
-            if not private_attached:
-                return None
-            table = "priv.spells"
-            class_codes_sql = """
-                (
-                    SELECT group_concat(DISTINCT scp.class_code)
-                    FROM priv.spell_classes scp
-                    WHERE scp.spell_id = spells.id
-                ) AS class_codes
-            """
-        else:
-            table = "main.spells"
-            class_codes_sql = """
-                (
-                    SELECT group_concat(DISTINCT sc.class_code)
-                    FROM main.spell_classes sc
-                    WHERE sc.spell_id = spells.id
-                ) AS class_codes
-            """
-
-        row = conn.execute(
-            """
+        (src,) = attach_sources(conn, [source])
+        table = f"{src.schema}.spells"
+        mask_sql = "spells.class_mask" if src.has_class_mask else mask_expr(conn, src.schema, "spells")
+        # Campi derivati gia' calcolati all'import; NULL (o colonne assenti) = calcolo qui.
+        derived_sql = ", ".join(DERIVED_COLUMNS if src.has_fields else (f"NULL AS {c}" for c in DERIVED_COLUMNS))
+
+        rows = conn.execute(
+            f"""
             SELECT
                 id,
                 name_it,
@@ -342,28 +709,21 @@ def get_by_id(spell_id: int, origin: str = "srd", include_private: bool = False)
                 ritual,
                 description,
                 at_higher_levels,
-                """
-            + class_codes_sql
-            + f"""
+                {mask_sql} AS class_mask,
+                {derived_sql}
             FROM {table} AS spells
-            WHERE id = ?
+            WHERE id IN (SELECT value FROM json_each(?))
             """,
-            (int(spell_id),),
-        ).fetchone()
+            (json.dumps([int(spell_id) for spell_id in spell_ids]),),
+        ).fetchall()
+
+    return {int(row["id"]): _detail_from_row(origin_norm, row) for row in rows}
 
-    if not row:
-        return None
 
-    components = []
-    if row["components_v"]:
-        components.append("V")
-    if row["components_s"]:
-        components.append("S")
-    if row["components_m"]:
-        components.append("M")
-    components_text = ", ".join(components) if components else "-"
-    if row["components_m"] and row["material_text"]:
-        components_text = f"{components_text} ({row['material_text']})"
+def _detail_from_row(origin_norm: str, row: sqlite3.Row) -> dict:
+    fields = {col: row[col] for col in DERIVED_COLUMNS}
+    if any(value is None for value in fields.values()):
+        fields = spell_fields(row)
 
     return {
         "id": int(row["id"]),
@@ -372,13 +732,13 @@ def get_by_id(spell_id: int, origin: str = "srd", include_private: bool = False)
         "name": row["name_it"],
         "level": int(row["level"]),
         "school": row["school"],
-        "casting_time": _display_casting_time(row["casting_time"]),
-        "range_text": _display_range_text(row["range_text"]),
-        "components_text": components_text,
+        "casting_time": fields["casting_time_display"],
+        "range_text": fields["range_display"],
+        "components_text": fields["components_text"],
         "duration_text": row["duration_text"],
         "concentration": bool(row["concentration"]),
         "ritual": bool(row["ritual"]),
-        "description": _clean_description(row["description"], row["duration_text"]),
+        "description": fields["description_clean"],
         "at_higher_levels": row["at_higher_levels"],
-        "class_codes": row["class_codes"] or "",
+        "class_codes": codes_for(row["class_mask"]),
     }
@@ -0,0 +1,25 @@
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+
+from engine import db
+
+
+@pytest.fixture(scope="session", autouse=True)
+def temp_sqlite_db(tmp_path_factory):
+    """Tutta la suite lavora su una copia del DB versionato.
+
+    Sessioni, personaggi e migrazioni scrivono nella copia: db/dnd_sheet.sqlite3
+    resta com'e' nel repo.
+    """
+    path = tmp_path_factory.mktemp("db") / "dnd_sheet.sqlite3"
+    src = sqlite3.connect(db.SQLITE_PATH)
+    dst = sqlite3.connect(path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    with patch("engine.db.SQLITE_PATH", path):
+        yield path
@@ -0,0 +1,67 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from engine import db
+from engine.catalog import build_catalog
+from engine.spells_repo import get_by_id, search_spells
+
+
+class CatalogFileTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.catalog_path = Path(self.tmp.name) / "srd_catalog.sqlite3"
+        self.catalog_patch = patch("engine.db.CATALOG_PATH", self.catalog_path)
+        self.catalog_patch.start()
+        db.configure_pool(enabled=True)
+
+    def tearDown(self):
+        self.catalog_patch.stop()
+        db.configure_pool(enabled=True)
+        db.invalidate_catalog()
+        self.tmp.cleanup()
+
+    def test_without_catalog_file_reads_from_main(self):
+        with db.connect() as conn:
+            self.assertEqual("main", db.catalog_schema(conn))
+
+    def test_build_produces_read_only_attached_catalog(self):
+        before = search_spells(q="", level=1, class_code="wizard", limit=100)
+        build_catalog(dest=self.catalog_path)
+
+        with sqlite3.connect(self.catalog_path) as raw:
+            tables = {r[0] for r in raw.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertIn("spells", tables)
+        self.assertNotIn("characters", tables)
+
+        with db.connect() as conn:
+            self.assertEqual("catalog", db.catalog_schema(conn))
+            schemas = {r[1] for r in conn.execute("PRAGMA database_list").fetchall()}
+            self.assertIn("catalog", schemas)
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute("UPDATE catalog.spells SET level = level WHERE id = 1")
+
+        self.assertEqual(before, search_spells(q="", level=1, class_code="wizard", limit=100))
+        self.assertIsNotNone(get_by_id(before[0]["id"]))
+
+    def test_rebuild_is_picked_up_by_pooled_connections(self):
+        build_catalog(dest=self.catalog_path)
+        with db.connect() as conn:
+            first = id(conn)
+        build_catalog(dest=self.catalog_path)
+        with db.connect() as conn:
+            self.assertNotEqual(first, id(conn))
+            self.assertEqual("catalog", db.catalog_schema(conn))
+
+    def test_stale_catalog_is_ignored(self):
+        build_catalog(dest=self.catalog_path)
+        with patch("engine.db.LATEST_VERSION", 10_000):
+            db.configure_pool(enabled=True)
+            with db.connect() as conn:
+                self.assertEqual("main", db.catalog_schema(conn))
+
+
+if __name__ == "__main__":
+    unittest.main()
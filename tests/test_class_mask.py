@@ -0,0 +1,56 @@
+import unittest
+
+from engine.class_mask import CLASS_BITS, codes_for, mask_for, mask_subquery
+from engine.db import connect, ensure_schema
+from engine.spells_repo import get_by_id, search_spells
+
+
+class ClassMaskTests(unittest.TestCase):
+    def test_round_trip(self):
+        self.assertEqual(12, len(CLASS_BITS))
+        mask = mask_for(["wizard", "Bard", "", None, "unknown"])
+        self.assertEqual("bard,wizard", codes_for(mask))
+        self.assertEqual("", codes_for(0))
+
+    def test_class_filter_matches_spell_classes(self):
+        with connect() as conn:
+            ensure_schema(conn)
+            expected = {
+                r[0]
+                for r in conn.execute(
+                    "SELECT spell_id FROM spell_classes WHERE class_code IN ('druid', 'ranger')"
+                ).fetchall()
+            }
+            stale = conn.execute(
+                f"SELECT COUNT(*) FROM spells s WHERE s.class_mask != {mask_subquery('spell_classes', 's.id')}"
+            ).fetchone()[0]
+        self.assertEqual(0, stale)
+        results = search_spells(q="", class_codes=["druid", "ranger"], limit=1000)
+        self.assertEqual(expected, {sp["id"] for sp in results})
+        self.assertEqual([], search_spells(q="", class_code="__no_class__", limit=10))
+
+        spell = get_by_id(results[0]["id"])
+        self.assertEqual(results[0]["class_codes"], spell["class_codes"])
+
+    def test_triggers_follow_spell_classes(self):
+        with connect() as conn:
+            ensure_schema(conn)
+            try:
+                spell_id = conn.execute(
+                    "SELECT spell_id FROM spell_classes WHERE class_code = 'wizard' "
+                    "AND spell_id NOT IN (SELECT spell_id FROM spell_classes WHERE class_code = 'monk') LIMIT 1"
+                ).fetchone()[0]
+                mask = lambda: conn.execute("SELECT class_mask FROM spells WHERE id = ?", (spell_id,)).fetchone()[0]
+                before = mask()
+                conn.execute("INSERT INTO spell_classes (spell_id, class_code) VALUES (?, 'monk')", (spell_id,))
+                self.assertEqual(before | mask_for(["monk"]), mask())
+                conn.execute("UPDATE spell_classes SET class_code = 'fighter' WHERE spell_id = ? AND class_code = 'monk'", (spell_id,))
+                self.assertEqual(before | mask_for(["fighter"]), mask())
+                conn.execute("DELETE FROM spell_classes WHERE spell_id = ? AND class_code = 'fighter'", (spell_id,))
+                self.assertEqual(before, mask())
+            finally:
+                conn.rollback()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from engine import db
+
+
+class ConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path_patch = patch("engine.db.SQLITE_PATH", Path(self.tmp.name) / "pool.sqlite3")
+        self.path_patch.start()
+        db.configure_pool(enabled=True, max_size=2, timeout=0.05)
+
+    def tearDown(self):
+        db.configure_pool(enabled=True, max_size=8, timeout=10.0)
+        self.path_patch.stop()
+        self.tmp.cleanup()
+
+    def test_connection_is_reused_with_pragmas_applied(self):
+        with db.connect() as conn:
+            first = id(conn)
+            self.assertEqual(1, conn.execute("PRAGMA foreign_keys").fetchone()[0])
+        with db.connect() as conn:
+            self.assertEqual(first, id(conn))
+            self.assertIsInstance(conn.execute("SELECT 1 AS x").fetchone(), sqlite3.Row)
+        stats = db.pool_stats()
+        self.assertEqual(1, stats["created"])
+        self.assertEqual(1, stats["reused"])
+        self.assertEqual(0, stats["in_use"])
+
+    def test_close_returns_connection_and_rolls_back_open_transaction(self):
+        conn = db.connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS t (x INTEGER)")
+        conn.commit()
+        conn.execute("INSERT INTO t (x) VALUES (1)")
+        conn.close()
+        with db.connect() as conn:
+            self.assertEqual(0, conn.execute("SELECT COUNT(*) FROM t").fetchone()[0])
+        self.assertEqual(1, db.pool_stats()["size"])
+
+    def test_pool_is_bounded(self):
+        held = [db.connect(), db.connect()]
+        with self.assertRaises(db.PoolTimeout):
+            db.connect()
+        stats = db.pool_stats()
+        self.assertEqual(2, stats["in_use"])
+        self.assertEqual(1, stats["timeouts"])
+
+        released = threading.Timer(0.01, held.pop().close)
+        released.start()
+        released.join()
+        with db.connect() as conn:
+            self.assertEqual(1, conn.execute("SELECT 1").fetchone()[0])
+        for conn in held:
+            conn.close()
+
+        db.configure_pool(timeout=1.0)
+        held = [db.connect(), db.connect()]
+        released = threading.Timer(0.05, held.pop().close)
+        released.start()
+        with db.connect() as conn:
+            self.assertEqual(1, conn.execute("SELECT 1").fetchone()[0])
+        released.join()
+        self.assertEqual(1, db.pool_stats()["waits"])
+        for conn in held:
+            conn.close()
+
+    def test_pool_can_be_disabled(self):
+        db.configure_pool(enabled=False)
+        with db.connect() as conn:
+            pass
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+        self.assertEqual({"enabled": False}, db.pool_stats())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+
+from flask.sessions import SecureCookieSessionInterface
+
+import app as app_module
+from engine.derived import DerivedGraph, DerivedState, Node
+
+
+def _graph() -> DerivedGraph:
+    return DerivedGraph(
+        [
+            Node("mod", ("score",), lambda score: (score - 10) // 2),
+            Node("save", ("mod", "pb"), lambda mod, pb: mod + pb),
+            Node("pb", ("level",), lambda level: 2 + (level - 1) // 4),
+            Node("label", ("name",), lambda name: name.upper()),
+        ]
+    )
+
+
+class DerivedGraphTests(unittest.TestCase):
+    def test_order_inputs_and_dependents(self):
+        graph = _graph()
+        self.assertEqual(("level", "name", "score"), graph.inputs)
+        self.assertLess(graph.order.index("mod"), graph.order.index("save"))
+        self.assertLess(graph.order.index("pb"), graph.order.index("save"))
+        self.assertEqual({"mod", "save"}, graph.affected(["score"]))
+
+    def test_cycles_are_rejected(self):
+        with self.assertRaises(ValueError):
+            DerivedGraph([Node("a", ("b",), lambda b: b), Node("b", ("a",), lambda a: a)])
+
+    def test_only_affected_nodes_recompute(self):
+        state = DerivedState(_graph(), {"score": 14, "level": 5, "name": "tester"})
+        self.assertEqual(5, state.get("save"))
+        state.values()
+        self.assertEqual({"mod": 1, "pb": 1, "save": 1, "label": 1}, state.recomputes)
+
+        self.assertEqual({"level"}, state.update({"score": 14, "level": 9, "name": "tester"}))
+        state.values()
+        self.assertEqual({"mod": 1, "pb": 2, "save": 2, "label": 1}, state.recomputes)
+
+        # 14 -> 15 non cambia il modificatore: "save" non si ricalcola.
+        state.update({"score": 15, "level": 9, "name": "tester"})
+        self.assertEqual(6, state.get("save"))
+        self.assertEqual({"mod": 2, "pb": 2, "save": 2, "label": 1}, state.recomputes)
+
+    def test_in_place_mutations_are_detected(self):
+        graph = DerivedGraph([Node("total", ("stats",), lambda stats: sum(stats.values()))])
+        stats = {"for": 10, "des": 12}
+        state = DerivedState(graph, {"stats": stats})
+        self.assertEqual(22, state.get("total"))
+        stats["for"] = 14
+        self.assertEqual({"stats"}, state.update({"stats": stats}))
+        self.assertEqual(26, state.get("total"))
+
+
+class CharacterGraphTests(unittest.TestCase):
+    def setUp(self):
+        self.flask_app = app_module.create_app()
+        self.flask_app.config["TESTING"] = True
+
+    def test_nodes_match_sheet_and_slots(self):
+        pg = app_module.normalize_pg(
+            {
+                "nome": "Tester",
+                "classe": "Druido",
+                "level": 5,
+                "stats_base": {"for": 10, "des": 14, "cos": 12, "int": 8, "sag": 16, "car": 10},
+                "skills_proficient": ["Percezione"],
+            }
+        )
+        sheet = app_module.build_sheet_context(pg)
+        state = DerivedState(app_module.CHARACTER_GRAPH, pg)
+        self.assertEqual(sheet["mods"], state.get("mods"))
+        self.assertEqual(sheet["saves"], state.get("saves"))
+        self.assertEqual(sheet["ac"], state.get("ac"))
+        self.assertEqual(sheet["hpmax"], state.get("hp_max"))
+        self.assertEqual(sheet["passive_perception"], state.get("passive_perception"))
+        self.assertEqual(sheet["spellcasting"], state.get("spellcasting"))
+        self.assertEqual(pg["spell_slots_max"], state.get("spell_slots_max"))
+
+        state.values()
+        before = dict(state.recomputes)
+        pg["armor_id"] = "leather"
+        state.update(pg)
+        state.values()
+        changed = {name for name, n in state.recomputes.items() if n != before[name]}
+        self.assertEqual({"ac"}, changed)
+
+    def test_debug_view(self):
+        with self.flask_app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess["pg"] = {"nome": "Tester", "classe": "Mago", "level": 3}
+            resp = client.get("/debug/derived?format=json")
+            self.assertEqual(200, resp.status_code)
+            nodes = {row["name"]: row for row in resp.get_json()["nodes"]}
+            self.assertEqual(1, nodes["spellcasting"]["recomputes"])
+            self.assertIn("spellcasting", nodes["mods"]["dependents"])
+            self.assertEqual(200, client.get("/debug/derived").status_code)
+            again = {row["name"]: row for row in client.get("/debug/derived?format=json").get_json()["nodes"]}
+            self.assertEqual(1, again["spellcasting"]["recomputes"])
+
+    def test_unnamed_pgs_do_not_share_state(self):
+        # Backend cookie: nessun sid lato server.
+        self.flask_app.session_interface = SecureCookieSessionInterface()
+        counts = []
+        for classe in ("Mago", "Chierico"):
+            with self.flask_app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess["pg"] = {"classe": classe, "level": 3}
+                client.get("/debug/derived?format=json")
+                nodes = {row["name"]: row for row in client.get("/debug/derived?format=json").get_json()["nodes"]}
+                counts.append(nodes["spellcasting"]["recomputes"])
+        # Ogni sessione ha il suo stato: nessun ricalcolo dovuto all'altra.
+        self.assertEqual([1, 1], counts)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import time
+import unittest
+
+import app as app_module
+from engine.fuzzy import TrigramIndex, trigrams
+from engine.spells_repo import search_spells
+
+
+class TrigramIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = TrigramIndex.build(
+            [(1, "Palla di Fuoco"), (2, "Palla di Fuoco Ritardata"), (3, "Dardo Incantato"), (4, "Invisibilità")]
+        )
+
+    def test_trigrams_are_padded_per_word(self):
+        self.assertEqual({"  a", " ab", "ab "}, set(trigrams("ab")))
+
+    def test_ranks_typos_above_threshold(self):
+        hits = self.index.search("palla di fucoo")
+        self.assertEqual([1, 2], [item for item, _ in hits])
+        self.assertGreaterEqual(hits[0][1], hits[1][1])
+        self.assertEqual(4, self.index.search("INVISIBILTA")[0][0])
+        self.assertEqual([], self.index.search("xyzzy"))
+        self.assertEqual(1, len(self.index.search("palla", limit=1)))
+
+
+class FuzzyFallbackTests(unittest.TestCase):
+    def test_search_spells_falls_back_on_typos(self):
+        results = search_spells(q="dardo incantto", limit=10)
+        self.assertEqual("Dardo Incantato", results[0]["name"])
+        self.assertTrue(results[0]["fuzzy"])
+
+        exact = search_spells(q="dardo incantato", limit=10)
+        self.assertNotIn("fuzzy", exact[0])
+
+    def test_fallback_keeps_filters(self):
+        self.assertEqual([], search_spells(q="dardo incantto", level=3, limit=10))
+
+    def test_fuzzy_lookup_is_fast(self):
+        search_spells(q="palla di fucoo", limit=10)  # costruisce l'indice
+        start = time.perf_counter()
+        for _ in range(20):
+            search_spells(q="palla di fucoo", limit=10)
+        self.assertLess((time.perf_counter() - start) / 20, 0.05)
+
+    def test_bestiary_suggests_close_names(self):
+        flask_app = app_module.create_app()
+        flask_app.config["TESTING"] = True
+        body = flask_app.test_client().get("/bestiary?q=basilsco").get_data(as_text=True)
+        self.assertIn("Basilisco", body)
+        self.assertIn("Corrispondenza approssimata", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import patch
+
+from engine.db import connect, ensure_schema
+from engine.ingest import DERIVED_COLUMNS, clean_description, components_text, refresh_spell_fields, spell_fields
+from engine.spells_repo import _DETAIL_CACHE, get_by_id
+
+
+class DerivedFieldTests(unittest.TestCase):
+    def test_clean_description(self):
+        self.assertEqual("Per un minuto.", clean_description("ora Per un minuto.", None))
+        self.assertEqual("Il bersaglio...", clean_description("1 minuto: Il bersaglio...", "1 minuto"))
+        self.assertEqual("—", clean_description("  ", "1 minuto"))
+
+    def test_components_text(self):
+        self.assertEqual("V, S, M (un pizzico di sale)", components_text(1, 1, 1, "un pizzico di sale"))
+        self.assertEqual("-", components_text(0, 0, 0, "ignorato"))
+
+    def test_catalog_rows_are_precomputed(self):
+        with connect() as conn:
+            ensure_schema(conn)
+            where = " OR ".join(f"{col} IS NULL" for col in DERIVED_COLUMNS)
+            self.assertEqual(0, conn.execute(f"SELECT COUNT(*) FROM spells WHERE {where}").fetchone()[0])
+            row = conn.execute("SELECT * FROM spells ORDER BY id LIMIT 1").fetchone()
+            self.assertEqual(spell_fields(row), {col: row[col] for col in DERIVED_COLUMNS})
+
+    def test_get_by_id_reads_stored_fields(self):
+        with connect() as conn:
+            ensure_schema(conn)
+            row = conn.execute("SELECT id, description_clean FROM spells ORDER BY id LIMIT 1").fetchone()
+        _DETAIL_CACHE.clear()
+        with patch("engine.spells_repo.spell_fields", side_effect=AssertionError("regex")):
+            spell = get_by_id(row["id"])
+        self.assertEqual(row["description_clean"], spell["description"])
+
+    def test_update_resets_fields_until_refresh(self):
+        with connect() as conn:
+            ensure_schema(conn)
+            try:
+                spell_id = conn.execute("SELECT id FROM spells ORDER BY id LIMIT 1").fetchone()[0]
+                conn.execute(
+                    "UPDATE spells SET description = 'ora Per un testo nuovo.', range_text = 'self' WHERE id = ?",
+                    (spell_id,),
+                )
+                stale = conn.execute("SELECT description_clean FROM spells WHERE id = ?", (spell_id,)).fetchone()
+                self.assertIsNone(stale[0])
+                with patch.object(conn, "commit"):  # resta tutto nella transazione del test
+                    self.assertEqual(1, refresh_spell_fields(conn))
+                row = conn.execute(
+                    "SELECT description_clean, range_display FROM spells WHERE id = ?", (spell_id,)
+                ).fetchone()
+                self.assertEqual(("Per un testo nuovo.", "Incantatore"), tuple(row))
+            finally:
+                conn.rollback()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from engine import db
+from engine.migrations import LATEST_VERSION, applied_versions, schema_version
+
+
+class MigrationRunnerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "migrations.sqlite3"
+        self.path_patch = patch("engine.db.SQLITE_PATH", self.path)
+        self.path_patch.start()
+        db.configure_pool(enabled=True)
+
+    def tearDown(self):
+        db.configure_pool(enabled=True)
+        self.path_patch.stop()
+        self.tmp.cleanup()
+
+    def test_fresh_database_records_every_version(self):
+        with db.connect() as conn:
+            db.ensure_schema(conn)
+            self.assertEqual({v for v in range(1, LATEST_VERSION + 1)}, applied_versions(conn))
+            self.assertEqual(LATEST_VERSION, schema_version(conn))
+
+    def test_legacy_database_is_upgraded(self):
+        # DB creato dal vecchio ensure_schema: tabelle presenti, nessuna versione registrata.
+        legacy = sqlite3.connect(self.path)
+        legacy.executescript(
+            """
+            CREATE TABLE schema_migrations (
+                version INTEGER PRIMARY KEY,
+                applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+            );
+            CREATE TABLE classes (code TEXT PRIMARY KEY, name_it TEXT NOT NULL);
+            CREATE TABLE class_levels (
+                class_code TEXT NOT NULL,
+                level INTEGER NOT NULL,
+                prof_bonus INTEGER NOT NULL,
+                PRIMARY KEY (class_code, level)
+            );
+            INSERT INTO classes (code, name_it) VALUES ('wizard', 'Mago');
+            """
+        )
+        legacy.close()
+
+        with db.connect() as conn:
+            db.ensure_schema(conn)
+            cols = {r[1] for r in conn.execute("PRAGMA table_info(class_levels)").fetchall()}
+            self.assertIn("spell_slots_json", cols)
+            self.assertIn(2, applied_versions(conn))
+            self.assertEqual("Mago", conn.execute("SELECT name_it FROM classes").fetchone()[0])
+
+    def test_hot_path_skips_ddl(self):
+        with db.connect() as conn:
+            db.ensure_schema(conn)
+        statements: list[str] = []
+        with db.connect() as conn:
+            conn.set_trace_callback(statements.append)
+            db.ensure_schema(conn)
+            db.ensure_schema(conn)
+            conn.set_trace_callback(None)
+        self.assertEqual([], statements)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+import app as app_module
+from engine.pg_model import Character, SpellSlots
+
+
+class SpellSlotsTests(unittest.TestCase):
+    def test_slots_are_validated_once(self):
+        slots = SpellSlots.from_pg(
+            {
+                "spell_slots_max": {"1": "4", "2": 200, "3": "x"},
+                "spell_slots_current": {"1": 9, "2": -1},
+                "pact_slots_max": 2,
+                "pact_slots_current": 5,
+                "pact_slot_level": 12,
+            }
+        )
+        self.assertEqual([4, 99, 0, 0, 0, 0, 0, 0, 0], list(slots.max))
+        self.assertEqual([4, 0, 0, 0, 0, 0, 0, 0, 0], list(slots.current))
+        self.assertEqual((2, 2, 9), (slots.pact_max, slots.pact_current, slots.pact_level))
+
+        slots.adjust(1, 1)
+        slots.adjust(3, 1)
+        self.assertEqual(4, slots.current[0])
+        self.assertEqual(0, slots.current[2])
+        current = slots.to_pg()["spell_slots_current"]
+        self.assertEqual((4, 0, 9), (current["1"], current["2"], len(current)))
+
+    def test_helpers_accept_parsed_slots(self):
+        pg = {
+            "spell_slots_max": {"1": 4, "2": 2},
+            "spell_slots_current": {"1": 0, "2": 1},
+            "pact_slots_max": 1,
+            "pact_slots_current": 1,
+            "pact_slot_level": 2,
+        }
+        slots = SpellSlots.from_pg(pg)
+        self.assertEqual(
+            app_module._available_cast_options_for_spell(pg, 1),
+            app_module._available_cast_options_for_spell(slots, 1),
+        )
+        self.assertEqual(["standard:2", "pact:2"], [o["value"] for o in app_module._available_cast_options_for_spell(slots, 1)])
+        self.assertEqual(
+            app_module._available_cast_levels_for_spell(pg, 2),
+            app_module._available_cast_levels_for_spell(slots, 2),
+        )
+
+    def test_request_pg_slots_are_parsed_once_and_saved_by_save_pg(self):
+        flask_app = app_module.create_app()
+        with flask_app.test_request_context("/"):
+            app_module.session["pg"] = {"classe": "Druido", "level": 3}
+            with patch("app.SpellSlots.from_pg", wraps=SpellSlots.from_pg) as parse:
+                pg = app_module.get_pg()
+                app_module._available_cast_options_for_spell(pg, 1)
+                self.assertTrue(app_module._consume_spell_slot(pg, 1)[0])
+                app_module._available_cast_levels_for_spell(pg, 1)
+                self.assertEqual(1, parse.call_count)
+            self.assertEqual(4, pg["spell_slots_current"]["1"])
+            app_module.save_pg(pg)
+            self.assertEqual(3, app_module.session["pg"]["spell_slots_current"]["1"])
+
+
+class CharacterTests(unittest.TestCase):
+    def setUp(self):
+        self.flask_app = app_module.create_app()
+        self.flask_app.config["TESTING"] = True
+
+    def test_stats_are_an_array_in_stats_order(self):
+        character = Character.from_pg(
+            {
+                "nome": "Tester",
+                "classe": "Mago",
+                "level": 40,
+                "stats_base": {"for": "14", "des": 99, "int": "x", "car": 0},
+            }
+        )
+        self.assertEqual([14, 30, 10, 10, 10, 1], list(character.stats))
+        self.assertEqual((20, 30), (character.level, character.stat("des")))
+        self.assertEqual(12, character.set_stat("sag", "12"))
+        self.assertEqual(12, character.set_stat("sag", "x"))
+
+        pg = app_module.normalize_pg({"nome": "Tester", "classe": "Mago", "level": 3})
+        self.assertEqual(pg, {**pg, **Character.from_pg(pg).to_pg()})
+
+    def test_model_is_built_once_per_request(self):
+        with self.flask_app.test_request_context("/"):
+            app_module.session["pg"] = {"classe": "Mago", "level": 3, "stats_base": {"int": 16}}
+            with patch("app.Character.from_pg", wraps=Character.from_pg) as build:
+                pg = app_module.get_pg()
+                app_module.get_pg()
+                self.assertIs(app_module._character(pg), app_module._character(pg))
+                self.assertEqual(16, app_module._character(pg).stat("int"))
+                self.assertEqual(1, build.call_count)
+
+    def test_form_post_writes_stats_through_the_model(self):
+        with self.flask_app.test_client() as client:
+            client.get("/")
+            form = {"stats_method": "manual", **{f"stat_{s}": "12" for s in app_module.STATS}}
+            form["stat_for"] = "45"
+            form["stat_des"] = "x"
+            self.assertEqual(302, client.post("/", data=form).status_code)
+            with client.session_transaction() as sess:
+                stats = sess["pg"]["stats_base"]
+            self.assertEqual((30, 10, 12), (stats["for"], stats["des"], stats["car"]))
+
+    def test_import_is_validated_by_the_model(self):
+        payload = {
+            "nome": "Importato",
+            "classe": "Druido",
+            "level": "3",
+            "stats_base": {"for": "18", "des": 77},
+            "spell_slots_current": {"1": "50"},
+        }
+        with self.flask_app.test_client() as client:
+            resp = client.post(
+                "/import_character",
+                data={"character_file": (io.BytesIO(json.dumps(payload).encode("utf-8")), "pg.json")},
+                content_type="multipart/form-data",
+            )
+            self.assertEqual(302, resp.status_code)
+            with client.session_transaction() as sess:
+                pg = sess["pg"]
+            self.assertEqual((3, 18, 30), (pg["level"], pg["stats_base"]["for"], pg["stats_base"]["des"]))
+            self.assertEqual(4, pg["spell_slots_current"]["1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
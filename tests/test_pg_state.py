@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import patch
+
+import app as app_module
+from engine.pg_state import STATE_KEY, PGState, digest
+
+
+class PGStateTests(unittest.TestCase):
+    def test_changed_sees_nested_mutations(self):
+        state = PGState({"nome": "Tester", "stats_base": {"for": 10}, "level": 3})
+        self.assertTrue(state.changed())
+        state.mark_normalized()
+        self.assertFalse(state.changed())
+        state.data["stats_base"]["for"] = 12
+        self.assertTrue(state.changed())
+        state.mark_normalized()
+        self.assertFalse(state.changed())
+        self.assertTrue(state.normalized)
+
+    def test_load_trusts_version_only_for_the_same_payload(self):
+        pg = {"nome": "Tester", "level": 3}
+        self.assertTrue(PGState.load(dict(pg), {"version": digest(pg)}).normalized)
+        self.assertFalse(PGState.load({"nome": "Tester", "level": 4}, {"version": digest(pg)}).normalized)
+        self.assertFalse(PGState.load(dict(pg), None).normalized)
+
+    def test_slots_stale_only_when_slot_inputs_change(self):
+        state = PGState({"classe": "Druido", "level": 3, "nome": "Tester"})
+        self.assertTrue(state.slots_stale())
+        state.slots_synced()
+        state.data["nome"] = "Altro"
+        self.assertFalse(state.slots_stale())
+        state.data["level"] = 4
+        self.assertTrue(state.slots_stale())
+
+
+class PGSessionTests(unittest.TestCase):
+    def setUp(self):
+        self.flask_app = app_module.create_app()
+        self.flask_app.config["TESTING"] = True
+
+    def test_unchanged_pg_is_not_normalized_again(self):
+        with self.flask_app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess["pg"] = {"nome": "Tester", "classe": "Druido", "level": 3}
+            self.assertEqual(200, client.get("/").status_code)
+            with client.session_transaction() as sess:
+                self.assertIsNotNone(sess[STATE_KEY]["version"])
+                self.assertEqual(4, sess["pg"]["spell_slots_max"]["1"])
+
+            with patch("app.normalize_pg", side_effect=AssertionError("normalize")), patch(
+                "app.recalc_spell_slots", side_effect=AssertionError("slots")
+            ):
+                self.assertEqual(200, client.get("/").status_code)
+
+    def test_save_recalcs_slots_only_when_inputs_changed(self):
+        with self.flask_app.test_request_context("/"):
+            app_module.session["pg"] = {"nome": "Tester", "classe": "Druido", "level": 3}
+            pg = app_module.get_pg()
+            with patch("app.recalc_spell_slots", wraps=app_module.recalc_spell_slots) as recalc:
+                pg["nome"] = "Altro"
+                app_module.save_pg(pg)
+                recalc.assert_not_called()
+                pg["level"] = 5
+                app_module.save_pg(pg)
+                recalc.assert_called_once()
+            self.assertEqual(2, pg["spell_slots_max"]["3"])
+            # La versione salvata resta valida: la GET dopo il redirect non normalizza.
+            saved = PGState.load(app_module.session["pg"], app_module.session[STATE_KEY])
+            self.assertTrue(saved.normalized)
+            self.assertFalse(saved.slots_stale())
+
+    def test_get_after_save_skips_normalize(self):
+        with self.flask_app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess["pg"] = {"classe": "Druido", "level": 3, "spell_slots_current": {"1": 0}}
+            client.get("/")
+            resp = client.post("/character/spell_slots/rest", data={"rest_type": "long"})
+            self.assertEqual(302, resp.status_code)
+            with client.session_transaction() as sess:
+                self.assertEqual(4, sess["pg"]["spell_slots_current"]["1"])
+            with patch("app.normalize_pg", side_effect=AssertionError("normalize")), patch(
+                "app.recalc_spell_slots", side_effect=AssertionError("slots")
+            ):
+                self.assertEqual(200, client.get("/").status_code)
+
+    def test_edited_pact_fields_trigger_a_recalc(self):
+        state = PGState({"classe": "Warlock", "level": 3, "pact_slots_max": 2})
+        state.slots_synced()
+        state.data["pact_slots_max"] = 9
+        self.assertTrue(state.slots_stale())
+
+
+if __name__ == "__main__":
+    unittest.main()
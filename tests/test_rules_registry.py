@@ -0,0 +1,49 @@
+import unittest
+from unittest.mock import patch
+
+from engine import calc
+from engine.db import invalidate_catalog
+from engine.rules_registry import clear_rules_registry, get_rules_registry
+
+
+class RulesRegistryTests(unittest.TestCase):
+    def setUp(self):
+        clear_rules_registry()
+
+    def test_indexes_by_code_and_italian_name(self):
+        registry = get_rules_registry()
+        wizard = registry.get("wizard")
+        self.assertIsNotNone(wizard)
+        self.assertIs(wizard, registry.get("Mago"))
+        self.assertEqual("wizard", registry.code_for_name("Mago"))
+        self.assertEqual(6, wizard.hit_die)
+        self.assertEqual((4, 2, 0, 0, 0, 0, 0, 0, 0), wizard.level(3).spell_slots_by_level)
+        with self.assertRaises(TypeError):
+            registry.by_code["wizard"] = wizard
+
+    def test_sheet_helpers_do_no_io_once_loaded(self):
+        get_rules_registry()
+        with patch("engine.rules_registry.connect", side_effect=AssertionError("I/O")):
+            self.assertEqual(12, calc.hit_die("Barbaro"))
+            self.assertEqual(["int", "sag"], calc.saving_throws({"code": "wizard"}))
+            choices = calc.class_skill_choices("Ladro")
+            self.assertEqual(4, choices["choose"])
+            choices["from"].append("X")
+            self.assertNotIn("X", calc.class_skill_choices("Ladro")["from"])
+
+    def test_falls_back_to_rules_constants(self):
+        with patch("engine.rules_registry._load_registry", side_effect=RuntimeError("db down")):
+            invalidate_catalog()
+            self.assertEqual(12, calc.hit_die("Barbaro"))
+            self.assertEqual(["sag", "car"], calc.saving_throws("Paladino"))
+            self.assertIsNone(calc.class_skill_choices("Mago"))
+
+    def test_invalidate_catalog_reloads(self):
+        first = get_rules_registry()
+        self.assertIs(first, get_rules_registry())
+        invalidate_catalog()
+        self.assertIsNot(first, get_rules_registry())
+
+
+if __name__ == "__main__":
+    unittest.main()
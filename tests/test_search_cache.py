@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import patch
+
+from engine import spells_repo
+from engine.cache import LRUCache
+from engine.db import invalidate_catalog
+from engine.spells_repo import search_cache_stats, search_spells
+
+
+class TTLTests(unittest.TestCase):
+    def test_entries_expire(self):
+        cache = LRUCache("test_ttl", maxsize=4, ttl=10)
+        with patch("engine.cache.time.monotonic", return_value=100.0):
+            cache.put("a", 1)
+            self.assertEqual(1, cache.get("a"))
+        with patch("engine.cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(1, cache.stats()["expirations"])
+
+
+class SearchCacheTests(unittest.TestCase):
+    def setUp(self):
+        spells_repo._SEARCH_CACHE.clear()
+
+    def test_repeated_filters_served_from_memory(self):
+        first = search_spells(q="", class_code="wizard", level=1, limit=30)
+        hits = search_cache_stats()["hits"]
+        with patch.object(spells_repo, "_search_spells", side_effect=AssertionError("ricerca")):
+            # Stessa tupla normalizzata: spazi, maiuscole del codice, lista classi in altro ordine.
+            second = search_spells(q="  ", class_code=" Wizard", level=1, limit=30)
+            self.assertEqual(first, second)
+        stats = search_cache_stats()
+        self.assertEqual(hits + 1, stats["hits"])
+        self.assertGreater(stats["hit_ratio"], 0)
+
+        # Copie: chi modifica i risultati non sporca la cache.
+        second[0]["cast_options"] = ["x"]
+        self.assertNotIn("cast_options", search_spells(q="", class_code="wizard", level=1, limit=30)[0])
+
+        a = search_spells(q="", class_codes=["druid", "ranger"], limit=10)
+        with patch.object(spells_repo, "_search_spells", side_effect=AssertionError("ricerca")):
+            self.assertEqual(a, search_spells(q="", class_codes=["ranger", "druid", "ranger"], limit=10))
+
+    def test_catalog_change_invalidates(self):
+        search_spells(q="fuoco", limit=5)
+        invalidate_catalog()
+        with patch.object(spells_repo, "_search_spells", wraps=spells_repo._search_spells) as run:
+            search_spells(q="fuoco", limit=5)
+        self.assertEqual(1, run.call_count)
+
+    def test_invalid_cursor_still_raises(self):
+        with self.assertRaises(ValueError):
+            search_spells(q="", after="non-un-cursore")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import patch
+
+import app as app_module
+from engine.db import connect, ensure_schema
+from engine.search_keys import name_key_filter, prefix_bounds, refresh_search_keys, search_key
+
+
+class SearchKeyTests(unittest.TestCase):
+    def test_folds_accents_case_and_punctuation(self):
+        self.assertEqual("rapidita", search_key("Rapidità"))
+        self.assertEqual("drago d oro adulto", search_key("  Drago d'oro -- ADULTO "))
+        self.assertEqual("", search_key(None))
+
+    def test_prefix_bounds(self):
+        self.assertEqual(("drag", "drah"), prefix_bounds("drag"))
+
+    def test_catalog_rows_are_keyed_and_prefix_uses_index(self):
+        with connect() as conn:
+            ensure_schema(conn)
+            missing = conn.execute("SELECT COUNT(*) FROM spells WHERE name_key IS NULL").fetchone()[0]
+            self.assertEqual(0, missing)
+            sql, params = name_key_filter("name_key", "Invisibilità")
+            rows = conn.execute(f"SELECT name_it FROM spells WHERE {sql}", params).fetchall()
+            self.assertIn("Invisibilità", [r[0] for r in rows])
+            plan = " ".join(
+                str(r[-1]) for r in conn.execute(f"EXPLAIN QUERY PLAN SELECT id FROM monsters WHERE {sql}", params)
+            )
+            self.assertIn("idx_monsters_name_key", plan)
+
+    def test_rename_resets_key_until_refresh(self):
+        with connect() as conn:
+            ensure_schema(conn)
+            try:
+                spell_id = conn.execute("SELECT id FROM spells ORDER BY id LIMIT 1").fetchone()[0]
+                conn.execute("UPDATE spells SET name_it = 'Velocità Prova' WHERE id = ?", (spell_id,))
+                self.assertIsNone(conn.execute("SELECT name_key FROM spells WHERE id = ?", (spell_id,)).fetchone()[0])
+                with patch.object(conn, "commit"):  # resta tutto nella transazione del test
+                    self.assertEqual(1, refresh_search_keys(conn))
+                key = conn.execute("SELECT name_key FROM spells WHERE id = ?", (spell_id,)).fetchone()[0]
+                self.assertEqual("velocita prova", key)
+            finally:
+                conn.rollback()
+
+
+class BestiarySearchTests(unittest.TestCase):
+    def setUp(self):
+        flask_app = app_module.create_app()
+        flask_app.config["TESTING"] = True
+        self.client = flask_app.test_client()
+
+    def test_accent_insensitive_prefix_then_contains(self):
+        body = self.client.get("/bestiary?q=DRAGO D'ORO").get_data(as_text=True)
+        self.assertIn("Drago d&#39;oro adulto", body)
+        body = self.client.get("/bestiary?q=cuccioló").get_data(as_text=True)
+        self.assertIn("Drago rosso cucciolo", body)
+
+    def test_mid_name_matches_follow_prefix_matches(self):
+        body = self.client.get("/bestiary?q=drago").get_data(as_text=True)
+        self.assertIn("Testuggine dragona", body)
+        self.assertLess(body.index("Drago rosso cucciolo"), body.index("Testuggine dragona"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from flask import Flask, session
+
+from engine import db, sessions
+from engine.sessions import SQLiteSessionInterface, gc_sessions
+
+
+def _make_app() -> Flask:
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.session_interface = SQLiteSessionInterface()
+
+    @app.route("/set/<name>")
+    def set_name(name):
+        session["pg"] = {"nome": name, "stats": {"for": 10}, "slots": (1, 2)}
+        return "ok"
+
+    @app.route("/same")
+    def same():
+        # Come get_pg/save_pg: riassegna lo stesso PG a ogni richiesta.
+        session["pg"] = dict(session.get("pg") or {})
+        return "ok"
+
+    @app.route("/get")
+    def get():
+        return (session.get("pg") or {}).get("nome", "")
+
+    @app.route("/clear")
+    def clear():
+        session.clear()
+        return "ok"
+
+    return app
+
+
+class ServerSessionTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path_patch = patch("engine.db.SQLITE_PATH", Path(self.tmp.name) / "sessions.sqlite3")
+        self.path_patch.start()
+        db.configure_pool(enabled=False)
+        sessions.clear_session_cache()
+        self.app = _make_app()
+
+    def tearDown(self):
+        db.configure_pool(enabled=True, max_size=8, timeout=10.0)
+        sessions.clear_session_cache()
+        self.path_patch.stop()
+        self.tmp.cleanup()
+
+    def _rows(self):
+        with db.connect() as conn:
+            return conn.execute("SELECT sid, data FROM sessions").fetchall()
+
+    def test_cookie_holds_only_sid_and_data_round_trips(self):
+        with self.app.test_client() as client:
+            client.get("/set/Tester")
+            cookie = client.get_cookie("session")
+            self.assertLessEqual(len(cookie.value), 64)
+            self.assertNotIn("Tester", cookie.value)
+            self.assertEqual(b"Tester", client.get("/get").data)
+
+            rows = self._rows()
+            self.assertEqual([cookie.value], [r[0] for r in rows])
+
+            # Senza LRU si rilegge dal DB, tuple comprese.
+            sessions.clear_session_cache()
+            with client.session_transaction() as sess:
+                self.assertEqual((1, 2), sess["pg"]["slots"])
+
+    def test_unchanged_pg_is_not_written(self):
+        with self.app.test_client() as client:
+            client.get("/set/Tester")
+            with patch.object(sessions.SessionStore, "save", side_effect=AssertionError("scrittura")):
+                client.get("/same")
+                client.get("/get")
+            client.get("/set/Altro")
+            self.assertIn("Altro", self._rows()[0][1])
+
+    def test_stale_cached_copy_does_not_overwrite_newer_row(self):
+        with self.app.test_client() as client:
+            client.get("/set/Tester")
+            sid = client.get_cookie("session").value
+            # Un altro processo aggiorna la riga; qui la LRU ha ancora la copia vecchia.
+            with db.connect() as conn:
+                conn.execute(
+                    "UPDATE sessions SET data = replace(data, 'Tester', 'Remoto'), updated_at = updated_at + 1 WHERE sid = ?",
+                    (sid,),
+                )
+                conn.commit()
+            self.assertEqual(b"Tester", client.get("/get").data)
+            client.get("/set/Locale")
+            self.assertIn("Remoto", self._rows()[0][1])
+            # La voce vecchia e' stata tolta: si rilegge la riga piu' recente.
+            self.assertEqual(b"Remoto", client.get("/get").data)
+            client.get("/set/Locale")
+            self.assertIn("Locale", self._rows()[0][1])
+
+    def test_unknown_sid_gets_a_new_session(self):
+        with self.app.test_client() as client:
+            client.set_cookie("session", "inventato")
+            client.get("/set/Tester")
+            self.assertNotEqual("inventato", client.get_cookie("session").value)
+
+    def test_clear_deletes_row_and_cookie(self):
+        with self.app.test_client() as client:
+            client.get("/set/Tester")
+            client.get("/clear")
+            self.assertEqual([], self._rows())
+            self.assertIsNone(client.get_cookie("session"))
+
+    def test_expired_sessions_are_dropped_and_collected(self):
+        with self.app.test_client() as client:
+            client.get("/set/Tester")
+            sessions.clear_session_cache()
+            with patch("engine.sessions.time.time", return_value=time.time() + 40 * 86400):
+                self.assertEqual(b"", client.get("/get").data)
+        with self.app.test_client() as client:
+            client.get("/set/Altro")
+        self.assertEqual(1, gc_sessions(now=time.time() + 40 * 86400))
+        self.assertEqual([], self._rows())
+
+
+if __name__ == "__main__":
+    unittest.main()
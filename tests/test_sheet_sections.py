@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import patch
+
+import app as app_module
+from engine.db import invalidate_catalog
+
+
+def _pg(**overrides) -> dict:
+    pg = app_module.normalize_pg(
+        {
+            "nome": "Tester",
+            "classe": "Druido",
+            "level": 5,
+            "stats_base": {"for": 10, "des": 14, "cos": 12, "int": 8, "sag": 16, "car": 10},
+        }
+    )
+    pg.update(overrides)
+    return pg
+
+
+class SheetSectionsTests(unittest.TestCase):
+    def setUp(self):
+        app_module.SHEET_SECTION_CACHE.clear()
+
+    def test_sections_subset(self):
+        pg = _pg()
+        sheet = app_module.build_sheet_context(pg, sections=("spellcasting",))
+        self.assertEqual({"spellcasting"}, set(sheet))
+        self.assertEqual(8 + 3 + 3, sheet["spellcasting"]["dc"])
+        full = app_module.build_sheet_context(pg)
+        self.assertEqual(sheet["spellcasting"], full["spellcasting"])
+        self.assertIn("attacks_rows", full)
+        self.assertIn("armor_options", full)
+
+    def test_unchanged_inputs_recompute_nothing(self):
+        pg = _pg()
+        app_module.build_sheet_context(pg)
+        with patch.dict(app_module._SHEET_BUILDERS, {name: None for name in app_module.SHEET_SECTIONS}):
+            # Campi che nessuna sezione legge (nome, slot) non invalidano nulla.
+            pg["nome"] = "Altro"
+            pg["spell_slots_current"] = {"1": 0}
+            sheet = app_module.build_sheet_context(dict(pg))
+        self.assertEqual(16, sheet["totals"]["sag"])
+
+    def test_only_sections_reading_a_field_are_rebuilt(self):
+        pg = _pg()
+        app_module.build_sheet_context(pg)
+        calls = []
+        builders = {
+            name: (lambda fn, name: lambda *a: calls.append(name) or fn(*a))(fn, name)
+            for name, fn in app_module._SHEET_BUILDERS.items()
+        }
+        with patch.dict(app_module._SHEET_BUILDERS, builders):
+            pg["hp_current"] = 3
+            sheet = app_module.build_sheet_context(pg)
+            self.assertEqual(["defenses"], calls)
+            self.assertEqual(3, sheet["hp"]["current"])
+
+            calls.clear()
+            pg["stats_base"]["sag"] = 18
+            sheet = app_module.build_sheet_context(pg)
+        self.assertEqual({"abilities", "defenses", "skills", "spellcasting", "attacks"}, set(calls))
+        self.assertEqual(4, sheet["spellcasting"]["mod"])
+
+    def test_catalog_change_invalidates_sections(self):
+        pg = _pg()
+        app_module.build_sheet_context(pg)
+        calls = []
+        builders = {
+            name: (lambda fn, name: lambda *a: calls.append(name) or fn(*a))(fn, name)
+            for name, fn in app_module._SHEET_BUILDERS.items()
+        }
+        with patch.dict(app_module._SHEET_BUILDERS, builders):
+            invalidate_catalog()
+            app_module.build_sheet_context(pg)
+        self.assertEqual(set(app_module.SHEET_SECTIONS), set(calls))
+
+    def test_cached_values_do_not_alias_the_pg(self):
+        pg = _pg()
+        sheet = app_module.build_sheet_context(pg)
+        pg["stats_base"]["for"] = 20
+        self.assertEqual(10, sheet["base_stats"]["for"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import patch
+
+import app as app_module
+from engine.cache import LRUCache
+from engine.db import invalidate_catalog
+from engine.spells_repo import _DETAIL_CACHE, get_by_id, search_spells
+
+
+class LRUCacheTests(unittest.TestCase):
+    def test_eviction_stamp_and_counters(self):
+        cache = LRUCache("test_lru", maxsize=2)
+        cache.put("a", 1, stamp=1)
+        cache.put("b", 2, stamp=1)
+        self.assertEqual(1, cache.get("a", 1))
+        cache.put("c", 3, stamp=1)  # "b" e' la meno recente
+        self.assertIsNone(cache.get("b", 1))
+        self.assertEqual(3, cache.get("c", 1))
+        self.assertIsNone(cache.get("a", 2))  # stamp nuovo: cache svuotata
+        stats = cache.stats()
+        self.assertEqual((2, 2, 1, 1), (stats["hits"], stats["misses"], stats["evictions"], stats["invalidations"]))
+
+
+class SpellDetailCacheTests(unittest.TestCase):
+    def setUp(self):
+        _DETAIL_CACHE.clear()
+        self.spell_id = search_spells(q="", level=3, limit=1)[0]["id"]
+
+    def test_second_read_does_no_db_work(self):
+        first = get_by_id(self.spell_id)
+        with patch("engine.spells_repo.connect", side_effect=AssertionError("I/O")):
+            second = get_by_id(self.spell_id)
+        self.assertEqual(first, second)
+        second["name"] = "modificato"
+        self.assertNotEqual("modificato", get_by_id(self.spell_id)["name"])
+
+    def test_catalog_change_invalidates(self):
+        get_by_id(self.spell_id)
+        misses = _DETAIL_CACHE.stats()["misses"]
+        invalidate_catalog()
+        get_by_id(self.spell_id)
+        self.assertEqual(misses + 1, _DETAIL_CACHE.stats()["misses"])
+
+    def test_detail_fragment_is_cached(self):
+        flask_app = app_module.create_app()
+        flask_app.config["TESTING"] = True
+        client = flask_app.test_client()
+        body = client.get(f"/spell/{self.spell_id}").get_data(as_text=True)
+        with patch("app.get_by_id", side_effect=AssertionError("render")):
+            self.assertEqual(body, client.get(f"/spell/{self.spell_id}").get_data(as_text=True))
+        self.assertEqual(404, client.get("/spell/999999").status_code)
+
+    def test_detail_origin_is_resolved_through_the_registry(self):
+        flask_app = app_module.create_app()
+        flask_app.config["TESTING"] = True
+        client = flask_app.test_client()
+        body = client.get(f"/spell/{self.spell_id}").get_data(as_text=True)
+        self.assertEqual(404, client.get(f"/spell/{self.spell_id}?origin=inventata").status_code)
+        with patch("app.get_by_id", side_effect=AssertionError("render")):
+            # Stessa sorgente, stessa voce di cache.
+            self.assertEqual(body, client.get(f"/spell/{self.spell_id}?origin=SRD").get_data(as_text=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import itertools
+import unittest
+from unittest.mock import patch
+
+import app as app_module
+from engine import spell_index, spells_repo
+from engine.spells_repo import search_spells, spell_facets
+
+
+def _sql_only(**kwargs):
+    enabled = spell_index.SPELL_INDEX_ENABLED
+    spell_index.SPELL_INDEX_ENABLED = False
+    try:
+        spells_repo._FACET_CACHE.clear()
+        return spell_facets(**kwargs)
+    finally:
+        spell_index.SPELL_INDEX_ENABLED = enabled
+        spells_repo._FACET_CACHE.clear()
+
+
+class SpellFacetTests(unittest.TestCase):
+    def setUp(self):
+        spell_index.configure_spell_index(True)
+        spells_repo._FACET_CACHE.clear()
+
+    def test_bitsets_match_aggregate_query(self):
+        combos = itertools.product((None, 3), (None, "wizard"), (None, ["druid", "ranger"]), (False, True), (False, True))
+        for level, class_code, class_codes, ritual, concentration in combos:
+            kwargs = dict(
+                q="",
+                level=level,
+                class_code=class_code,
+                class_codes=class_codes,
+                ritual_only=ritual,
+                concentration_only=concentration,
+            )
+            with self.subTest(**kwargs):
+                self.assertEqual(_sql_only(**kwargs), spell_facets(**kwargs))
+
+    def test_counts_match_search_results(self):
+        facets = spell_facets(q="fuoco", level=3)
+        self.assertEqual(len(search_spells(q="fuoco", level=3, limit=1000)), facets["total"])
+        for lv, count in facets["level"].items():
+            self.assertEqual(len(search_spells(q="fuoco", level=lv, limit=1000)), count)
+        wizard = spell_facets(q="", class_code="wizard", ritual_only=True)
+        self.assertEqual(len(search_spells(q="", class_code="wizard", ritual_only=True, limit=1000)), wizard["total"])
+        self.assertEqual(wizard["total"], sum(wizard["level"].values()))
+        self.assertEqual(len(search_spells(q="", class_code="cleric", ritual_only=True, limit=1000)), wizard["class"]["cleric"])
+        self.assertEqual(sum(wizard["school"].values()), wizard["total"])
+
+    def test_cached_by_normalized_filters(self):
+        spell_facets(q="Fuoco ", level=3)
+        with patch.object(spells_repo, "connect", side_effect=AssertionError("I/O")):
+            spell_facets(q=" fuoco", level=3)
+        self.assertGreaterEqual(spells_repo._FACET_CACHE.stats()["hits"], 1)
+
+    def test_page_shows_counts(self):
+        flask_app = app_module.create_app()
+        flask_app.config["TESTING"] = True
+        body = flask_app.test_client().get("/spells?level=1").get_data(as_text=True)
+        facets = spell_facets(q="", level=1)
+        self.assertIn(f"Mago ({facets['class']['wizard']})", body)
+        self.assertIn(f"Solo rituali <span class=\"mono\">({facets['ritual']})</span>", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
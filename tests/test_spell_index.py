@@ -0,0 +1,80 @@
+import itertools
+import time
+import unittest
+
+from engine import spell_index, spells_repo
+from engine.spell_index import IndexedSpell, SpellIndex
+from engine.spells_repo import search_spells, spell_cursor
+
+
+def _sql_only(**kwargs):
+    enabled = spell_index.SPELL_INDEX_ENABLED
+    spell_index.SPELL_INDEX_ENABLED = False
+    # La cache dei risultati servirebbe la stessa risposta a entrambe le strade.
+    spells_repo._SEARCH_CACHE.clear()
+    try:
+        return search_spells(**kwargs)
+    finally:
+        spell_index.SPELL_INDEX_ENABLED = enabled
+        spells_repo._SEARCH_CACHE.clear()
+
+
+class SpellIndexTests(unittest.TestCase):
+    def setUp(self):
+        spell_index.configure_spell_index(True)
+
+    def test_matches_sql_for_filter_combinations(self):
+        combos = itertools.product(
+            (None, 0, 3),
+            (None, 2),
+            (None, "wizard", "__no_class__"),
+            (None, ["druid", "ranger"]),
+            (False, True),
+            (False, True),
+        )
+        for level, max_level, class_code, class_codes, ritual, concentration in combos:
+            kwargs = dict(
+                q="",
+                level=level,
+                max_level=max_level,
+                class_code=class_code,
+                class_codes=class_codes,
+                ritual_only=ritual,
+                concentration_only=concentration,
+                limit=25,
+                offset=5,
+            )
+            with self.subTest(**kwargs):
+                self.assertEqual(_sql_only(**kwargs), search_spells(**kwargs))
+
+    def test_cursors_match_sql(self):
+        first = search_spells(q="", class_code="cleric", limit=10)
+        cursor = spell_cursor(first[-1])
+        self.assertEqual(
+            _sql_only(q="", class_code="cleric", limit=10, after=cursor),
+            search_spells(q="", class_code="cleric", limit=10, after=cursor),
+        )
+        self.assertEqual(first[2:9], search_spells(q="", class_code="cleric", limit=7, before=cursor))
+
+    def test_prefix_lookup_and_speed(self):
+        index = SpellIndex.build(
+            [
+                IndexedSpell(1, "srd", "Palla di Fuoco", 3, "Invocazione", False, False, 0),
+                IndexedSpell(2, "srd", "Pallida Luce", 1, "Evocazione", False, False, 0),
+                IndexedSpell(3, "srd", "Dardo", 1, "Invocazione", False, False, 0),
+            ]
+        )
+        self.assertEqual([1, 2], [sp.id for sp in index.prefix("pall")])
+        self.assertEqual([], index.prefix("zz"))
+        invocations = index.page(index.select(school="Invocazione"), limit=10)
+        self.assertEqual([3, 1], [sp.id for sp in invocations])
+
+        search_spells(q="", class_code="wizard", limit=30)
+        start = time.perf_counter()
+        for _ in range(200):
+            search_spells(q="", class_code="wizard", max_level=3, limit=30, offset=30)
+        self.assertLess((time.perf_counter() - start) / 200, 0.002)
+
+
+if __name__ == "__main__":
+    unittest.main()
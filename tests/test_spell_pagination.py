@@ -0,0 +1,44 @@
+import re
+import unittest
+from unittest.mock import patch
+
+import app as app_module
+from engine.spells_repo import decode_spell_cursor, search_spells, spell_cursor
+
+
+class KeysetPaginationTests(unittest.TestCase):
+    def test_cursor_pages_match_offset_pages(self):
+        full = search_spells(q="", class_code="wizard", limit=1000)
+        self.assertGreater(len(full), 40)
+
+        first = search_spells(q="", class_code="wizard", limit=20)
+        second = search_spells(q="", class_code="wizard", limit=20, after=spell_cursor(first[-1]))
+        self.assertEqual(full[:20], first)
+        self.assertEqual(full[20:40], second)
+        self.assertEqual(second, search_spells(q="", class_code="wizard", limit=20, offset=20))
+
+        back = search_spells(q="", class_code="wizard", limit=20, before=spell_cursor(second[0]))
+        self.assertEqual(first, back)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_spell_cursor("non-un-cursore")
+        with self.assertRaises(ValueError):
+            search_spells(q="", limit=5, after="%%%")
+
+    def test_route_links_use_cursors(self):
+        flask_app = app_module.create_app()
+        flask_app.config["TESTING"] = True
+        with flask_app.test_client() as client, patch("app._current_session_character_id", return_value=None):
+            body = client.get("/spells?class_code=wizard").get_data(as_text=True)
+            match = re.search(r'href="([^"]*after=[^"&]+[^"]*page=2)"', body)
+            self.assertIsNotNone(match)
+            page2 = client.get(match.group(1).replace("&amp;", "&")).get_data(as_text=True)
+            self.assertIn("Pagina 2", page2)
+            self.assertIn("before=", page2)
+            # Cursore rovinato: si torna alla paginazione per pagina.
+            self.assertEqual(200, client.get("/spells?class_code=wizard&after=xx&page=2").status_code)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import sqlite3
+import unittest
+
+from engine.db import connect, ensure_schema
+from engine.spell_fts import fts_query, snippet_html
+from engine.spells_repo import search_spells
+
+
+class SpellFullTextSearchTests(unittest.TestCase):
+    def test_query_terms_become_prefixes(self):
+        self.assertEqual('"palla"* "fuoco"*', fts_query("palla, fuoco"))
+        self.assertIsNone(fts_query("  ?! "))
+
+    def test_matches_description_and_ignores_accents(self):
+        names = [sp["name"] for sp in search_spells(q="invisibilita", limit=100)]
+        self.assertIn("Invisibilità", names)
+        self.assertIn("Vedere Invisibilità", names)
+
+        by_text = search_spells(q="scintilla", limit=100)
+        self.assertIn("Dardo di Fuoco", [sp["name"] for sp in by_text])
+        self.assertIn("<mark>scintilla</mark>", by_text[0]["snippet"])
+
+    def test_relevance_puts_name_matches_first(self):
+        results = search_spells(q="palla di fuoco", limit=3, sort="relevance")
+        self.assertEqual("Palla di Fuoco", results[0]["name"])
+        by_level = search_spells(q="palla di fuoco", limit=100)
+        levels = [sp["level"] for sp in by_level]
+        self.assertEqual(sorted(levels), levels)
+
+    def test_snippet_is_escaped(self):
+        self.assertEqual("&lt;b&gt; <mark>x</mark>", snippet_html("<b> \x02x\x03"))
+        self.assertEqual("", snippet_html("senza termini"))
+
+    def test_index_follows_spell_changes(self):
+        with connect() as conn:
+            ensure_schema(conn)
+            try:
+                conn.execute(
+                    "INSERT INTO spells (slug, name_it, level, school, casting_time, range_text, duration_text, description) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    ("zzprova-ricerca", "Zzprova Ricerca", 1, "Evocazione", "1 azione", "Sé", "Istantanea", "Testo qwertyuniq di prova."),
+                )
+                found = conn.execute(
+                    "SELECT rowid FROM spells_fts WHERE spells_fts MATCH ?", ('"qwertyuniq"*',)
+                ).fetchall()
+                self.assertEqual(1, len(found))
+                conn.execute("UPDATE spells SET description = 'altro' WHERE name_it = 'Zzprova Ricerca'")
+                found = conn.execute(
+                    "SELECT rowid FROM spells_fts WHERE spells_fts MATCH ?", ('"qwertyuniq"*',)
+                ).fetchall()
+                self.assertEqual([], found)
+            except sqlite3.OperationalError as exc:
+                self.skipTest(str(exc))
+            finally:
+                conn.rollback()
+
+
+if __name__ == "__main__":
+    unittest.main()
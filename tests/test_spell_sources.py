@@ -0,0 +1,110 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from engine import db, spell_sources, spells_repo
+from engine.db import SQLITE_PATH, connect
+from engine.spell_sources import SpellSource, register_source, union_sql
+from engine.spells_repo import get_by_id, get_by_ids, search_spells
+
+
+def _make_source_db(path: Path) -> None:
+    with sqlite3.connect(SQLITE_PATH) as main:
+        ddl = [
+            r[0]
+            for r in main.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name IN ('spells', 'spell_classes')"
+            )
+        ]
+    with sqlite3.connect(path) as out:
+        for sql in ddl:
+            out.execute(sql)
+        out.execute(
+            "INSERT INTO spells (id, slug, name_it, level, school, casting_time, range_text, duration_text, description) "
+            "VALUES (1, 'lampo-casalingo', 'Lampo Casalingo', 1, 'Invocazione', '1 azione', '18 m', 'Istantanea', 'Un lampo fatto in casa.')"
+        )
+        out.execute("INSERT INTO spell_classes (spell_id, class_code) VALUES (1, 'wizard')")
+
+
+class SpellSourceRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "homebrew.sqlite3"
+        _make_source_db(self.path)
+        self.saved = dict(spell_sources._SOURCES)
+        register_source(SpellSource("homebrew", alias="hb", path=self.path, opt_in=True))
+
+    def tearDown(self):
+        spell_sources._SOURCES.clear()
+        spell_sources._SOURCES.update(self.saved)
+        # Le connessioni del pool hanno agganciato il file: chiuderle prima di cancellarlo.
+        db.configure_pool(enabled=True)
+        self.tmp.cleanup()
+
+    def test_third_source_joins_search_and_detail(self):
+        self.assertNotIn("homebrew", {sp["origin"] for sp in search_spells(q="lampo", limit=50)})
+
+        found = search_spells(q="lampo casalingo", class_code="wizard", include_private=True, limit=50)
+        self.assertEqual(["homebrew:1"], [sp["spell_key"] for sp in found if sp["origin"] == "homebrew"])
+        self.assertIn("homebrew:1", [sp["spell_key"] for sp in search_spells(q="", level=1, include_private=True, limit=500)])
+
+        detail = get_by_id(1, origin="homebrew", include_private=True)
+        self.assertEqual("Lampo Casalingo", detail["name"])
+        self.assertEqual("wizard", detail["class_codes"])
+        self.assertIsNone(get_by_id(1, origin="homebrew"))
+
+    def test_batch_details_one_query_per_source(self):
+        spells_repo._DETAIL_CACHE.clear()
+        srd = [sp["spell_key"] for sp in search_spells(q="", level=1, limit=3)]
+        keys = [srd[2], "homebrew:1", srd[0], "srd:999999", "rotta", srd[1], srd[0]]
+        with patch.object(spells_repo, "_load_spell_details", wraps=spells_repo._load_spell_details) as load:
+            found = get_by_ids(keys, include_private=True)
+        self.assertEqual(2, load.call_count)
+        self.assertEqual([srd[2], "homebrew:1", srd[0], srd[1], srd[0]], [sp["spell_key"] for sp in found])
+        self.assertEqual(get_by_id(1, origin="homebrew", include_private=True), found[1])
+        self.assertEqual(["srd"], sorted({sp["origin"] for sp in get_by_ids(keys)}))
+
+        cached = [key for key in keys if key != "srd:999999"]  # gli id inesistenti non vanno in cache
+        with patch.object(spells_repo, "connect", side_effect=AssertionError("I/O")):
+            self.assertEqual(found, get_by_ids(cached, include_private=True))
+
+    def test_attach_once_per_connection_and_cached_sql(self):
+        sources = spell_sources.spell_sources(include_private=True)
+        with connect() as conn:
+            first = spell_sources.attach_sources(conn, sources)
+            second = spell_sources.attach_sources(conn, sources)
+            self.assertEqual(first, second)
+            aliases = [r[1] for r in conn.execute("PRAGMA database_list").fetchall()]
+            self.assertEqual(1, aliases.count("hb"))
+
+        parts = tuple((src.schema, src.origin, src.has_class_mask, "all") for src in first)
+        union_sql(parts)
+        hits = union_sql.cache_info().hits
+        union_sql(parts)
+        self.assertEqual(hits + 1, union_sql.cache_info().hits)
+
+    def test_replaced_file_is_reattached(self):
+        sources = spell_sources.spell_sources(include_private=True)
+        with connect() as conn:
+            spell_sources.attach_sources(conn, sources)
+            replacement = Path(self.tmp.name) / "homebrew-new.sqlite3"
+            _make_source_db(replacement)
+            with sqlite3.connect(replacement) as out:
+                out.execute("UPDATE spells SET name_it = 'Lampo Rifatto' WHERE id = 1")
+            replacement.replace(self.path)
+
+            spell_sources.attach_sources(conn, sources)
+            self.assertEqual("Lampo Rifatto", conn.execute("SELECT name_it FROM hb.spells").fetchone()[0])
+            aliases = [r[1] for r in conn.execute("PRAGMA database_list").fetchall()]
+            self.assertEqual(1, aliases.count("hb"))
+
+    def test_disabled_source_is_skipped(self):
+        spell_sources.set_source_enabled("homebrew", False)
+        found = search_spells(q="lampo casalingo", include_private=True, limit=50)
+        self.assertNotIn("homebrew", {sp["origin"] for sp in found})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import app as app_module
+
+from engine import db, spellbook
+from engine.characters import delete_character, save_character
+from engine.db import connect
+from engine.spellbook import (
+    ADDED,
+    ALREADY_KNOWN,
+    BLOCKED,
+    NOT_FOUND,
+    add_known_spell,
+    apply_changes,
+    list_character_spells,
+)
+from engine.spells_repo import search_spells
+
+
+def _use_temp_db_copy(test: unittest.TestCase) -> None:
+    """Personaggi e libri finiscono in una copia del DB, non nel file versionato."""
+    tmp = tempfile.TemporaryDirectory()
+    path = Path(tmp.name) / "spellbook.sqlite3"
+    src = sqlite3.connect(db.SQLITE_PATH)
+    dst = sqlite3.connect(path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    path_patch = patch("engine.db.SQLITE_PATH", path)
+    path_patch.start()
+    test.addCleanup(tmp.cleanup)
+    test.addCleanup(path_patch.stop)
+
+
+class AddKnownSpellTests(unittest.TestCase):
+    def setUp(self):
+        _use_temp_db_copy(self)
+        self.character_id = save_character("__test_spellbook__", {"classe": "Mago", "level": 1})
+        self.spell = search_spells(q="", class_code="wizard", level=1, limit=1)[0]
+
+    def tearDown(self):
+        with connect() as conn:
+            conn.execute("DELETE FROM character_spells WHERE character_id = ?", (self.character_id,))
+            conn.commit()
+        delete_character(self.character_id)
+
+    def test_added_then_already_known(self):
+        result = add_known_spell(self.character_id, self.spell["id"])
+        self.assertEqual(ADDED, result.status)
+        self.assertEqual(self.spell["name"], result.spell["name"])
+        self.assertEqual([self.spell["id"]], [sp["id"] for sp in list_character_spells(self.character_id)])
+        again = add_known_spell(self.character_id, self.spell["id"])
+        self.assertEqual(ALREADY_KNOWN, again.status)
+        self.assertEqual("Incantesimo gia' presente nel personaggio.", again.message)
+
+    def test_blocked_with_reasons_and_nothing_written(self):
+        seen = []
+
+        def check(owned, spell):
+            seen.append((owned, spell["id"]))
+            return False, "wizard: limite raggiunto; cleric: livello incantesimo massimo 0"
+
+        result = add_known_spell(self.character_id, self.spell["id"], check=check)
+        self.assertEqual(BLOCKED, result.status)
+        self.assertEqual(("wizard: limite raggiunto", "cleric: livello incantesimo massimo 0"), result.reasons)
+        self.assertEqual([([], self.spell["id"])], seen)
+        self.assertEqual([], list_character_spells(self.character_id))
+        self.assertEqual(NOT_FOUND, add_known_spell(self.character_id, 999999).status)
+
+    def test_one_connection_and_rollback_on_error(self):
+        with patch.object(spellbook, "connect", wraps=spellbook.connect) as opened:
+            add_known_spell(self.character_id, self.spell["id"], check=lambda owned, spell: (True, ""))
+        self.assertEqual(1, opened.call_count)
+
+        with connect() as conn:
+            conn.execute("DELETE FROM character_spells WHERE character_id = ?", (self.character_id,))
+            conn.commit()
+        with patch.object(spellbook, "_insert_known", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                add_known_spell(self.character_id, self.spell["id"])
+        self.assertEqual([], list_character_spells(self.character_id))
+
+
+class ApplyChangesTests(unittest.TestCase):
+    def setUp(self):
+        _use_temp_db_copy(self)
+        self.character_id = save_character("__test_spellbook_bulk__", {"classe": "Mago", "level": 1})
+        self.ids = [sp["id"] for sp in search_spells(q="", class_code="wizard", level=1, limit=4)]
+
+    def tearDown(self):
+        with connect() as conn:
+            conn.execute("DELETE FROM character_spells WHERE character_id = ?", (self.character_id,))
+            conn.commit()
+        delete_character(self.character_id)
+
+    def test_in_batch_additions_count_against_limits(self):
+        def at_most_two(owned, spell):
+            return (len(owned) < 2, "wizard: limite incantesimi conosciuti raggiunto (2)")
+
+        changes = apply_changes(self.character_id, add=self.ids[:3] + [self.ids[0], "x"], check=at_most_two)
+        self.assertEqual(tuple(self.ids[:2]), changes.added)
+        self.assertEqual([BLOCKED], [r.status for r in changes.rejected])
+        self.assertEqual(sorted(self.ids[:2]), sorted(sp["id"] for sp in list_character_spells(self.character_id)))
+
+        # Le rimozioni liberano posti prima delle aggiunte dello stesso lotto.
+        changes = apply_changes(self.character_id, add=[self.ids[2]], remove=[self.ids[0], 999999], check=at_most_two)
+        self.assertEqual((self.ids[0],), changes.removed)
+        self.assertEqual((self.ids[2],), changes.added)
+        self.assertEqual(sorted(self.ids[1:3]), sorted(sp["id"] for sp in list_character_spells(self.character_id)))
+
+    def test_bulk_endpoint(self):
+        flask_app = app_module.create_app()
+        flask_app.config["TESTING"] = True
+        with flask_app.test_client() as client, patch("app._ensure_current_character_id", return_value=self.character_id), patch(
+            "app.get_pg", return_value={}
+        ):
+            response = client.post("/spells/bulk", data={"spell_ids": [str(i) for i in self.ids[:3]], "page": "1"})
+            self.assertEqual(302, response.status_code)
+            self.assertEqual(3, len(list_character_spells(self.character_id)))
+            client.post("/spells/bulk", data={"remove_ids": [str(i) for i in self.ids[:2]]})
+        self.assertEqual([self.ids[2]], [sp["id"] for sp in list_character_spells(self.character_id)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,7 +4,8 @@ from unittest.mock import patch
 
 import app as app_module
 from engine.db import connect, ensure_schema
-from engine.spells_repo import search_spells
+from engine import spell_index, spells_repo
+from engine.spells_repo import eligible_spells, search_spells
 
 
 class SpellsPgLimitsTests(unittest.TestCase):
@@ -22,6 +23,24 @@ class SpellsPgLimitsTests(unittest.TestCase):
         self.assertEqual({"wizard"}, allowed)
         self.assertEqual(3, max_spell_level)
 
+    def test_eligible_set_is_cached_and_matches_search(self):
+        spells_repo._ELIGIBLE_CACHE.clear()
+        eligible = eligible_spells(["ranger", "druid"], 2)
+        expected = [sp["spell_key"] for sp in search_spells(q="", class_codes=["druid", "ranger"], max_level=2, limit=1000)]
+        self.assertEqual(expected, list(eligible.keys))
+        self.assertIn(expected[0], eligible)
+        with patch.object(spells_repo, "_catalog_spell_index", side_effect=AssertionError("rebuild")):
+            self.assertIs(eligible, eligible_spells(["druid", "ranger", "druid"], 2))
+
+        enabled = spell_index.SPELL_INDEX_ENABLED
+        spell_index.SPELL_INDEX_ENABLED = False
+        try:
+            from_sql = eligible_spells(["ranger", "druid"], 2)
+        finally:
+            spell_index.SPELL_INDEX_ENABLED = enabled
+        self.assertIsNone(from_sql.bits)
+        self.assertEqual(eligible.keys, from_sql.keys)
+
     def test_toggle_off_keeps_existing_search_behavior(self):
         flask_app = app_module.create_app()
         flask_app.config["TESTING"] = True
@@ -105,10 +124,10 @@ class SpellsPgLimitsTests(unittest.TestCase):
 
         with flask_app.test_client() as client, patch("app.get_pg", return_value=pg), patch(
             "app._ensure_current_character_id", return_value=1
-        ), patch("app.list_character_spells", return_value=owned), patch(
-            "app.get_by_id", return_value=spell
+        ), patch("engine.spellbook._owned_spells", return_value=owned), patch(
+            "engine.spellbook._spells_for_add", return_value={999: spell}
         ), patch(
-            "app.add_spell_to_character"
+            "engine.spellbook._insert_known"
         ) as add_mock:
             response = client.post(
                 "/spells/add",
@@ -147,10 +166,10 @@ class SpellsPgLimitsTests(unittest.TestCase):
 
         with flask_app.test_client() as client, patch("app.get_pg", return_value=pg), patch(
             "app._ensure_current_character_id", return_value=1
-        ), patch("app.list_character_spells", return_value=owned), patch(
-            "app.get_by_id", return_value=spell
+        ), patch("engine.spellbook._owned_spells", return_value=owned), patch(
+            "engine.spellbook._spells_for_add", return_value={999: spell}
         ), patch(
-            "app.add_spell_to_character"
+            "engine.spellbook._insert_known"
         ) as add_mock:
             response = client.post(
                 "/spells/add",
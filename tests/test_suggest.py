@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import patch
+
+import app as app_module
+from engine.prefix_index import PrefixIndex
+from engine.spells_repo import suggest_spells
+
+
+class PrefixIndexTests(unittest.TestCase):
+    def test_name_prefix_before_word_prefix(self):
+        index = PrefixIndex.build([(1, "Palla di Fuoco"), (2, "Fuoco Fatuo"), (3, "Fulmine"), (4, "Scudo")])
+        self.assertEqual([3, 2, 1], [item for item, _ in index.complete("fu")])
+        self.assertEqual([2, 1], [item for item, _ in index.complete("FUÒCO")])
+        self.assertEqual([3], [item for item, _ in index.complete("fu", limit=1)])
+        self.assertEqual([], index.complete("  "))
+
+    def test_spell_suggestions(self):
+        names = [sp["name"] for sp in suggest_spells("pal")]
+        self.assertLessEqual(len(names), 10)
+        self.assertTrue(names)
+        self.assertTrue(all("srd:" in sp["spell_key"] for sp in suggest_spells("pal")))
+
+
+class SuggestEndpointTests(unittest.TestCase):
+    def setUp(self):
+        flask_app = app_module.create_app()
+        flask_app.config["TESTING"] = True
+        self.client = flask_app.test_client()
+
+    def test_json_cacheable_and_conditional(self):
+        resp = self.client.get("/api/suggest?kind=spell&q=Invisib")
+        self.assertEqual(200, resp.status_code)
+        data = resp.get_json()
+        self.assertIn("Invisibilità", [item["name"] for item in data["items"]])
+        self.assertIn("public", resp.headers["Cache-Control"])
+        etag = resp.headers["ETag"]
+        again = self.client.get("/api/suggest?kind=spell&q=invisib", headers={"If-None-Match": etag})
+        self.assertEqual(304, again.status_code)
+        self.assertEqual(b"", again.get_data())
+
+    def test_monsters_and_bad_kind(self):
+        data = self.client.get("/api/suggest?kind=monster&q=drago").get_json()
+        self.assertTrue(data["items"])
+        self.assertTrue(all(item["url"].startswith("/bestiary/") for item in data["items"]))
+        self.assertEqual(400, self.client.get("/api/suggest?kind=item&q=x").status_code)
+
+    def test_cached_monster_index_opens_no_connection(self):
+        first = app_module._suggest_monsters("drago")
+        with patch("app.connect", side_effect=AssertionError("I/O")):
+            self.assertEqual(first, app_module._suggest_monsters("drago"))
+
+    def test_pages_wire_the_typeahead(self):
+        self.assertIn('data-suggest="spell"', self.client.get("/spells").get_data(as_text=True))
+        self.assertIn('data-suggest="monster"', self.client.get("/bestiary").get_data(as_text=True))
+
+
+if __name__ == "__main__":
+    unittest.main()